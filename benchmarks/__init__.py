@@ -0,0 +1,12 @@
+"""
+Performance benchmarks for ProxyPrinter. Run them from the repository root,
+for example:
+
+    python -m benchmarks.text_subs
+    python -m benchmarks.run
+
+benchmarks.run times each phase of a build on a deck from benchmarks.deckgen
+and compares it to benchmarks/baseline.json. Timings depend on the machine,
+so make a baseline on your own with --save_baseline before changing the code,
+then run again afterwards to see what got slower.
+"""
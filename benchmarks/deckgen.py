@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Generate a synthetic card workbook for benchmarking, and write it as an
+.ods file, a folder of .csv or .tsv files, or a .jsonl file.
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+import zipfile
+from collections import OrderedDict
+from xml.sax.saxutils import escape, quoteattr
+
+from proxyprinter.proxyprinter import (SETTING_SHEET_LABEL,
+        SETTING_LABEL_COPYRIGHT, SETTING_LABEL_RICHFIELDS,
+        SETTING_LABEL_PROCESSPATTERNS, SETTING_LABEL_PROCESSREPLACEMENTS)
+from proxyprinter.readers import JSONL_SHEET_KEY
+
+from .text_subs import KEYWORDS, SYMBOLS
+
+FORMATS = ["ods", "csv", "tsv", "jsonl"]
+WORDS = ["the", "a", "card", "target", "player", "each", "until", "end", "of",
+         "turn", "deal", "damage", "gain", "lose", "when", "enters", "your",
+         "opponent", "may", "draw", "return", "hand", "deck", "top"]
+
+ODS_MIMETYPE = "application/vnd.oasis.opendocument.spreadsheet"
+ODS_MANIFEST = """<?xml version="1.0" encoding="UTF-8"?>
+<manifest:manifest xmlns:manifest="urn:oasis:names:tc:opendocument:xmlns:manifest:1.0" manifest:version="1.2">
+ <manifest:file-entry manifest:full-path="/" manifest:media-type="%s"/>
+ <manifest:file-entry manifest:full-path="content.xml" manifest:media-type="text/xml"/>
+</manifest:manifest>
+""" % ODS_MIMETYPE
+ODS_CONTENT_START = """<?xml version="1.0" encoding="UTF-8"?>
+<office:document-content xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" xmlns:table="urn:oasis:names:tc:opendocument:xmlns:table:1.0" xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0" office:version="1.2"><office:body><office:spreadsheet>
+"""
+ODS_CONTENT_END = "</office:spreadsheet></office:body></office:document-content>\n"
+
+
+def parse_copies(spec):
+    """Parse "1:70,2:20,3:10" into ([1, 2, 3], [70, 20, 10])"""
+    counts, weights = [], []
+    for part in spec.split(","):
+        count, weight = part.split(":")
+        counts.append(int(count))
+        weights.append(float(weight))
+    return counts, weights
+
+def make_patterns(n):
+    """n (pattern, replacement) pairs in the spreadsheet's own syntax"""
+    patterns = [(r"&lt;([0-9]+) %s&gt;" % c, "<span class='mana %s'>\\1</span>" % c.lower())
+                for c in SYMBOLS]
+    patterns += [(r"\b%s\b" % kw, "<span class='keyword'>%s</span>" % kw)
+                 for kw in KEYWORDS]
+    while len(patterns) < n:
+        i = len(patterns)
+        patterns.append((r"\bWord%d\b" % i, "<i>Word%d</i>" % i))
+    return patterns[:n]
+
+def make_text(rng, length):
+    """About length characters of rules text, with keywords and symbols"""
+    words = []
+    total = 0
+    while total < length:
+        roll = rng.random()
+        if roll < 0.1:
+            word = rng.choice(KEYWORDS)
+        elif roll < 0.15:
+            word = "<%d %s>" % (rng.randint(1, 9), rng.choice(SYMBOLS))
+        else:
+            word = rng.choice(WORDS)
+        words.append(word)
+        total += len(word)+1
+    return " ".join(words)
+
+def generate(sheets=3, rows=500, columns=4, text_length=120, traits=40,
+             traits_per_card=3, copies="1:70,2:20,3:10", patterns=30, seed=0):
+    """
+    Return an OrderedDict of sheet names to rows, like read_workbook(),
+    with a settings sheet of patterns ProcessPatterns first.
+    """
+    rng = random.Random(seed)
+    copy_counts, copy_weights = parse_copies(copies)
+    trait_names = ["Trait%d" % i for i in range(traits)]
+
+    workbook = OrderedDict()
+    settings = [[SETTING_LABEL_COPYRIGHT, SETTING_LABEL_RICHFIELDS,
+                 SETTING_LABEL_PROCESSPATTERNS, SETTING_LABEL_PROCESSREPLACEMENTS]]
+    rich_fields = ["Text", "Flavor Text"]
+    for i, (pattern, replacement) in enumerate(make_patterns(patterns)):
+        settings.append(["Benchmark" if i == 0 else "",
+                         rich_fields[i] if i < len(rich_fields) else "",
+                         pattern, replacement])
+    if len(settings) == 1:
+        settings.append(["Benchmark", "Text", "", ""])
+    workbook[SETTING_SHEET_LABEL] = settings
+
+    extra_fields = ["Stat%d" % i for i in range(columns)]
+    for s in range(sheets):
+        sheet = [["Name", "Copies", "Traits", "Text", "Flavor Text"] + extra_fields]
+        for r in range(rows):
+            card_traits = rng.sample(trait_names, min(traits_per_card, len(trait_names)))
+            row = ["Card %d-%d" % (s+1, r+1),
+                   float(rng.choices(copy_counts, copy_weights)[0]),
+                   ", ".join(card_traits),
+                   make_text(rng, text_length),
+                   make_text(rng, text_length//3) if rng.random() < 0.3 else ""]
+            row += [float(rng.randint(0, 12)) for f in extra_fields]
+            sheet.append(row)
+        workbook["Type%d" % (s+1)] = sheet
+    return workbook
+
+
+def ods_cell(value):
+    if value == "":
+        return "<table:table-cell/>"
+    if isinstance(value, (int, float)):
+        return ('<table:table-cell office:value-type="float" office:value="%s">'
+                '<text:p>%s</text:p></table:table-cell>' % (value, value))
+    return ('<table:table-cell office:value-type="string"><text:p>%s</text:p>'
+            '</table:table-cell>' % escape(str(value)))
+
+def write_ods(workbook, path):
+    with zipfile.ZipFile(path, "w") as z:
+        # The mimetype has to come first, uncompressed
+        z.writestr("mimetype", ODS_MIMETYPE, compress_type=zipfile.ZIP_STORED)
+        z.writestr("META-INF/manifest.xml", ODS_MANIFEST,
+                   compress_type=zipfile.ZIP_DEFLATED)
+        with z.open(zipfile.ZipInfo("content.xml"), "w") as raw:
+            raw.write(ODS_CONTENT_START.encode("utf-8"))
+            for name, rows in workbook.items():
+                raw.write(("<table:table table:name=%s>" % quoteattr(name)).encode("utf-8"))
+                for row in rows:
+                    cells = "".join(ods_cell(v) for v in row)
+                    raw.write(("<table:table-row>%s</table:table-row>\n" % cells).encode("utf-8"))
+                raw.write(b"</table:table>\n")
+            raw.write(ODS_CONTENT_END.encode("utf-8"))
+
+def plain_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def write_delimited(workbook, directory, extension, delimiter):
+    os.makedirs(directory, exist_ok=True)
+    for name, rows in workbook.items():
+        with open(os.path.join(directory, name+extension), "w", newline="",
+                  encoding="utf-8") as f:
+            writer = csv.writer(f, delimiter=delimiter)
+            for row in rows:
+                writer.writerow([plain_value(v) for v in row])
+
+def write_jsonl(workbook, path):
+    with open(path, "w", encoding="utf-8") as f:
+        for name, rows in workbook.items():
+            keys = rows[0]
+            for row in rows[1:]:
+                item = OrderedDict([(JSONL_SHEET_KEY, name)])
+                item.update((k, v) for k, v in zip(keys, row))
+                for k in keys[len(row):]:
+                    item[k] = ""
+                f.write(json.dumps(item)+"\n")
+
+def write_workbook(workbook, path, file_format):
+    """Write workbook to path, a file or (for csv/tsv) a folder"""
+    if file_format == "ods":
+        write_ods(workbook, path)
+    elif file_format == "csv":
+        write_delimited(workbook, path, ".csv", ",")
+    elif file_format == "tsv":
+        write_delimited(workbook, path, ".tsv", "\t")
+    elif file_format == "jsonl":
+        write_jsonl(workbook, path)
+    else:
+        raise ValueError("Unknown format: %s" % file_format)
+    return path
+
+def output_path(base, file_format):
+    if file_format in ("csv", "tsv"):
+        return base+"-"+file_format
+    return base+"."+file_format
+
+
+def add_deck_arguments(parser):
+    parser.add_argument("--sheets", type=int, default=3,
+                        help="Card types (sheets) in the deck")
+    parser.add_argument("--rows", type=int, default=500,
+                        help="Cards per sheet")
+    parser.add_argument("--columns", type=int, default=4,
+                        help="Extra numeric fields per card")
+    parser.add_argument("--text_length", type=int, default=120,
+                        help="Characters of rules text per card")
+    parser.add_argument("--traits", type=int, default=40,
+                        help="Distinct traits across the deck")
+    parser.add_argument("--traits_per_card", type=int, default=3)
+    parser.add_argument("--copies", type=str, default="1:70,2:20,3:10",
+                        help="Copies distribution as count:weight pairs")
+    parser.add_argument("--patterns", type=int, default=30,
+                        help="ProcessPatterns in the settings sheet")
+    parser.add_argument("--seed", type=int, default=0)
+
+def deck_options(args):
+    return OrderedDict([
+        ("sheets", args.sheets),
+        ("rows", args.rows),
+        ("columns", args.columns),
+        ("text_length", args.text_length),
+        ("traits", args.traits),
+        ("traits_per_card", args.traits_per_card),
+        ("copies", args.copies),
+        ("patterns", args.patterns),
+        ("seed", args.seed),
+    ])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("output", type=str,
+                        help="Path to write, without an extension")
+    parser.add_argument("--format", choices=FORMATS, action="append",
+                        help="Format to write (repeat for several; default ods)")
+    add_deck_arguments(parser)
+    args = parser.parse_args()
+
+    workbook = generate(**deck_options(args))
+    for file_format in args.format or ["ods"]:
+        print(write_workbook(workbook, output_path(args.output, file_format), file_format))
+
+if __name__ == "__main__":
+    main()
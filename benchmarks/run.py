@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Time each phase of a ProxyPrinter build on a synthetic deck and compare the
+results to a stored baseline.
+
+Timings only mean something on the machine that made them, so the baseline
+isn't kept in the repository: run once with --save_baseline to make a local
+one. Without a baseline the results are printed and nothing is compared.
+
+The phases are the ones ProxyPrinter.__init__() runs (read_sheet,
+parse_settings, parse_sheet_cards) followed by render_all(),
+trait_colors_css() and tts(). .ods files are read lazily, in one pass, so
+their parsing time shows up under parse_settings (the sheets up to the
+settings sheet) and parse_sheet_cards (the rest) rather than read_sheet.
+
+Each phase's time is the best of --repeat builds. Peak memory is measured
+in a separate build with tracemalloc, since tracing slows everything down.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from proxyprinter.proxyprinter import ProxyPrinter
+
+from .deckgen import (FORMATS, generate, write_workbook, output_path,
+                      add_deck_arguments, deck_options)
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baseline.json")
+PHASES = ["read_sheet", "parse_settings", "parse_sheet_cards", "render_all",
+          "trait_colors_css", "tts"]
+#Slowdown over the baseline, as a ratio, to call a regression
+DEFAULT_TOLERANCE = 1.25
+#Phases faster than this many seconds in the baseline are too noisy to compare
+MIN_COMPARE_SECONDS = 0.005
+
+
+class PhaseRecorder:
+    """Records seconds (and optionally peak traced bytes) per phase"""
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.seconds = OrderedDict()
+        self.peak_bytes = OrderedDict()
+
+    @contextmanager
+    def phase(self, name):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            start_bytes = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = time.perf_counter() - start
+            if self.trace_memory:
+                self.peak_bytes[name] = tracemalloc.get_traced_memory()[1] - start_bytes
+
+
+class TimedProxyPrinter(ProxyPrinter):
+    """ProxyPrinter that reports the phases __init__() runs to a recorder"""
+    def __init__(self, spreadsheet, recorder, **kwargs):
+        self.recorder = recorder
+        super().__init__(spreadsheet, **kwargs)
+
+    def read_sheet(self, ods_file):
+        with self.recorder.phase("read_sheet"):
+            return super().read_sheet(ods_file)
+
+    def read_settings(self):
+        with self.recorder.phase("parse_settings"):
+            return super().read_settings()
+
+    def parse_sheet_cards(self, pages=None):
+        with self.recorder.phase("parse_sheet_cards"):
+            return super().parse_sheet_cards(pages)
+
+
+def build(path, recorder, jobs=1):
+    pp = TimedProxyPrinter(path, recorder, jobs=jobs)
+    with recorder.phase("render_all"):
+        pp.render_all()
+    with recorder.phase("trait_colors_css"):
+        pp.trait_colors_css()
+    with recorder.phase("tts"):
+        pp.tts()
+    return pp
+
+def measure(path, repeat=3, jobs=1):
+    """Best time and peak memory for each phase of building path"""
+    best = OrderedDict()
+    for i in range(repeat):
+        recorder = PhaseRecorder()
+        pp = build(path, recorder, jobs)
+        for name, seconds in recorder.seconds.items():
+            best[name] = min(seconds, best.get(name, seconds))
+
+    recorder = PhaseRecorder(trace_memory=True)
+    tracemalloc.start()
+    try:
+        build(path, recorder, jobs)
+    finally:
+        tracemalloc.stop()
+
+    return OrderedDict([
+        ("cards", len(pp.cards)),
+        ("phases", OrderedDict((name, OrderedDict([
+            ("seconds", round(best[name], 6)),
+            ("peak_bytes", recorder.peak_bytes[name]),
+        ])) for name in PHASES)),
+    ])
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Print each phase's time against the baseline. Returns a list of
+    (format, phase, ratio) for phases slower than tolerance allows.
+    """
+    regressions = []
+    if baseline.get("deck") != results["deck"]:
+        print("Baseline was made with a different deck; not comparing")
+        return regressions
+    for file_format, result in results["formats"].items():
+        base = baseline["formats"].get(file_format)
+        if not base:
+            continue
+        print("\n%s vs. baseline:" % file_format)
+        for name, phase in result["phases"].items():
+            base_phase = base["phases"].get(name)
+            if not base_phase:
+                continue
+            base_seconds = base_phase["seconds"]
+            ratio = phase["seconds"]/base_seconds if base_seconds else 1
+            mem_ratio = (phase["peak_bytes"]/base_phase["peak_bytes"]
+                         if base_phase["peak_bytes"] else 1)
+            flag = ""
+            if base_seconds >= MIN_COMPARE_SECONDS and ratio > tolerance:
+                flag = "  REGRESSION"
+                regressions.append((file_format, name, ratio))
+            print("  %-18s %8.3fs  %5.2fx time  %5.2fx memory%s" %
+                  (name, phase["seconds"], ratio, mem_ratio, flag))
+    return regressions
+
+def print_results(results):
+    for file_format, result in results["formats"].items():
+        print("\n%s (%d cards):" % (file_format, result["cards"]))
+        for name, phase in result["phases"].items():
+            print("  %-18s %8.3fs  %8.1f MB peak" %
+                  (name, phase["seconds"], phase["peak_bytes"]/(1024*1024)))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--format", choices=FORMATS, action="append",
+                        help="Input format to benchmark (repeat for several; "+
+                             "default all)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Builds to time; each phase's best time is kept")
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--baseline", type=str, default=BASELINE_FILE,
+                        help="Results file to compare against, saved on "+
+                             "this machine")
+    parser.add_argument("--save_baseline", action="store_true",
+                        help="Write these results to --baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Slowdown ratio that counts as a regression")
+    parser.add_argument("--json", type=str, metavar="FILE",
+                        help="Also write the results to this file")
+    add_deck_arguments(parser)
+    args = parser.parse_args()
+
+    options = deck_options(args)
+    workbook = generate(**options)
+    results = OrderedDict([
+        ("deck", options),
+        ("python", platform.python_version()),
+        ("formats", OrderedDict()),
+    ])
+    tmpdir = tempfile.mkdtemp(prefix="proxyprinter-bench-")
+    try:
+        for file_format in args.format or FORMATS:
+            path = write_workbook(workbook, output_path(os.path.join(tmpdir, "deck"),
+                                  file_format), file_format)
+            results["formats"][file_format] = measure(path, args.repeat, args.jobs)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    print_results(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print("\nSaved baseline to %s" % args.baseline)
+        return
+
+    try:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        print("\nNo baseline at %s; use --save_baseline to make one" % args.baseline)
+        return
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("\n%d phases slower than %.2fx the baseline" % (len(regressions), args.tolerance))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Compare the compiled TextSubstituter against applying each ProcessPattern
+with its own re.sub() call, the way Card.process() used to.
+"""
+
+import argparse
+import random
+import re
+from collections import OrderedDict
+from timeit import timeit
+
+from proxyprinter.proxyprinter import TextSubstituter, escape_html
+
+KEYWORDS = ["Attack", "Defend", "Flying", "Haste", "Draw", "Discard", "Sacrifice",
+            "Exhaust", "Ready", "Shield", "Poison", "Stealth", "Ambush", "Rally",
+            "Summon", "Banish", "Reveal", "Search", "Shuffle", "Scry", "Fortify",
+            "Pierce", "Burn", "Freeze", "Heal", "Ward", "Taunt", "Charge",
+            "Overload", "Echo", "Cycle", "Flash", "Reach", "Trample", "Vigil",
+            "Bounty", "Loot", "Tithe", "Quest", "Siege", "Flank", "Volley",
+            "Hex", "Curse", "Bless", "Rune"]
+SYMBOLS = "WUBRGCXYZSTE"
+
+def make_subs(n):
+    subs = OrderedDict()
+    for c in SYMBOLS:
+        subs[re.compile(r"&lt;([0-9]+) %s&gt;" % c)] = "<span class='mana %s'>\\1</span>" % c.lower()
+    for kw in KEYWORDS:
+        subs[re.compile(r"\b%s\b" % kw)] = "<span class='keyword'>%s</span>" % kw
+    subs[re.compile(r"\{T\}")] = "<span class='icon tap'></span>"
+    return OrderedDict(list(subs.items())[:n])
+
+def make_texts(n, seed=0):
+    rng = random.Random(seed)
+    words = KEYWORDS + ["the", "a", "card", "target", "player", "each", "until",
+                        "end", "of", "turn", "{T}:"]
+    words += ["<%d %s>" % (rng.randint(1, 9), c) for c in SYMBOLS]
+    return [escape_html(" ".join(rng.choice(words) for _ in range(rng.randint(3, 40))))
+            for _ in range(n)]
+
+def sequential(text_subs, text):
+    for pattern, replacement in text_subs.items():
+        text = re.sub(pattern, replacement, text)
+    return text
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--patterns", type=int, default=60)
+    parser.add_argument("--texts", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    text_subs = make_subs(args.patterns)
+    texts = make_texts(args.texts)
+    substituter = TextSubstituter(text_subs)
+    for text in texts:
+        assert substituter.sub(text) == sequential(text_subs, text)
+
+    t_seq = min(timeit(lambda: [sequential(text_subs, t) for t in texts], number=1)
+                for _ in range(args.repeat))
+    t_sub = min(timeit(lambda: [substituter.sub(t) for t in texts], number=1)
+                for _ in range(args.repeat))
+    print("%d patterns in %d passes, %d texts" % (len(text_subs),
+                                                  len(substituter.passes), len(texts)))
+    print("re.sub loop:      %.3fs" % t_seq)
+    print("TextSubstituter:  %.3fs" % t_sub)
+    print("speedup:          %.1fx" % (t_seq/t_sub))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Sidecar files for the output page: stylesheets, scripts and data written
+next to the HTML under names that include a hash of their contents, so
+browsers can cache them for as long as they like and a rebuild that
+changes one only changes its link.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+
+#Hex digits of the content hash to put in each file name
+ASSET_HASH_LENGTH = 12
+
+logger = logging.getLogger(__name__)
+
+
+def asset_filename(name, extension, content):
+    digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    return "%s.%s.%s" % (name, digest[:ASSET_HASH_LENGTH], extension)
+
+def write_asset(directory, name, extension, content):
+    """
+    Write content to directory/name.HASH.extension unless it's already
+    there, and return the file name.
+    """
+    fname = asset_filename(name, extension, content)
+    path = os.path.join(directory, fname)
+    if os.path.exists(path):
+        return fname
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    logger.info("Wrote %s" % path)
+    return fname
+
+def asset_url(assets_dir, page_dir):
+    """Link prefix for files in assets_dir from a page in page_dir"""
+    rel = os.path.relpath(os.path.abspath(assets_dir),
+                          os.path.abspath(page_dir))
+    if rel == os.curdir:
+        return ""
+    return rel.replace(os.sep, "/") + "/"
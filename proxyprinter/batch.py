@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+`proxyprinter build`: build many spreadsheets in one run. The decks come
+from the command line or a TOML manifest like this, where any option
+from the command line can be set for all decks or one deck:
+
+    [defaults]
+    out_dir = "build"
+    copyright = "Me"
+
+    [[deck]]
+    spreadsheet = "core.ods"
+
+    [[deck]]
+    spreadsheet = "expansion.ods"
+    output = "build/expansion-v2.html"
+    version = "2"
+
+Paths in a manifest are relative to the manifest's folder.
+"""
+
+import os
+
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
+
+#Manifest options that are paths, to resolve relative to the manifest
+MANIFEST_PATH_KEYS = ("spreadsheet", "output", "out_dir", "layout",
+                      "cache_dir")
+
+
+def read_manifest(path):
+    """
+    Read a manifest into a dict of default options and a list of dicts of
+    options for each deck. Raises ValueError if the manifest is invalid.
+    """
+    if tomllib is None:
+        raise ValueError("Reading a manifest needs Python 3.11 or later")
+    with open(path, "rb") as f:
+        try:
+            manifest = tomllib.load(f)
+        except tomllib.TOMLDecodeError as e:
+            raise ValueError("%s: %s" % (path, e))
+    folder = os.path.dirname(os.path.abspath(path))
+
+    defaults = manifest.get("defaults", {})
+    decks = manifest.get("deck", [])
+    if type(defaults) != dict or type(decks) != list:
+        raise ValueError("%s: expected a [defaults] table and [[deck]] tables"
+                         % path)
+    for deck in decks:
+        if "spreadsheet" not in deck:
+            raise ValueError("%s: each [[deck]] needs a spreadsheet" % path)
+    return (resolve_paths(defaults, folder),
+            [resolve_paths(d, folder) for d in decks])
+
+def resolve_paths(options, folder):
+    options = dict(options)
+    for key in MANIFEST_PATH_KEYS:
+        if type(options.get(key)) == str:
+            options[key] = os.path.join(folder,
+                                        os.path.expanduser(options[key]))
+    return options
+
+def deck_output(spreadsheet, out_dir, compress=False):
+    """Default output file for a deck: its name with .html, in out_dir"""
+    name = os.path.splitext(os.path.basename(spreadsheet.rstrip(os.sep)))[0]
+    return os.path.join(out_dir, name + (".html.gz" if compress else ".html"))
+
+def format_summary(results, seconds, workers):
+    """
+    A table of each deck's results, which are dicts with spreadsheet,
+    output, cards, seconds and (if it failed) error.
+    """
+    lines = ["%-30s %7s %9s  %s" % ("Deck", "Cards", "Seconds", "Output")]
+    built = 0
+    cards = 0
+    for r in results:
+        name = os.path.basename(r["spreadsheet"].rstrip(os.sep))
+        if r.get("error"):
+            lines.append("%-30s %7s %9s  FAILED: %s" %
+                         (name, "-", "-", r["error"]))
+            continue
+        built += 1
+        cards += r["cards"]
+        lines.append("%-30s %7d %9.3f  %s" %
+                     (name, r["cards"], r["seconds"], r["output"]))
+    lines.append("Built %d of %d decks (%d cards) in %.2fs with %d process%s" %
+                 (built, len(results), cards, seconds, workers,
+                  "" if workers == 1 else "es"))
+    return "\n".join(lines)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+On-disk cache of rendered card HTML, so repeated builds of a spreadsheet
+only have to render the rows that changed.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+#Bump this whenever card markup changes so old fragments aren't reused
+FRAGMENT_CACHE_VERSION = 2
+
+DEFAULT_CACHE_MAX_BYTES = 512*1024*1024
+
+logger = logging.getLogger(__name__)
+
+
+def settings_fingerprint(text_subs, rich_fields, size_thresholds, copyowner,
+                         layouts={}):
+    """
+    Hash the run-wide settings that affect how a card is rendered.
+    """
+    subs = [[getattr(pattern, "pattern", pattern), repl]
+            for pattern, repl in text_subs.items()]
+    thresholds = sorted([str(k), list(v)] for k, v in size_thresholds.items())
+    s = json.dumps([FRAGMENT_CACHE_VERSION, subs, list(rich_fields),
+                    thresholds, copyowner, sorted(layouts.items())],
+                   default=str)
+    return hashlib.sha256(s.encode("utf-8")).hexdigest()
+
+
+class FragmentCache:
+    """
+    A directory of rendered card fragments, one file per card, named by a
+    hash of the card's row contents and the settings fingerprint. File
+    modification times track use, so eviction removes the least recently
+    used fragments first once the directory is over max_bytes.
+    """
+    def __init__(self, directory, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def card_key(card, fingerprint):
+        row = [(str(k), type(v).__name__, str(v))
+               for k, v in card.fields.items()]
+        s = repr((fingerprint, card.cardtype, card.schema.year, row,
+                  card.number, card.type_number))
+        return hashlib.sha256(s.encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key+".html")
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                html = f.read()
+        except OSError:
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return html
+
+    def put(self, key, html):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(html)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning("Couldn't write cache file %s: %s" % (path, e))
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def evict(self):
+        """
+        Delete the least recently used fragments until the cache fits in
+        max_bytes. Returns the number of files removed.
+        """
+        entries = []
+        total = 0
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            for fname in filenames:
+                path = os.path.join(dirpath, fname)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        removed = 0
+        if total <= self.max_bytes:
+            return removed
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        logger.info("Evicted %d cached fragments from %s" %
+                    (removed, self.directory))
+        return removed
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -2,12 +2,85 @@
 import os
 import re
 import sys
+import threading
+import traceback
 import webbrowser
 from collections import OrderedDict
+from html import escape
 
 from PySide6 import QtCore, QtWidgets, QtGui
+try:
+    # Shows the preview the way a browser would, if it's installed
+    from PySide6.QtWebEngineWidgets import QWebEngineView
+except ImportError:
+    QWebEngineView = None
 
-from .proxyprinter import ProxyPrinter, SheetSettings
+from .proxyprinter import ProxyPrinter, SheetSettings, ZIP_SCALE, DEFAULT_JPEG_QUALITY
+
+#How long settings have to stay unchanged before the preview is redrawn
+PREVIEW_DELAY_MS = 250
+#How long closing the window waits for a cancelled task to stop
+CLOSE_WAIT_MS = 3000
+
+PROGRESS_LABELS = {
+    "load": "Reading settings",
+    "sheets": "Parsing sheet %v",
+    "cards": "Rendering card %v of %m",
+}
+
+
+class BuildCancelled(Exception):
+    pass
+
+
+class TaskSignals(QtCore.QObject):
+    progress = QtCore.Signal(str, int, int)
+    finished = QtCore.Signal(object)
+    failed = QtCore.Signal(str)
+    cancelled = QtCore.Signal()
+
+
+class Task(QtCore.QRunnable):
+    """
+    Runs fn(report, *args) on a QThreadPool thread. fn calls report(stage,
+    done, total) as it goes, which passes the progress on to the UI
+    thread, or raises BuildCancelled once cancel() has been called.
+    """
+    def __init__(self, fn, *args):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.signals = TaskSignals()
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def report(self, stage, done, total):
+        if self.cancel_event.is_set():
+            raise BuildCancelled()
+        self.signals.progress.emit(stage, done, total)
+
+    def run(self):
+        try:
+            result = self.fn(self.report, *self.args)
+        except BuildCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            traceback.print_exc()
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(result)
+
+def load_settings(report, fname):
+    report("load", 0, 0)
+    return SheetSettings(fname, progress=report)
+
+def build_proxies(report, sheet_settings, out_file):
+    """Build the proxies, only replacing out_file if the build completes"""
+    pp = ProxyPrinter(*sheet_settings, progress=report)
+    pp.render_file(out_file)
+    return out_file
 
 
 class ProxySetupGui(QtWidgets.QWidget):
@@ -19,11 +92,11 @@ class ProxySetupGui(QtWidgets.QWidget):
         self.in_file = QtWidgets.QLineEdit("", self)
         self.in_file.setPlaceholderText("Select the spreadsheet with your proxies")
         self.in_file.setReadOnly(True)
-        btn1 = QtWidgets.QPushButton("Choose input file")
+        self.in_button = QtWidgets.QPushButton("Choose input file")
         fpicker1 = QtWidgets.QHBoxLayout()
         self.layout.addLayout(fpicker1)
         fpicker1.addWidget(self.in_file)
-        fpicker1.addWidget(btn1)
+        fpicker1.addWidget(self.in_button)
 
         self.out_file = QtWidgets.QLineEdit("", self)
         self.out_file.setPlaceholderText("Choose where to write your proxies")
@@ -33,12 +106,24 @@ class ProxySetupGui(QtWidgets.QWidget):
         fpicker2.addWidget(self.out_file)
         fpicker2.addWidget(btn2)
 
-        btn3 = QtWidgets.QPushButton("→ &Build!")
-        self.layout.addWidget(btn3)
+        self.build_button = QtWidgets.QPushButton("→ &Build!")
+        self.layout.addWidget(self.build_button)
+
+        # Loading and building run on another thread; this shows how far along
+        self.task = None
+        self.progress = QtWidgets.QProgressBar(self)
+        self.progress.setTextVisible(True)
+        self.cancel_button = QtWidgets.QPushButton("Cancel")
+        lo_progress = QtWidgets.QHBoxLayout()
+        lo_progress.addWidget(self.progress)
+        lo_progress.addWidget(self.cancel_button)
+        self.layout.addLayout(lo_progress)
+        self.show_idle("")
 
-        btn1.clicked.connect(self.pick_infile)
+        self.in_button.clicked.connect(self.pick_infile)
         btn2.clicked.connect(self.pick_outfile)
-        btn3.clicked.connect(self.build)
+        self.build_button.clicked.connect(self.build)
+        self.cancel_button.clicked.connect(self.cancel_task)
 
         settingsbox = QtWidgets.QGroupBox("Settings")
         lo_sb = QtWidgets.QVBoxLayout()
@@ -75,6 +160,26 @@ class ProxySetupGui(QtWidgets.QWidget):
             btn_tog.setChecked(True)
             lo_sb.addWidget(btn_tog)
             self.toggles.append(btn_tog)
+        self.compact_copies = QtWidgets.QCheckBox("Write extra Copies compactly (cloned when the page loads)", self)
+        lo_sb.addWidget(self.compact_copies)
+
+        setting_4 = QtWidgets.QHBoxLayout()
+        lbl_zipscale = QtWidgets.QLabel("Zip image scale")
+        self.zip_scale = QtWidgets.QDoubleSpinBox(self)
+        self.zip_scale.setRange(0.5, 10)
+        self.zip_scale.setSingleStep(0.5)
+        self.zip_scale.setValue(ZIP_SCALE)
+        lbl_zipscale.setBuddy(self.zip_scale)
+        lbl_zipquality = QtWidgets.QLabel("JPEG quality")
+        self.zip_quality = QtWidgets.QSpinBox(self)
+        self.zip_quality.setRange(1, 100)
+        self.zip_quality.setValue(DEFAULT_JPEG_QUALITY)
+        lbl_zipquality.setBuddy(self.zip_quality)
+        setting_4.addWidget(lbl_zipscale)
+        setting_4.addWidget(self.zip_scale)
+        setting_4.addWidget(lbl_zipquality)
+        setting_4.addWidget(self.zip_quality)
+        lo_sb.addLayout(setting_4)
         
         richfields = QtWidgets.QGroupBox("Rich Fields")
         lo_rf = QtWidgets.QVBoxLayout()
@@ -114,6 +219,40 @@ class ProxySetupGui(QtWidgets.QWidget):
         lo_rfs.addLayout(lo_rfsb)
         lo_rf.addLayout(lo_rfs)
 
+        previewbox = QtWidgets.QGroupBox("Preview")
+        lo_pv = QtWidgets.QVBoxLayout()
+        previewbox.setLayout(lo_pv)
+        self.layout.addWidget(previewbox)
+        lo_pvpick = QtWidgets.QHBoxLayout()
+        self.preview_sheet = QtWidgets.QComboBox(self)
+        self.preview_card = QtWidgets.QComboBox(self)
+        lo_pvpick.addWidget(self.preview_sheet)
+        lo_pvpick.addWidget(self.preview_card, 1)
+        lo_pv.addLayout(lo_pvpick)
+        if QWebEngineView:
+            self.preview = QWebEngineView(self)
+        else:
+            self.preview = QtWidgets.QTextBrowser(self)
+        self.preview.setMinimumHeight(320)
+        lo_pv.addWidget(self.preview)
+        self.card_rows = OrderedDict()
+
+        # Redraw the preview once the settings stop changing for a moment
+        self.preview_timer = QtCore.QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(PREVIEW_DELAY_MS)
+        self.preview_timer.timeout.connect(self.update_preview)
+        self.preview_sheet.currentIndexChanged.connect(self.pick_preview_sheet)
+        self.preview_card.currentIndexChanged.connect(self.schedule_preview)
+        self.copyright.textChanged.connect(self.schedule_preview)
+        self.css_file.textChanged.connect(self.schedule_preview)
+        for tog in self.toggles[:2]:
+            tog.toggled.connect(self.schedule_preview)
+        for model in (self.rf_list.model(), self.rfsubs.model()):
+            model.rowsInserted.connect(self.schedule_preview)
+            model.rowsRemoved.connect(self.schedule_preview)
+        self.rfsubs.itemChanged.connect(self.schedule_preview)
+
         #TODO: text sizing settings
         #TODO: save settings to sheet
 
@@ -121,7 +260,7 @@ class ProxySetupGui(QtWidgets.QWidget):
     def pick_infile(self):
         dlg = QtWidgets.QFileDialog(self,
                 directory=os.path.expanduser('~'),
-                filter="ODS Spreadsheet (*.ods)")
+                filter="Card data (*.ods *.csv *.tsv *.jsonl)")
         dlg.setFileMode(QtWidgets.QFileDialog.ExistingFile)
         if dlg.exec():
             fnames = dlg.selectedFiles()
@@ -144,13 +283,76 @@ class ProxySetupGui(QtWidgets.QWidget):
                     chosen_name = chosen_name+".html"
                 self.out_file.setText(chosen_name)
     
+    def start_task(self, task, on_finished):
+        """Run a Task on the thread pool, showing its progress"""
+        self.task = task
+        task.signals.progress.connect(self.show_progress)
+        task.signals.finished.connect(on_finished)
+        task.signals.failed.connect(self.task_failed)
+        task.signals.cancelled.connect(self.task_cancelled)
+        self.in_button.setEnabled(False)
+        self.build_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.progress.setRange(0, 0)
+        self.progress.setFormat("Starting")
+        QtCore.QThreadPool.globalInstance().start(task)
+
+    def show_idle(self, message):
+        self.task = None
+        self.in_button.setEnabled(True)
+        self.build_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+        self.progress.setRange(0, 1)
+        self.progress.setValue(0)
+        self.progress.setFormat(message)
+        # Catch up on changes made while the task was running
+        if self.sheet_settings:
+            self.schedule_preview()
+
+    @QtCore.Slot(str, int, int)
+    def show_progress(self, stage, done, total):
+        # A maximum of 0 shows a busy bar, for when the total isn't known
+        self.progress.setRange(0, total)
+        self.progress.setValue(done)
+        self.progress.setFormat(PROGRESS_LABELS.get(stage, stage))
+
+    @QtCore.Slot()
+    def cancel_task(self):
+        if self.task:
+            self.task.cancel()
+            self.cancel_button.setEnabled(False)
+            self.progress.setFormat("Cancelling")
+
+    @QtCore.Slot(str)
+    def task_failed(self, message):
+        self.show_idle("Failed")
+        QtWidgets.QMessageBox.warning(self, "Proxy Printer", message)
+
+    @QtCore.Slot()
+    def task_cancelled(self):
+        self.show_idle("Cancelled")
+
+    def closeEvent(self, event):
+        # Don't leave a build running with nowhere to report to
+        if self.task:
+            self.task.cancel()
+        # Tasks stop at their next progress report; don't hang if one is
+        # stuck in a long step, since the process is exiting anyway
+        QtCore.QThreadPool.globalInstance().waitForDone(CLOSE_WAIT_MS)
+        super().closeEvent(event)
+
     def preload_sheet(self, fname):
         """
         Read ahead to populate some UI elements with details from the sheet
         after the user picks an input file.
         """
+        self.sheet_settings = None
+        self.start_task(Task(load_settings, fname), self.sheet_loaded)
 
-        self.sheet_settings = SheetSettings(fname)
+    @QtCore.Slot(object)
+    def sheet_loaded(self, sheet_settings):
+        self.show_idle("Ready")
+        self.sheet_settings = sheet_settings
         self.copyright.setText(self.sheet_settings.copyowner or "")
         self.css_file.setText(self.sheet_settings.addcss or "")
         
@@ -165,16 +367,60 @@ class ProxySetupGui(QtWidgets.QWidget):
             self.rfsubs.setItem(i, 0, QtWidgets.QTableWidgetItem(pattern.pattern))
             self.rfsubs.setItem(i, 1, QtWidgets.QTableWidgetItem(replacement))
 
+        # Populate the preview's choice of cards
+        self.card_rows = self.sheet_settings.card_rows()
+        self.preview_sheet.clear()
+        self.preview_sheet.addItems(list(self.card_rows.keys()))
+
+    @QtCore.Slot()
+    def pick_preview_sheet(self):
+        self.preview_card.clear()
+        for index, label in self.card_rows.get(self.preview_sheet.currentText(), []):
+            self.preview_card.addItem(label, index)
+
+    @QtCore.Slot()
+    def schedule_preview(self):
+        # Restarting the timer puts the redraw off until typing pauses
+        self.preview_timer.start()
+
+    @QtCore.Slot()
+    def update_preview(self):
+        """Render just the chosen card, with the settings as they are now"""
+        if not self.sheet_settings or self.task:
+            # Don't touch the settings while a build is reading them
+            return
+        cardtype = self.preview_sheet.currentText()
+        index = self.preview_card.currentData()
+        if index is None:
+            return
+        try:
+            self.read_settings()
+            # Keeps the parsed workbook unless the file has changed
+            self.sheet_settings.read_sheet(self.sheet_settings.workbook)
+            html = self.sheet_settings.card_preview_html(cardtype, index)
+        except (re.error, KeyError, IndexError) as e:
+            html = "<p>Can't preview this card: %s</p>" % escape(str(e))
+        # Relative links, like the additional CSS file, are next to the spreadsheet
+        base = os.path.join(os.path.dirname(os.path.abspath(self.in_file.text())), "")
+        if QWebEngineView:
+            self.preview.setHtml(html, QtCore.QUrl.fromLocalFile(base))
+        else:
+            self.preview.setSearchPaths([base])
+            self.preview.setHtml(html)
+
     @QtCore.Slot()
     def build(self):
         in_file = self.in_file.text()
         out_file = self.out_file.text()
-        if not in_file.strip() or not out_file.strip():
+        if not in_file.strip() or not out_file.strip() or not self.sheet_settings:
             return
         self.read_settings()
-        pp = ProxyPrinter(*self.sheet_settings)
-        with open(out_file, "w", encoding="utf-8") as f:
-            f.write( pp.render_all() )
+        self.start_task(Task(build_proxies, self.sheet_settings, out_file),
+                        self.build_finished)
+
+    @QtCore.Slot(object)
+    def build_finished(self, out_file):
+        self.show_idle("Wrote %s" % out_file)
         webbrowser.open(f"file://{out_file}")
     
     def read_settings(self):
@@ -188,6 +434,9 @@ class ProxySetupGui(QtWidgets.QWidget):
         self.sheet_settings.defaultcss = self.toggles[0].isChecked()
         self.sheet_settings.colorize = self.toggles[1].isChecked()
         self.sheet_settings.addzipbutton = self.toggles[2].isChecked()
+        self.sheet_settings.compact_copies = self.compact_copies.isChecked()
+        self.sheet_settings.zip_scale = self.zip_scale.value()
+        self.sheet_settings.zip_quality = self.zip_quality.value()
 
         self.sheet_settings.rich_fields = [self.rf_list.item(r).text() for r in range(self.rf_list.count())]
         ts = OrderedDict()
@@ -241,7 +490,7 @@ def main():
     app = QtWidgets.QApplication([])
 
     widget = ProxySetupGui()
-    widget.resize(800, 600)
+    widget.resize(800, 900)
     widget.show()
 
     sys.exit(app.exec())
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Card layout templates. A layout is HTML with $slot or ${slot} placeholders
+for the pieces of a card (and $$ for a literal $). It's compiled once into
+a function that renders a card by filling in the slots and joining the
+pieces, so cards of different types can have different markup.
+"""
+
+from string import Template
+
+
+class LayoutError(ValueError):
+    pass
+
+
+class LayoutTemplate(Template):
+    # Braced placeholders can hold any name, like ${field:Flavor Text}
+    braceidpattern = r"[^}]+"
+
+
+def compile_layout(text, slots, field_slots={}, name="layout"):
+    """
+    Compile layout text into a function of a card that returns its HTML.
+    slots maps placeholder names to functions of the card; field_slots maps
+    prefixes to functions of the card and a field name, for placeholders
+    like ${prefix:Field Name}.
+    """
+    pieces = []
+    getters = []
+    start = 0
+    for m in LayoutTemplate.pattern.finditer(text):
+        if m.group("invalid") is not None:
+            line = text.count("\n", 0, m.start())+1
+            raise LayoutError("Invalid placeholder in %s, line %d" % (name, line))
+        literal = text[start:m.start()]
+        start = m.end()
+        if m.group("escaped") is not None:
+            pieces.append(literal + m.group("escaped"))
+            continue
+        pieces.append(literal)
+        getters.append((len(pieces), slot_getter(m.group("named") or m.group("braced"),
+                                                 slots, field_slots, name)))
+        pieces.append(None)
+    pieces.append(text[start:])
+
+    # Join up neighboring text so each card only joins what it has to
+    merged = []
+    positions = {}
+    for i, piece in enumerate(pieces):
+        if piece is None:
+            positions[i] = len(merged)
+            merged.append(None)
+        elif merged and merged[-1] is not None:
+            merged[-1] += piece
+        else:
+            merged.append(piece)
+    getters = [(positions[i], get) for i, get in getters]
+
+    def render(card):
+        parts = merged.copy()
+        for i, get in getters:
+            parts[i] = get(card)
+        return "".join(parts)
+    return render
+
+def slot_getter(slot, slots, field_slots, name):
+    if slot in slots:
+        return slots[slot]
+    prefix, sep, field = slot.partition(":")
+    if sep and prefix in field_slots:
+        get_field = field_slots[prefix]
+        return lambda card: get_field(card, field)
+    raise LayoutError("Unknown slot in %s: %s" % (name, slot))
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Build instrumentation for --profile and --metrics_json: time and memory
+blocks allocated per phase, the slowest cards and fields, and how long
+rich field substitutions take for each field.
+
+Nothing here runs unless a Metrics object is passed to ProxyPrinter; only
+then are cards built as ProfiledCards, which time their fields.
+"""
+
+import heapq
+import itertools
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+
+#How many of the slowest cards and fields to report
+DEFAULT_TOP = 10
+
+
+class TimedSubstituter:
+    """
+    Stands in for a TextSubstituter, charging the time of each sub() to the
+    field that Metrics says is being processed.
+    """
+    def __init__(self, substituter, metrics):
+        self.substituter = substituter
+        self.passes = substituter.passes
+        self.metrics = metrics
+
+    def sub(self, text):
+        start = time.perf_counter()
+        result = self.substituter.sub(text)
+        self.metrics.add_substitution(time.perf_counter() - start)
+        return result
+
+
+class Metrics:
+    def __init__(self, top=DEFAULT_TOP):
+        self.top = top
+        self.phases = OrderedDict()
+        self.slow_cards = []
+        self.slow_fields = []
+        self.fields = OrderedDict()
+        self.substitutions = OrderedDict()
+        self.current_field = None
+        self.counters = OrderedDict()
+        # Breaks ties between equally slow entries
+        self.sequence = itertools.count()
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time a phase of the build. Phases entered more than once (like
+        rendering each card) add up.
+        """
+        blocks = sys.getallocatedblocks()
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            start_bytes = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            phase = self.phases.setdefault(name, OrderedDict([
+                ("seconds", 0.0), ("calls", 0), ("allocated_blocks", 0)]))
+            phase["seconds"] += elapsed
+            phase["calls"] += 1
+            phase["allocated_blocks"] += sys.getallocatedblocks() - blocks
+            if tracing:
+                peak = tracemalloc.get_traced_memory()[1] - start_bytes
+                phase["peak_bytes"] = max(peak, phase.get("peak_bytes", 0))
+
+    def timed_iter(self, name, iterator):
+        """Yield from iterator, charging the time spent in it to a phase"""
+        iterator = iter(iterator)
+        while True:
+            with self.phase(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def keep_slowest(self, heap, elapsed, details):
+        entry = (elapsed, next(self.sequence), details)
+        if len(heap) < self.top:
+            heapq.heappush(heap, entry)
+        else:
+            heapq.heappushpop(heap, entry)
+
+    def card_html(self, card, render):
+        """Render a card with render(card), timing it"""
+        with self.phase("render_cards"):
+            start = time.perf_counter()
+            html = render(card)
+            elapsed = time.perf_counter() - start
+        self.keep_slowest(self.slow_cards, elapsed, (card.cardtype,
+                          str(card.fields.get("Name", "")), card.number))
+        return html
+
+    def time_process(self, card, process, text, field):
+        """Call process(text, field) for card, timing it"""
+        self.current_field = field
+        start = time.perf_counter()
+        try:
+            return process(text, field)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.current_field = None
+            self.add_field(card, field, len(str(text)), elapsed)
+
+    def add_field(self, card, field, length, elapsed):
+        totals = self.fields.setdefault(field, [0, 0.0, 0])
+        totals[0] += 1
+        totals[1] += elapsed
+        totals[2] += length
+        self.keep_slowest(self.slow_fields, elapsed, (card.cardtype,
+                          str(card.fields.get("Name", "")), field, length))
+
+    def add_substitution(self, elapsed):
+        totals = self.substitutions.setdefault(self.current_field, [0, 0.0])
+        totals[0] += 1
+        totals[1] += elapsed
+
+    def count(self, name, value):
+        self.counters[name] = value
+
+    def report(self):
+        """Everything measured, as a dict ready for JSON"""
+        return OrderedDict([
+            ("phases", OrderedDict((name, OrderedDict(
+                (k, round(v, 6) if type(v) == float else v) for k, v in phase.items()))
+                for name, phase in self.phases.items())),
+            ("slowest_cards", [OrderedDict([
+                ("seconds", round(elapsed, 6)), ("cardtype", cardtype),
+                ("name", name), ("number", number)])
+                for elapsed, i, (cardtype, name, number) in sorted(self.slow_cards, reverse=True)]),
+            ("slowest_fields", [OrderedDict([
+                ("seconds", round(elapsed, 6)), ("cardtype", cardtype),
+                ("name", name), ("field", field), ("length", length)])
+                for elapsed, i, (cardtype, name, field, length) in sorted(self.slow_fields, reverse=True)]),
+            ("fields", OrderedDict((field, OrderedDict([
+                ("calls", calls), ("seconds", round(seconds, 6)),
+                ("characters", length)]))
+                for field, (calls, seconds, length) in self.fields.items())),
+            ("substitutions", OrderedDict((str(field), OrderedDict([
+                ("calls", calls), ("seconds", round(seconds, 6))]))
+                for field, (calls, seconds) in self.substitutions.items())),
+            ("counters", self.counters),
+        ])
+
+    def format_report(self):
+        """A plain-text summary for the terminal"""
+        report = self.report()
+        lines = ["%-20s %10s %7s %12s" % ("Phase", "Seconds", "Calls", "Blocks")]
+        for name, phase in report["phases"].items():
+            lines.append("%-20s %10.4f %7d %+12d" % (name, phase["seconds"],
+                         phase["calls"], phase["allocated_blocks"]))
+        if report["slowest_cards"]:
+            lines.append("")
+            lines.append("Slowest cards:")
+            for c in report["slowest_cards"]:
+                lines.append("  %.4fs  %s #%s %s" % (c["seconds"], c["cardtype"],
+                             c["number"], c["name"]))
+        if report["slowest_fields"]:
+            lines.append("")
+            lines.append("Slowest fields:")
+            for f in report["slowest_fields"]:
+                lines.append("  %.4fs  %s %s: %s (%d characters)" % (f["seconds"],
+                             f["cardtype"], f["name"], f["field"], f["length"]))
+        if report["substitutions"]:
+            lines.append("")
+            lines.append("Rich field substitutions:")
+            for field, s in report["substitutions"].items():
+                lines.append("  %-18s %7d calls %10.4fs" % (field, s["calls"], s["seconds"]))
+        for name, value in report["counters"].items():
+            lines.append("%s: %s" % (name, value))
+        return "\n".join(lines)
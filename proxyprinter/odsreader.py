@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Streaming reader for OpenDocument spreadsheets. Parses content.xml from the
+.ods zip incrementally and yields rows sheet by sheet, expanding repeated
+rows and cells only when they're followed by data, so the reader itself
+holds no more than one row at a time. (ProxyPrinter still builds every card
+before rendering, since the page head needs all their traits.)
+
+Values come back the way pyexcel_ods3 gives them: numbers as floats (ints
+if they're whole and the cell isn't a percentage), currency as a string
+like "4.5 EUR", booleans as bools, dates as datetime.date/datetime, times
+as datetime.time (or datetime.timedelta from 24 hours up), everything else
+as strings, with "" for empty cells. Trailing empty cells and rows are
+dropped. Where pyexcel_ods3 would fail or drop a value this reader keeps
+it instead: fractional seconds are read, and dates and times it can't
+parse, and text in cells without a value type, come back as strings.
+"""
+
+import datetime
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+
+NS_TABLE = "urn:oasis:names:tc:opendocument:xmlns:table:1.0"
+NS_OFFICE = "urn:oasis:names:tc:opendocument:xmlns:office:1.0"
+NS_TEXT = "urn:oasis:names:tc:opendocument:xmlns:text:1.0"
+
+TABLE = "{%s}table" % NS_TABLE
+TABLE_ROW = "{%s}table-row" % NS_TABLE
+TABLE_CELL = "{%s}table-cell" % NS_TABLE
+COVERED_CELL = "{%s}covered-table-cell" % NS_TABLE
+TABLE_NAME = "{%s}name" % NS_TABLE
+ROWS_REPEATED = "{%s}number-rows-repeated" % NS_TABLE
+COLS_REPEATED = "{%s}number-columns-repeated" % NS_TABLE
+VALUE_TYPE = "{%s}value-type" % NS_OFFICE
+VALUE = "{%s}value" % NS_OFFICE
+BOOLEAN_VALUE = "{%s}boolean-value" % NS_OFFICE
+DATE_VALUE = "{%s}date-value" % NS_OFFICE
+TIME_VALUE = "{%s}time-value" % NS_OFFICE
+TEXT_P = "{%s}p" % NS_TEXT
+TEXT_S = "{%s}s" % NS_TEXT
+TEXT_C = "{%s}c" % NS_TEXT
+TEXT_TAB = "{%s}tab" % NS_TEXT
+TEXT_LINE_BREAK = "{%s}line-break" % NS_TEXT
+
+NUMERIC_TYPES = ("float", "percentage", "currency")
+#Parsed sheets OdsWorkbook.get() keeps, dropping the least recently used
+MEMO_SHEETS = 4
+CURRENCY = "{%s}currency" % NS_OFFICE
+#The PTnnHnnMnnS form spreadsheets write times and durations in
+TIME_PATTERN = re.compile(r"PT(\d+)H(\d+)M(\d+(?:\.\d+)?)S$")
+ROW_CONTAINERS = set("{%s}%s" % (NS_TABLE, tag) for tag in (
+    "table", "table-row-group", "table-header-rows", "table-rows",
+    "table-columns", "table-header-columns", "table-column-group"))
+
+
+def element_text(elem):
+    """Text of a text:p (or a span inside one), including special spaces"""
+    parts = [elem.text or ""]
+    for child in elem:
+        if child.tag == TEXT_S:
+            parts.append(" " * int(child.get(TEXT_C, 1)))
+        elif child.tag == TEXT_TAB:
+            parts.append("\t")
+        elif child.tag == TEXT_LINE_BREAK:
+            parts.append("\n")
+        else:
+            parts.append(element_text(child))
+        parts.append(child.tail or "")
+    return "".join(parts)
+
+def time_value(value):
+    """A time of day, or a duration if it's 24 hours or more"""
+    match = TIME_PATTERN.match(value)
+    if not match:
+        return value
+    hours, minutes = int(match.group(1)), int(match.group(2))
+    microseconds = round(float(match.group(3))*1000000)
+    seconds, microseconds = divmod(microseconds, 1000000)
+    if hours < 24 and minutes < 60 and seconds < 60:
+        return datetime.time(hours, minutes, seconds, microseconds)
+    return datetime.timedelta(hours=hours, minutes=minutes, seconds=seconds,
+                              microseconds=microseconds)
+
+def cell_value(cell):
+    value_type = cell.get(VALUE_TYPE)
+    if value_type in NUMERIC_TYPES:
+        value = float(cell.get(VALUE))
+        if value_type != "percentage" and value.is_integer():
+            value = int(value)
+        if value_type == "currency" and cell.get(CURRENCY):
+            return "%s %s" % (value, cell.get(CURRENCY))
+        return value
+    if value_type == "boolean":
+        return cell.get(BOOLEAN_VALUE) == "true"
+    if value_type == "date":
+        date_value = cell.get(DATE_VALUE)
+        try:
+            if "T" in date_value:
+                return datetime.datetime.fromisoformat(date_value)
+            return datetime.date.fromisoformat(date_value)
+        except ValueError:
+            return date_value
+    if value_type == "time":
+        return time_value(cell.get(TIME_VALUE))
+    return "\n".join(element_text(p) for p in cell if p.tag == TEXT_P)
+
+
+class OdsStream:
+    """
+    One pass over an .ods file's content.xml. Use sheets() to walk the
+    tables; each sheet's rows must be read (or abandoned) before moving to
+    the next.
+    """
+    def __init__(self, path, wanted=None):
+        self.path = path
+        self.wanted = None if wanted is None else set(wanted)
+        # Every sheet name passed so far, wanted or not
+        self.names = []
+
+    def sheets(self):
+        self.names = []
+        with zipfile.ZipFile(self.path) as z:
+            with z.open("content.xml") as content:
+                events = ET.iterparse(content, events=("start", "end"))
+                remaining = None if self.wanted is None else set(self.wanted)
+                stack = []
+                for event, elem in events:
+                    if event == "start":
+                        stack.append(elem)
+                        if elem.tag != TABLE:
+                            continue
+                        name = elem.get(TABLE_NAME)
+                        self.names.append(name)
+                        wanted = remaining is None or name in remaining
+                        rows = self.rows(events, stack, wanted)
+                        if wanted:
+                            yield name, rows
+                        # Finish off the table whether or not it was read
+                        for row in rows:
+                            pass
+                        if wanted and remaining is not None:
+                            remaining.discard(name)
+                            if not remaining:
+                                return
+                    else:
+                        stack.pop()
+                        if stack:
+                            stack[-1].remove(elem)
+
+    def rows(self, events, stack, wanted):
+        """
+        Yield the rows of the table whose start tag was just read, consuming
+        events up to and including its end tag.
+        """
+        depth = len(stack)
+        pending_rows = 0
+        for event, elem in events:
+            if event == "start":
+                stack.append(elem)
+                continue
+            stack.pop()
+            if len(stack) < depth:
+                # End of the table itself
+                if stack:
+                    stack[-1].remove(elem)
+                return
+            if elem.tag == TABLE_ROW:
+                if wanted:
+                    row = self.row_values(elem)
+                    repeat = int(elem.get(ROWS_REPEATED, 1))
+                    if not row:
+                        pending_rows += repeat
+                    else:
+                        for i in range(pending_rows):
+                            yield []
+                        pending_rows = 0
+                        for i in range(repeat):
+                            yield list(row)
+                stack[-1].remove(elem)
+            elif stack[-1].tag in ROW_CONTAINERS:
+                # Column definitions, finished row groups and so on
+                stack[-1].remove(elem)
+
+    @staticmethod
+    def row_values(row):
+        values = []
+        pending_cells = 0
+        for cell in row:
+            if cell.tag not in (TABLE_CELL, COVERED_CELL):
+                continue
+            repeat = int(cell.get(COLS_REPEATED, 1))
+            value = cell_value(cell) if cell.tag == TABLE_CELL else ""
+            if value == "":
+                pending_cells += repeat
+                continue
+            if pending_cells:
+                values.extend([""]*pending_cells)
+                pending_cells = 0
+            values.extend([value]*repeat)
+        return values
+
+
+def iter_sheets(path, sheets=None):
+    """
+    Yield (sheet name, row iterator) for each sheet of an .ods file, or only
+    the named sheets. Reading stops once all the named sheets are done.
+    """
+    return OdsStream(path, sheets).sheets()
+
+def read_sheet(path, name):
+    """Return one sheet's rows as a list, or None if there's no such sheet"""
+    for sheetname, rows in iter_sheets(path, [name]):
+        return list(rows)
+    return None
+
+
+class OdsWorkbook:
+    """
+    Read-only view of an .ods file as sheet names mapped to rows, like the
+    OrderedDict from pyexcel_ods3.get_data(), but parsed on demand:
+    items() streams every sheet and get() reads only as far as the sheet
+    it's asked for. The sheet names are kept once a pass has seen them all,
+    and the last few sheets get() parsed are kept too, so repeated lookups
+    don't read the file again.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.sheet_names = None
+        self.parsed = OrderedDict()
+
+    def keys(self):
+        if self.sheet_names is None:
+            # Wanting no sheets skips every row while still passing the names
+            stream = OdsStream(self.path, [])
+            for sheet in stream.sheets():
+                pass
+            self.sheet_names = stream.names
+        return self.sheet_names
+
+    def items(self):
+        stream = OdsStream(self.path)
+        for name, rows in stream.sheets():
+            yield name, rows
+        self.sheet_names = stream.names
+
+    def get(self, name, default=None):
+        if name in self.parsed:
+            self.parsed.move_to_end(name)
+            return self.parsed[name]
+        if self.sheet_names is not None and name not in self.sheet_names:
+            return default
+        stream = OdsStream(self.path, [name])
+        sheets = stream.sheets()
+        for sheetname, rows in sheets:
+            rows = list(rows)
+            sheets.close()
+            break
+        else:
+            # Read to the end without finding it, so that's every name
+            self.sheet_names = stream.names
+            return default
+        self.parsed[name] = rows
+        if len(self.parsed) > MEMO_SHEETS:
+            self.parsed.popitem(last=False)
+        return rows
+
+    def __getitem__(self, name):
+        rows = self.get(name)
+        if rows is None:
+            raise KeyError(name)
+        return rows
+
+    def __contains__(self, name):
+        if self.sheet_names is not None:
+            return name in self.sheet_names
+        # Reads no further than the sheet, which is likely wanted next
+        return self.get(name) is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def to_dict(self):
+        """Read the whole workbook into an OrderedDict of lists of rows"""
+        return OrderedDict((name, list(rows)) for name, rows in self.items())
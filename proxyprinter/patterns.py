@@ -0,0 +1,444 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Analysis of ProcessPatterns regexes, so TextSubstituter can tell which
+consecutive substitutions give the same result in one combined scan as
+they do one after another.
+
+A pattern is turned into a small automaton over ranges of characters if
+it only uses literals, character classes, groups, alternation, repetition
+and \\b at its ends. Anything else (lookarounds, backreferences, anchors,
+flags) isn't analysed, and that pattern always gets a pass of its own.
+
+A later substitution is independent of an earlier one if no match of the
+later pattern can overlap a match of the earlier pattern or any text the
+earlier replacement writes, and a \\b at either end of the later pattern
+sees the same kind of character next to a replacement as it would next to
+the text that was replaced. The automata can match more than the patterns
+(long repeats are left unbounded, for one), so a mistake can only make a
+pattern run in its own pass.
+"""
+
+import array
+import re
+import sys
+
+try:
+    from re import _parser as sre_parse, _constants as sre
+except ImportError:
+    import sre_parse
+    import sre_constants as sre
+
+#Repeats of more than this many copies are treated as unbounded
+MAX_UNROLL = 16
+#Character sets up to this size are checked one character at a time
+#  instead of against the Unicode category tables
+SMALL_CHARSET = 4096
+
+ALL_CHARS = ((0, sys.maxunicode),)
+CATEGORIES = {
+    sre.CATEGORY_DIGIT: ("d", False), sre.CATEGORY_NOT_DIGIT: ("d", True),
+    sre.CATEGORY_SPACE: ("s", False), sre.CATEGORY_NOT_SPACE: ("s", True),
+    sre.CATEGORY_WORD: ("w", False), sre.CATEGORY_NOT_WORD: ("w", True),
+}
+WORD_CHAR = re.compile(r"\w")
+
+
+class Unsupported(Exception):
+    """Raised for a pattern or replacement that can't be analysed"""
+
+
+# Character sets are tuples of (first, last) code point ranges, sorted and
+# not touching each other
+
+def charset_union(*charsets):
+    merged = []
+    for lo, hi in sorted(r for charset in charsets for r in charset):
+        if merged and lo <= merged[-1][1]+1:
+            if hi > merged[-1][1]:
+                merged[-1] = (merged[-1][0], hi)
+        else:
+            merged.append((lo, hi))
+    return tuple(merged)
+
+def charset_complement(charset):
+    ranges = []
+    start = 0
+    for lo, hi in charset:
+        if lo > start:
+            ranges.append((start, lo-1))
+        start = hi+1
+    if start <= sys.maxunicode:
+        ranges.append((start, sys.maxunicode))
+    return tuple(ranges)
+
+def charsets_meet(a, b):
+    """Whether two character sets have any character in common"""
+    i = j = 0
+    while i < len(a) and j < len(b):
+        if a[i][1] < b[j][0]:
+            i += 1
+        elif b[j][1] < a[i][0]:
+            j += 1
+        else:
+            return True
+    return False
+
+_category_charsets = {}
+
+def category_charset(letter):
+    """The characters \\d, \\s or \\w match in a str pattern"""
+    if not _category_charsets:
+        # Every code point, to let the regex engine say which are which
+        chars = array.array("I", range(sys.maxunicode+1)).tobytes().decode(
+                "utf-32-le" if sys.byteorder == "little" else "utf-32-be",
+                "surrogatepass")
+        for l in "dsw":
+            _category_charsets[l] = tuple((m.start(), m.end()-1) for m in
+                                          re.finditer(r"\%s+" % l, chars))
+    return _category_charsets[letter]
+
+def wordness(charset):
+    """
+    True if every character in the set is a word character (as \\b sees
+    them), False if none is, or None if it's a mix.
+    """
+    if sum(hi-lo+1 for lo, hi in charset) <= SMALL_CHARSET:
+        found = set(WORD_CHAR.match(chr(c)) is not None
+                    for lo, hi in charset for c in range(lo, hi+1))
+    else:
+        word = category_charset("w")
+        found = set()
+        if charsets_meet(charset, word):
+            found.add(True)
+        if charsets_meet(charset, charset_complement(word)):
+            found.add(False)
+    return found.pop() if len(found) == 1 else None
+
+def parsed_charset(op, av):
+    """The characters one parsed regex item matches"""
+    if op == sre.LITERAL:
+        return ((av, av),)
+    if op == sre.NOT_LITERAL:
+        return charset_complement(((av, av),))
+    if op == sre.ANY:
+        return charset_complement(((10, 10),))
+    negate = False
+    charsets = []
+    for item_op, item_av in av:
+        if item_op == sre.NEGATE:
+            negate = True
+        elif item_op == sre.LITERAL:
+            charsets.append(((item_av, item_av),))
+        elif item_op == sre.RANGE:
+            charsets.append((item_av,))
+        elif item_op == sre.CATEGORY and item_av in CATEGORIES:
+            letter, negated = CATEGORIES[item_av]
+            charset = category_charset(letter)
+            charsets.append(charset_complement(charset) if negated else charset)
+        else:
+            raise Unsupported(item_op)
+    # A lone category is already merged, and large enough to be worth skipping
+    charset = charsets[0] if len(charsets) == 1 else charset_union(*charsets)
+    return charset_complement(charset) if negate else charset
+
+
+class Automaton:
+    """
+    A nondeterministic automaton with one start and one accepting state.
+    Each transition either reads one character from a set or reads nothing.
+    """
+    def __init__(self):
+        self.edges = []
+        self.empty = []
+        self.closures = {}
+        self.start, self.accept = self.fragment([])
+        self._trimmed = None
+        self._moves = None
+        self._initial = None
+        self._first = None
+        self._last = None
+
+    def state(self):
+        self.edges.append([])
+        self.empty.append([])
+        return len(self.edges)-1
+
+    def link(self, a, b):
+        self.empty[a].append(b)
+
+    def chars(self, charset):
+        start, end = self.state(), self.state()
+        if charset:
+            self.edges[start].append((charset, end))
+        return start, end
+
+    def fragment(self, items):
+        """Add states for a list of parsed regex items; returns (start, end)"""
+        start = end = self.state()
+        for op, av in items:
+            item_start, item_end = self.item(op, av)
+            self.link(end, item_start)
+            end = item_end
+        return start, end
+
+    def item(self, op, av):
+        if op in (sre.LITERAL, sre.NOT_LITERAL, sre.ANY, sre.IN):
+            return self.chars(parsed_charset(op, av))
+        if op in (sre.MAX_REPEAT, sre.MIN_REPEAT):
+            least, most, items = av
+            start = end = self.state()
+            for i in range(min(least, MAX_UNROLL)):
+                copy_start, copy_end = self.fragment(items)
+                self.link(end, copy_start)
+                end = copy_end
+            if least > MAX_UNROLL or most == sre.MAXREPEAT or most > MAX_UNROLL:
+                optional = None
+            else:
+                optional = most-least
+            exit = self.state()
+            if optional is None:
+                copy_start, copy_end = self.fragment(items)
+                self.link(end, copy_start)
+                self.link(copy_end, copy_start)
+                self.link(copy_end, exit)
+            else:
+                for i in range(optional):
+                    copy_start, copy_end = self.fragment(items)
+                    skip = self.state()
+                    self.link(end, copy_start)
+                    self.link(end, skip)
+                    self.link(copy_end, skip)
+                    end = skip
+            self.link(end, exit)
+            return start, exit
+        if op == sre.SUBPATTERN:
+            group, add_flags, del_flags, items = av
+            if add_flags or del_flags:
+                raise Unsupported(op)
+            return self.fragment(items)
+        if op == sre.BRANCH:
+            start, exit = self.state(), self.state()
+            for items in av[1]:
+                branch_start, branch_end = self.fragment(items)
+                self.link(start, branch_start)
+                self.link(branch_end, exit)
+            return start, exit
+        raise Unsupported(op)
+
+    def finish(self, start, end):
+        self.link(self.accept, start)
+        self.accept = end
+
+    def closure(self, states):
+        """States reachable from any of states without reading anything"""
+        found = set()
+        for state in states:
+            if state not in self.closures:
+                self.closures[state] = frozenset(reachable(state, self.empty))
+            found |= self.closures[state]
+        return found
+
+    @property
+    def trimmed(self):
+        """States on some path from the start to the accepting state"""
+        if self._trimmed is None:
+            successors = [self.empty[s] + [t for charset, t in self.edges[s]]
+                          for s in range(len(self.edges))]
+            predecessors = [[] for s in successors]
+            for s, targets in enumerate(successors):
+                for t in targets:
+                    predecessors[t].append(s)
+            self._trimmed = frozenset(reachable(self.start, successors) &
+                                      reachable(self.accept, predecessors))
+        return self._trimmed
+
+    @property
+    def moves(self):
+        """
+        The states that matter once the automaton is finished (trimmed
+        states that read a character, and the accepting state), each mapped
+        to its (charset, next states) transitions. The next states are the
+        ones that matter among those reachable after reading a character.
+        """
+        if self._moves is None:
+            trimmed = self.trimmed
+            self._moves = {self.accept: []}
+            for s in trimmed:
+                edges = [(charset, t) for charset, t in self.edges[s]
+                         if t in trimmed]
+                if edges:
+                    self._moves[s] = edges
+            for s, edges in self._moves.items():
+                self._moves[s] = [(charset, self.settle([t]))
+                                  for charset, t in edges]
+        return self._moves
+
+    @property
+    def initial(self):
+        """The states that matter before reading anything"""
+        if self._initial is None:
+            self._initial = self.settle([self.start])
+        return self._initial
+
+    def settle(self, states):
+        """The states that matter among those reachable from states"""
+        moves = self._moves if self._moves is not None else self.moves
+        return frozenset(s for s in self.closure(states) if s in moves)
+
+    def accepts_empty(self):
+        return self.accept in self.closure([self.start])
+
+    def first_chars(self):
+        if self._first is None:
+            self._first = charset_union(*[charset for s in self.initial
+                                          for charset, t in self.moves[s]])
+        return self._first
+
+    def last_chars(self):
+        if self._last is None:
+            self._last = charset_union(*[
+                charset for edges in self.moves.values()
+                for charset, states in edges if self.accept in states])
+        return self._last
+
+
+def reachable(start, neighbors):
+    found = {start}
+    todo = [start]
+    while todo:
+        for s in neighbors[todo.pop()]:
+            if s not in found:
+                found.add(s)
+                todo.append(s)
+    return found
+
+def meets(a, a_states, b, b_states):
+    """
+    Whether some nonempty string takes automaton a from one of a_states
+    and b from one of b_states (states that matter, see moves) with at
+    least one of them ending up in its accepting state.
+    """
+    a_moves, b_moves = a.moves, b.moves
+    todo = [(x, y) for x in a_states for y in b_states]
+    seen = set(todo)
+    while todo:
+        x, y = todo.pop()
+        for a_charset, a_next in a_moves[x]:
+            for b_charset, b_next in b_moves[y]:
+                if not charsets_meet(a_charset, b_charset):
+                    continue
+                if (a.accept in a_next and b_next or
+                        b.accept in b_next and a_next):
+                    return True
+                for pair in ((x2, y2) for x2 in a_next for y2 in b_next):
+                    if pair not in seen:
+                        seen.add(pair)
+                        todo.append(pair)
+    return False
+
+def can_overlap(a, b):
+    """Whether a match of a and a match of b can share any characters"""
+    # Starting a anywhere finds b inside a, or a running into b; starting b
+    # anywhere finds a inside b, or b running into a
+    return (meets(a, a.moves.keys(), b, b.initial) or
+            meets(a, a.initial, b, b.moves.keys()))
+
+
+class Substitution:
+    """
+    What one pattern can match and what its replacement can write, from
+    the compiled pattern and its replacement as split by
+    parse_replacement(). Raises Unsupported if either can't be analysed.
+    """
+    def __init__(self, pattern, pieces):
+        if pattern.flags != re.UNICODE or pieces is None:
+            raise Unsupported(pattern.pattern)
+        items = list(sre_parse.parse(pattern.pattern, pattern.flags))
+        boundary = (sre.AT, sre.AT_BOUNDARY)
+        self.boundary_before = bool(items) and items[0] == boundary
+        if self.boundary_before:
+            items = items[1:]
+        self.boundary_after = bool(items) and items[-1] == boundary
+        if self.boundary_after:
+            items = items[:-1]
+
+        self.match = Automaton()
+        self.match.finish(*self.match.fragment(items))
+        if self.match.accepts_empty():
+            raise Unsupported(pattern.pattern)
+
+        groups = {0: items}
+        find_groups(items, groups)
+        self.output = Automaton()
+        for piece in pieces:
+            if type(piece) == str:
+                for c in piece:
+                    self.output.finish(*self.output.chars(((ord(c), ord(c)),)))
+                continue
+            if type(piece) != int:
+                piece = pattern.groupindex.get(piece[0])
+            if piece not in groups:
+                raise Unsupported(pattern.pattern)
+            # A group that didn't take part in the match writes nothing
+            start, end = self.output.fragment(groups[piece])
+            self.output.link(start, end)
+            self.output.finish(start, end)
+        if self.output.accepts_empty():
+            raise Unsupported(pattern.pattern)
+
+def find_groups(items, groups):
+    for op, av in items:
+        if op == sre.SUBPATTERN:
+            if av[0] is not None:
+                groups[av[0]] = av[3]
+            find_groups(av[3], groups)
+        elif op in (sre.MAX_REPEAT, sre.MIN_REPEAT):
+            find_groups(av[2], groups)
+        elif op == sre.BRANCH:
+            for branch in av[1]:
+                find_groups(branch, groups)
+
+def analyze(pattern, pieces):
+    """A Substitution for the pattern and replacement, or None"""
+    try:
+        return Substitution(pattern, pieces)
+    except (Unsupported, re.error, RecursionError):
+        return None
+
+def independent(first, second):
+    """
+    Whether Substitutions first then second give the same result in one
+    combined scan as one after the other.
+    """
+    # Matches can't overlap each other or first's replacement
+    if can_overlap(first.match, second.match):
+        return False
+    if can_overlap(first.output, second.match):
+        return False
+    # A \b at an end of second that can be next to a match of first has to
+    # see the same kind of character in the replacement
+    if second.boundary_after and boundary_can_see(
+            second.match.last_chars(), first.boundary_before,
+            first.match.first_chars()):
+        same = wordness(first.match.first_chars())
+        if same is None or same != wordness(first.output.first_chars()):
+            return False
+    if second.boundary_before and boundary_can_see(
+            second.match.first_chars(), first.boundary_after,
+            first.match.last_chars()):
+        same = wordness(first.match.last_chars())
+        if same is None or same != wordness(first.output.last_chars()):
+            return False
+    return True
+
+def boundary_can_see(edge_chars, needs_boundary, match_chars):
+    """
+    Whether a match whose edge has edge_chars can sit right next to a match
+    with match_chars at that edge, which needs_boundary (\\b) there.
+    """
+    if not needs_boundary:
+        return True
+    edge = wordness(edge_chars)
+    return edge is None or edge != wordness(match_chars)
@@ -1,19 +1,42 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import csv
 import re
 import argparse
-import pyexcel_ods3 as pyexcel
+import gzip
+import os
+import sys
+import shutil
+import tempfile
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
+from operator import methodcaller
+from contextlib import nullcontext
 import hashlib
 import logging
 import json
-from html import escape
+from html import escape, unescape
 from random import randint
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
+from collections.abc import Mapping
 from time import strftime
 from pkgutil import get_data
 
+from .assets import write_asset, asset_url
+from .metrics import Metrics, TimedSubstituter, DEFAULT_TOP
+from .table import row_size_classes, size_classes
+from .layouts import compile_layout, LayoutError
+from .patterns import analyze as analyze_substitution, independent
+from .cache import FragmentCache, settings_fingerprint, DEFAULT_CACHE_MAX_BYTES
+from .watch import watch, file_state
+from .server import serve, DEFAULT_SERVE_PORT, DEFAULT_SERVE_WORKERS
+from .batch import read_manifest, deck_output, format_summary
+from .readers import read_workbook
+from .raster import save_faces, save_atlases, atlas_grid, ATLAS_SIZE, \
+                    DEFAULT_DPI, DEFAULT_JPEG_QUALITY
+
 SPECIAL_FIELDS = [
     "Name", #Title of the card
     "Traits", #Comma-separated list of tags/classes
@@ -24,7 +47,17 @@ SPECIAL_FIELDS = [
 ]
 
 DEFAULT_STYLE = get_data(__name__, "proxyprinter.css").decode("utf-8")
-ZIP_CODE = get_data(__name__, "zipcode.html").decode("utf-8")
+ZIP_SCRIPT = get_data(__name__, "zipcode.js").decode("utf-8")
+DEFAULT_LAYOUT = get_data(__name__, "layout.html").decode("utf-8")
+ZIP_LIBRARIES = """<script src="https://html2canvas.hertzen.com/dist/html2canvas.min.js"></script>
+<script src="https://cdn.jsdelivr.net/npm/jszip@3.5.0/dist/jszip.min.js"></script>
+<script src="https://cdn.jsdelivr.net/npm/file-saver@2.0.5/dist/FileSaver.min.js"></script>
+"""
+ZIP_BUTTON = """<button onclick="javascript:makezip()" class="zipmaker">Make image ZIP</button>
+"""
+ZIP_CODE = (ZIP_LIBRARIES +
+            "<script type=\"application/javascript\">\n" + ZIP_SCRIPT + "</script>\n" +
+            ZIP_BUTTON)
 
 DEFAULT_TEXT_SIZING_THRESHOLDS = {
     "*": (30, 50),
@@ -35,6 +68,48 @@ DEFAULT_RICH_FIELDS = [
     "Text"
 ]
 
+#Clones the cards stored in <template> tags by compact_copies mode
+COPIES_CODE = """<script type="application/javascript">
+for (const t of document.querySelectorAll("template.card_copies")) {
+  for (let i = 0; i < parseInt(t.dataset.copies); i++) {
+    t.before(t.content.cloneNode(true))
+  }
+}
+</script>
+"""
+
+#Defaults for the "Make image ZIP" button: how much to scale each card up
+# from its on-screen size, and how many cards to capture at once
+ZIP_SCALE = 4
+ZIP_WORKERS = 3
+ZIP_SETTINGS_CODE = """<script type="application/javascript">
+window.ZIP_SETTINGS = %s
+</script>
+"""
+
+#Cards per page for render_pages()
+DEFAULT_PER_PAGE = 500
+#Added to each page from render_pages() so the browser can skip laying out
+# cards that are off screen; printing still lays out everything
+PAGE_STYLE = """@media screen {
+.card {content-visibility: auto; contain-intrinsic-size: 2.2in 3.2in;}
+}"""
+
+#Stands in for Metrics.phase() when not profiling
+NO_PHASE = nullcontext()
+
+#Characters of rendered HTML to collect before each write to an output file
+OUTPUT_BUFFER_SIZE = 1024*1024
+
+#Cards rendered between calls to a ProxyPrinter's progress callback
+PROGRESS_INTERVAL = 100
+
+#Most cards to send to a worker process at once with jobs > 1
+RENDER_CHUNK_SIZE = 256
+
+#Most Card.markup() results to remember per run
+PROCESS_CACHE_SIZE = 50000
+
 #Reserved names potentially used to define settings in the spreadsheet
 SETTING_SHEET_LABEL = "ProxyPrinter Settings"
 SETTING_LABEL_CSSFILE = "CSSFile"
@@ -46,42 +121,116 @@ SETTING_LABEL_RICHFIELDS = "RichFields"
 SETTING_LABEL_PROCESSPATTERNS = "ProcessPatterns"
 SETTING_LABEL_PROCESSREPLACEMENTS = "ProcessReplacements"
 SETTING_LABEL_BASEURL = "BaseURL"
+SETTING_LABEL_LAYOUTCARDTYPE = "LayoutCardType"
+SETTING_LABEL_LAYOUTFILE = "LayoutFile"
 
 
 #Set up logging
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.StreamHandler())
 
+#Left in a card's outer tag by its layout, to be filled in by tag_card_html()
+CARD_ID_MARKER = " data-card=''"
+START_TAG = re.compile(r"<[A-Za-z][^>]*?(/?)>")
+CLASS_ATTRIBUTE = re.compile(r"""\sclass\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+
+def mark_card_root(text, name="layout"):
+    """
+    Add CARD_ID_MARKER to the first tag in layout text with the class card,
+    so each card can be numbered without parsing its HTML. Raises
+    LayoutError if there's no such tag.
+    """
+    for tag in START_TAG.finditer(text):
+        attribute = CLASS_ATTRIBUTE.search(tag.group())
+        classes = attribute and (attribute.group(1) or attribute.group(2) or "")
+        if classes and "card" in classes.split():
+            end = tag.start(1)
+            return text[:end] + CARD_ID_MARKER + text[end:]
+    raise LayoutError("No element with the class card in %s" % name)
+
+def tag_card_html(html, card_id):
+    """Mark a card's outer tag with its position in the deck"""
+    return html.replace(CARD_ID_MARKER, " data-card='%d'" % card_id, 1)
+
 def escape_html(s):
     #like cgi.escape, but undo escaping &nbsp;
     return escape(s).replace("&amp;nbsp;", "&nbsp;")
 
+def html_to_text(s):
+    """Plain text from processed field HTML, dropping any tags"""
+    s = s.replace("<br />\n", "\n")
+    return unescape(re.sub(r"<[^>]*>", "", s))
+
+def trait_hsl(trait):
+    """A color for a trait, derived from its name: (hue, saturation, lightness)"""
+    def int_from_string_hash(s, min_i, max_i, encoding="utf-8"):
+        m = hashlib.md5(bytes(s, encoding))
+        return (int(m.hexdigest(), 16) % (max_i-min_i)) + min_i
+    hue = int_from_string_hash(trait,0,360)#randint(0,360)
+    sat = int_from_string_hash(trait,40,100)#randint(40,100)
+    lit = 85
+    return hue, sat, lit
+
 def replace_all(s, replacements):
     for key in replacements:
         s = s.replace(key, replacements[key])
     return s
 
+def open_output(path, compress=False):
+    """
+    Open a text file for writing the output HTML. With compress, or if the
+    filename ends in .gz, the output is gzipped as it's written.
+    """
+    if compress or path.endswith(".gz"):
+        return gzip.open(path, "wt", encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
+
+def write_output(path, write, compress=False):
+    """
+    Write the output file at path by calling write() with the open file.
+    It's written to a temporary file first, which only replaces path once
+    write() is done, so a failed or cancelled build leaves the old file.
+    """
+    compress = compress or path.endswith(".gz")
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open_output(tmp, compress) as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
 def twod_array_to_ordered_dict_array(array2d):
     if len(array2d) < 2 or type(array2d[0]) != list:
         logger.warning("Not a 2d array?")
         return []
 
     keys = array2d[0]
-    vals = array2d[1:]
-    od_rows = []
-    for row in vals:
-        if not row: #skip empty rows
-            continue
-        od = OrderedDict()
-        if len(keys) != len(row):
-            logger.info("Mismatched number of fields in row: %s" % row)
-
-        for i in range(0, len(keys)):
-            if i >= len(row):
-                continue
-            od[keys[i]] = row[i]
-        od_rows.append(od)
-    return od_rows
+    return [row_to_ordered_dict(keys, row) for row in array2d[1:]
+            if row] #skip empty rows
+
+def row_to_ordered_dict(keys, row):
+    od = OrderedDict()
+    if len(keys) != len(row):
+        logger.info("Mismatched number of fields in row: %s" % row)
+
+    for i in range(0, min(len(keys), len(row))):
+        od[keys[i]] = row[i]
+    return od
+
+def sheet_pages(sheet):
+    """
+    Sheet name and rows for each page of a spreadsheet. A single-sheet file
+    may come back as a 2d array; a multi-sheet file comes back as a mapping
+    of sheet names to rows.
+    """
+    if type(sheet) == list:
+        return [("-", sheet)]
+    return sheet.items()
 
 def slug_text(s):
     if "lower" not in dir(s):
@@ -89,6 +238,206 @@ def slug_text(s):
     return re.sub(r"\W","",re.sub(r"\s","_",s.lower()))
 
 
+class TextSubstituter:
+    """
+    Applies an ordered table of regex substitutions (the ProcessPatterns
+    setting) to text. Consecutive patterns that provably can't affect each
+    other are combined into one regex, so the text is scanned once per group
+    instead of once per pattern. A pattern is combined with the ones before
+    it only if none of its matches can overlap theirs or their replacements,
+    and a word boundary at its ends can't tell a replacement from the text
+    it replaced (see patterns.py). Any other pattern starts a new pass, so
+    it runs on the output of the patterns before it.
+    """
+    def __init__(self, text_subs={}):
+        self.text_subs = text_subs
+        self.passes = []
+
+        group = []
+        for pattern, repl in text_subs.items():
+            if type(pattern) == str:
+                pattern = re.compile(pattern)
+            pieces = parse_replacement(repl)
+            substitution = analyze_substitution(pattern, pieces)
+            if group and not self.can_combine(group, pattern, substitution):
+                self.passes.append(self.compile_pass(group))
+                group = []
+            group.append((pattern, repl, pieces, substitution))
+        if group:
+            self.passes.append(self.compile_pass(group))
+
+    @staticmethod
+    def can_combine(group, pattern, substitution):
+        if substitution is None:
+            return False
+        # Group names can't clash once they're in one regex, where each
+        # pattern is in a group named _subN
+        names = [name for p in [p for p, _, _, _ in group] + [pattern]
+                 for name in p.groupindex]
+        if (len(set(names)) < len(names) or
+                any(name.startswith("_sub") for name in names)):
+            return False
+        for _, _, _, prev in group:
+            if prev is None or not independent(prev, substitution):
+                return False
+        return True
+
+    @staticmethod
+    def compile_pass(group):
+        if len(group) == 1:
+            pattern, repl, _, _ = group[0]
+            return pattern, repl
+
+        offsets = []
+        offset = 0
+        for pattern, _, _, _ in group:
+            offsets.append(offset+1)
+            offset += pattern.groups+1
+        combined = re.compile(combined_pattern([p for p, _, _, _ in group]))
+
+        # Point each replacement's group references at the combined groups
+        expansions = {}
+        for i, (_, _, pieces, _) in enumerate(group):
+            shifted = []
+            for p in pieces:
+                if type(p) == int:
+                    p = p+offsets[i]
+                elif type(p) != str:
+                    p = combined.groupindex[p[0]]
+                shifted.append(p)
+            expansions["_sub%d" % i] = shifted
+
+        def expand(m):
+            return "".join([p if type(p) == str else (m.group(p) or "")
+                            for p in expansions[m.lastgroup]])
+        return combined, expand
+
+    def sub(self, text):
+        for pattern, repl in self.passes:
+            text = pattern.sub(repl, text)
+        return text
+
+
+REPLACEMENT_TOKEN = re.compile(r"\\(?:g<([^>]*)>|([1-9][0-9]?)(?![0-9])|(.))", re.S)
+REPLACEMENT_ESCAPES = {"\\": "\\", "n": "\n", "t": "\t"}
+
+def parse_replacement(repl):
+    """
+    Split a re.sub() replacement template into literal strings, group numbers
+    and (name,) tuples for named groups. Returns None for templates using
+    escapes this doesn't handle.
+    """
+    pieces = []
+    pos = 0
+    for m in REPLACEMENT_TOKEN.finditer(repl):
+        if m.start() > pos:
+            pieces.append(repl[pos:m.start()])
+        pos = m.end()
+        ref, num, esc = m.groups()
+        if ref is not None:
+            if ref.isdigit():
+                pieces.append(int(ref))
+            elif ref.isidentifier():
+                pieces.append((ref,))
+            else:
+                return None
+        elif num is not None:
+            pieces.append(int(num))
+        elif esc in REPLACEMENT_ESCAPES:
+            pieces.append(REPLACEMENT_ESCAPES[esc])
+        else:
+            return None
+    if pos < len(repl):
+        pieces.append(repl[pos:])
+    return pieces
+
+def combined_pattern(patterns):
+    """One regex matching any of patterns, each in a group named _subN"""
+    return "|".join("(?P<_sub%d>%s)" % (i, p.pattern)
+                    for i, p in enumerate(patterns))
+
+
+class ProcessCache:
+    """
+    Bounded least-recently-used cache of Card.markup() results, shared by
+    all the cards in a run. Keys are (text, context, rich field?) tuples.
+    """
+    def __init__(self, maxsize=PROCESS_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        try:
+            result = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        if self.maxsize <= 0:
+            return
+        self.entries[key] = result
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits/lookups if lookups else 0.0,
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+        }
+
+class ParsedWorkbook:
+    """
+    A spreadsheet read into memory once, so SheetSettings and ProxyPrinter
+    can share it instead of each parsing the file. Reloads only if the
+    file's modification time or size has changed. progress, if given, is
+    called as progress("sheets", n, 0) before each sheet is read, and can
+    raise to stop reading.
+    """
+    def __init__(self, path, progress=None):
+        self.path = path
+        self.load(progress)
+
+    def load(self, progress=None):
+        self.state = file_state(self.path)
+        self.sheets = read_workbook(self.path, lazy=True)
+        if type(self.sheets) != list:
+            # Read a sheet at a time, so progress can stop it between sheets
+            sheets = OrderedDict()
+            for n, (sheetname, sheetdata) in enumerate(self.sheets.items(),
+                                                       start=1):
+                if progress:
+                    progress("sheets", n, 0)
+                sheets[sheetname] = list(sheetdata)
+            self.sheets = sheets
+
+        # Field names (first row items) used in any card sheet, in order
+        field_names = OrderedDict()
+        for sheetname, sheetdata in sheet_pages(self.sheets):
+            if sheetname == SETTING_SHEET_LABEL:
+                continue
+            if sheetdata:
+                field_names.update((name, None) for name in sheetdata[0])
+        self.field_names = list(field_names)
+
+    def stale(self):
+        return file_state(self.path) != self.state
+
+    def refresh(self, progress=None):
+        if self.stale():
+            self.load(progress)
+        return self
+
+
 class CardCounter:
     def __init__(self):
         self.total = 0
@@ -107,59 +456,235 @@ class CardCounter:
     def skip_to(self,n):
         self.total = n
 
-class Card:
-    def __init__(self, cardtype="", fields=OrderedDict(), copyowner="",
-                size_thresholds=DEFAULT_TEXT_SIZING_THRESHOLDS,
-                text_subs = {}, rich_fields = ["Text"],
-                counter=None):
+SchemaColumn = namedtuple("SchemaColumn", ["name", "slug", "special", "thresholds", "rich"])
+
+class SheetSchema:
+    """
+    Everything about a sheet's columns that doesn't depend on the card:
+    CSS class slugs, whether the field is one of the SPECIAL_FIELDS, its
+    text size thresholds and whether rich text processing applies.
+    Built once per sheet and shared by all of the sheet's cards, along with
+    the sheet's compiled layout (None for the default).
+    """
+    def __init__(self, cardtype="", keys=[],
+                 size_thresholds=DEFAULT_TEXT_SIZING_THRESHOLDS,
+                 rich_fields=["Text"], template=None):
         self.cardtype = cardtype
+        self.template = template
+        self.cardtype_slug = slug_text(cardtype)
+        self.keys = tuple(keys)
+        self.size_thresholds = size_thresholds
+        self.rich_fields = rich_fields
+        self.year = strftime("%Y")
+        self.columns = {}
+        self.layouts = {}
+        for key in keys:
+            self.column(key)
+
+    def column(self, name):
+        """Look up a column, adding it if it's a field this sheet lacks"""
+        try:
+            return self.columns[name]
+        except KeyError:
+            pass
+        if name in self.size_thresholds:
+            thresholds = self.size_thresholds[name]
+        else:
+            thresholds = self.size_thresholds["*"]
+        col = SchemaColumn(name=name, slug=slug_text(name),
+                           special=name in SPECIAL_FIELDS,
+                           thresholds=thresholds,
+                           rich=name in self.rich_fields)
+        self.columns[name] = col
+        return col
+
+    def layout(self, length):
+        """
+        Field names mapped to their positions in a row of length values,
+        in column order. A name used for more than one column takes the
+        last one's value, like building a dict from the row would.
+        """
+        try:
+            return self.layouts[length]
+        except KeyError:
+            pass
+        layout = {}
+        for i, key in enumerate(self.keys[:length]):
+            layout[key] = i
+        self.layouts[length] = layout
+        return layout
+
+
+class RenderContext:
+    """
+    The run-wide settings cards need to render, shared by every card in
+    the run instead of each card keeping its own references.
+    """
+    __slots__ = ("copyowner", "size_thresholds", "text_subs", "rich_fields",
+                 "substituter", "process_cache", "metrics")
+
+    def __init__(self, copyowner="", size_thresholds=DEFAULT_TEXT_SIZING_THRESHOLDS,
+                 text_subs={}, rich_fields=["Text"], substituter=None,
+                 process_cache=None, metrics=None):
         self.copyowner = copyowner
-        self.fields = fields
-        self.text_subs = text_subs
         self.size_thresholds = size_thresholds
+        self.text_subs = text_subs
         self.rich_fields = rich_fields
+        self.substituter = substituter or TextSubstituter(text_subs)
+        self.process_cache = process_cache
+        self.metrics = metrics
+
+
+class CardFields(Mapping):
+    """Read-only dict-like view of a card's row, keyed by field name"""
+    __slots__ = ("layout", "values")
+
+    def __init__(self, layout, values):
+        self.layout = layout
+        self.values = values
+
+    def __getitem__(self, key):
+        return self.values[self.layout[key]]
+
+    def __contains__(self, key):
+        return key in self.layout
+
+    def __iter__(self):
+        return iter(self.layout)
+
+    def __len__(self):
+        return len(self.layout)
+
+    def __repr__(self):
+        return "CardFields(%r)" % dict(self.items())
+
+
+def intify(value):
+    """Force integer floats to integer type"""
+    #Spreadsheets give all numbers as floats, but for board gaming
+    # we usually want to deal with whole numbers, so this fixes that.
+    if type(value) == float and value.is_integer():
+        return int(value)
+    return value
+
+class Card:
+    """
+    One row of a sheet. The row's values are kept as a tuple in the
+    sheet's column order, with the column details in the shared schema
+    and the run-wide settings in the shared render context.
+
+    A row passed in directly should already have whole-number floats made
+    into ints, as intify() does; sizes, if given, are the size class of
+    each value, and text_size the size class of the text box.
+    """
+    __slots__ = ("schema", "context", "values", "sizes", "text_size", "traits",
+                 "number", "type_number")
+
+    def __init__(self, cardtype="", fields=OrderedDict(), copyowner="",
+                size_thresholds=DEFAULT_TEXT_SIZING_THRESHOLDS,
+                text_subs = {}, rich_fields = ["Text"],
+                counter=None, substituter=None, process_cache=None,
+                schema=None, context=None, row=None, sizes=None, text_size=None):
+        if context is None:
+            context = RenderContext(copyowner, size_thresholds, text_subs,
+                                    rich_fields, substituter, process_cache)
+        self.context = context
+        if row is None:
+            # Fields as a mapping; the schema follows its keys
+            if schema is None or tuple(fields.keys()) != schema.keys:
+                schema = SheetSchema(cardtype, fields.keys(),
+                                     context.size_thresholds, context.rich_fields)
+            row = [intify(v) for v in fields.values()]
+        elif schema is None:
+            raise ValueError("A row of values needs the sheet's schema")
+        self.schema = schema
+        self.values = tuple(islice(row, len(schema.keys)))
+        self.sizes = sizes
+        self.text_size = text_size
         if counter:
             self.number,self.type_number = counter.increment(self)
         else:
             self.number = None
             self.type_number = None
 
-        self.intify_fields()
         self.process_split_fields()
 
-    def intify_fields(self):
-        """Force integer floats to integer type"""
-        #PyExcel provides all numbers as floats, but for board gaming
-        # we usually want to deal with whole numbers, so this fixes that.
-        for key,val in self.fields.items():
-            if type(val) == float and val.is_integer():
-                self.fields[key] = int(val)
+    @property
+    def cardtype(self):
+        return self.schema.cardtype
+
+    @property
+    def layout(self):
+        return self.schema.layout(len(self.values))
+
+    @property
+    def fields(self):
+        return CardFields(self.layout, self.values)
+
+    # Run-wide settings, kept in the shared context
+    copyowner = property(lambda self: self.context.copyowner)
+    size_thresholds = property(lambda self: self.context.size_thresholds)
+    text_subs = property(lambda self: self.context.text_subs)
+    rich_fields = property(lambda self: self.context.rich_fields)
+    substituter = property(lambda self: self.context.substituter)
+    process_cache = property(lambda self: self.context.process_cache)
+
+    def get(self, field, default=None):
+        """A field's value, or default if the card doesn't have the field"""
+        i = self.layout.get(field)
+        if i is None:
+            return default
+        return self.values[i]
+
+    def copies(self):
+        """How many times to print this card, from the Copies field"""
+        s_copies = self.get("Copies", 1)
+        try:
+            copies = int(s_copies)
+        except ValueError:
+            copies = 1
+        if copies < 0:
+            copies = 1
+        return copies
 
     def process_split_fields(self):
-        if "Traits" in self.fields.keys():
-            self.traits = [t.strip() for t in self.fields["Traits"].split(",")]
+        if "Traits" in self.layout:
+            self.traits = tuple(t.strip() for t in self.get("Traits").split(","))
         else:
-            self.traits = []
+            self.traits = ()
 
     def process(self, text, context="*"):
-        #save the text length before we html-ify it
-        text = str(text)
-        textlen = len(text)
-        text = escape_html(text)
-
-        if context in self.rich_fields:
-            for pattern, replacement in self.text_subs.items():
-                text = re.sub(pattern, replacement, text)
+        """A field's HTML and its text size class"""
+        return self.markup(text, context), self.size_text(len(str(text)), context)
 
-        text = text.replace("\\n","<br />\n")
-        textsize = self.size_text(textlen, context)
-        return text, textsize
+    def markup(self, text, context="*"):
+        """A field's HTML, with substitutions if it's a rich field"""
+        text = str(text)
+        rich = self.schema.column(context).rich
+        process_cache = self.context.process_cache
+        if process_cache is not None:
+            key = (text, context, rich)
+            html = process_cache.get(key)
+            if html is not None:
+                return html
+
+        html = escape_html(text)
+        if rich:
+            html = self.context.substituter.sub(html)
+
+        html = html.replace("\\n","<br />\n")
+        if process_cache is not None:
+            process_cache.put(key, html)
+        return html
+
+    def field_size(self, i, field):
+        """Size class of the value in column i, worked out ahead if we can"""
+        if self.sizes is not None:
+            return self.sizes[i]
+        return self.size_text(len(str(self.values[i])), field)
 
     def size_text(self, textlen, context="*"):
-        if context not in self.size_thresholds:
-            context = "*"
-
-        mediumcutoff, smallcutoff = self.size_thresholds[context]
+        mediumcutoff, smallcutoff = self.schema.column(context).thresholds
         if textlen > smallcutoff:
             return "smalltext"
         elif textlen > mediumcutoff:
@@ -171,123 +696,271 @@ class Card:
     def art_spacer_html(self):
         return "<div class='artspacer'>&nbsp;</div>\n"
 
-    def textbox_html(self):
-        if "Text" in self.fields.keys():
-            text = self.fields["Text"].strip()
+    @staticmethod
+    def textbox_texts(values, layout):
+        """Text and Flavor Text from a row, or "-" for the ones it lacks"""
+        if "Text" in layout:
+            text = str(values[layout["Text"]]).strip()
         else:
             text = "-"
-        if "Flavor Text" in self.fields.keys():
-            flavor_text = self.fields["Flavor Text"].strip()
+        if "Flavor Text" in layout:
+            flavor_text = str(values[layout["Flavor Text"]]).strip()
         else:
             flavor_text = "-"
+        return text, flavor_text
 
-        # Process, escape HTML, figure out combined text length for font sizing
-        _, fontsize = self.process(text+flavor_text, context="Text")
-        text, _ = self.process(text, "Text")
-        flavor_text, _ = self.process(flavor_text, context="Flavor Text")
+    def textbox_contents(self):
+        """Processed Text and Flavor Text, with their shared font size"""
+        text, flavor_text = self.textbox_texts(self.values, self.layout)
+
+        # Font sizing goes by the combined text length
+        fontsize = self.text_size
+        if fontsize is None:
+            fontsize = self.size_text(len(text+flavor_text), "Text")
+        text = self.markup(text, "Text")
+        flavor_text = self.markup(flavor_text, context="Flavor Text")
+        return text, flavor_text, fontsize
+
+    def textbox_html(self):
+        text, flavor_text, fontsize = self.textbox_contents()
 
         if (text == "-" or not text) and (flavor_text == "-" or not flavor_text):
-            s = "<div class='empty text_area'>\n"
+            parts = ["<div class='empty text_area'>\n"]
         else:
-            s = "<div class='text_area %s'>\n" % fontsize
+            parts = ["<div class='text_area %s'>\n" % fontsize]
 
-        s += "<div class='text field %s'>\n" % fontsize
+        parts.append("<div class='text field %s'>\n" % fontsize)
         if text == "-" or not text:
-            s += "&nbsp;\n"
+            parts.append("&nbsp;\n")
         else:
-            s += text + "\n"
-        s += "</div>\n"#/.text.field
+            parts.append(text + "\n")
+        parts.append("</div>\n")#/.text.field
 
         if flavor_text and flavor_text != "-":
-            s += "<div class='flavor_text field %s'>\n" % fontsize
-            s += flavor_text + "\n"
-            s += "</div>\n"#/.flavor_text.field
+            parts.append("<div class='flavor_text field %s'>\n" % fontsize)
+            parts.append(flavor_text + "\n")
+            parts.append("</div>\n")#/.flavor_text.field
 
-        s += "</div>\n"#/.text_area
-        return s
+        parts.append("</div>\n")#/.text_area
+        return "".join(parts)
+
+    def field_html(self, field):
+        i = self.layout.get(field)
+        if i is None:
+            return ""
+        return ("<div class='field %s %s'>\n"
+                "<span class='fieldname'>%s:</span>\n"
+                "%s\n"
+                "</div>\n") % (self.schema.column(field).slug,
+                               self.field_size(i, field), field,
+                               self.markup(self.values[i], context=field))#/.field
+
+    def field_text(self, field):
+        """Just the processed text of a field, or "" if the card lacks it"""
+        i = self.layout.get(field)
+        if i is None:
+            return ""
+        return self.markup(self.values[i], context=field)
 
     def fields_html(self):
-        s = "<div class='fields_area'>\n"
-        textbox_printed = False
-        for field, val in self.fields.items():
-            if field in SPECIAL_FIELDS:
+        parts = ["<div class='fields_area'>\n"]
+        for field in self.layout:
+            if self.schema.column(field).special:
                 #These fields are explicitly printed elsewhere, so skip them
                 continue
-            field_text, fontsize = self.process(val, context=field)
-            s += "<div class='field %s %s'>\n" % (slug_text(field), fontsize)
-            s += "<span class='fieldname'>%s:</span>\n" % field
-            s += "%s\n" % field_text
-            s += "</div>\n"#/.field
-        s += "</div>"#/.fields_area
-        return s
+            parts.append(self.field_html(field))
+        parts.append("</div>")#/.fields_area
+        return "".join(parts)
 
     def traits_html(self):
-        s = ""
-        if "Traits" in self.fields.keys():
-            s += "<div class='traits_area field'>\n"
-            for trait in self.traits:
-                trait_text, fontsize = self.process(trait, context="Traits")
-                s += "<span class='trait %s %s'>%s</span>\n" % (slug_text(trait), fontsize, trait_text)
-            s += "</div>"#/.traits
-        return s
+        if "Traits" not in self.layout:
+            return ""
+        parts = ["<div class='traits_area field'>\n"]
+        for trait in self.traits:
+            trait_text, fontsize = self.process(trait, context="Traits")
+            parts.append("<span class='trait %s %s'>%s</span>\n" % (slug_text(trait), fontsize, trait_text))
+        parts.append("</div>")#/.traits
+        return "".join(parts)
 
     def title_area_html(self):
-        s = ""
-        if "Name" in self.fields.keys():
-            name_text, fontsize = self.process(self.fields["Name"], "Name")
-            s += "<div class='title_area'>\n"
-            s += "<div class='name field %s'>%s</div>\n" % (fontsize, name_text)
-            s += "</div>\n"#/.title_area
-        return s
+        i = self.layout.get("Name")
+        if i is None:
+            return ""
+        name_text = self.markup(self.values[i], "Name")
+        fontsize = self.field_size(i, "Name")
+        return ("<div class='title_area'>\n"
+                "<div class='name field %s'>%s</div>\n"
+                "</div>\n") % (fontsize, name_text)#/.title_area
 
     def cardtype_area_html(self):
         if self.cardtype == "-":
             return ""
-        s = "<div class='cardtype_area'>\n"
-        s += "<div class='cardtype_label'>%s</div>\n" % self.cardtype
-        s += "</div>"#/.cardtype_area
-        return s
+        return ("<div class='cardtype_area'>\n"
+                "<div class='cardtype_label'>%s</div>\n"
+                "</div>") % self.cardtype#/.cardtype_area
 
-    def copyline_html(self):
-        if "Version" in self.fields.keys():
-            vstring = "(v%s) " % self.fields["Version"]
+    def copyline_text(self):
+        if "Version" in self.layout:
+            vstring = "(v%s) " % self.get("Version")
         else:
             vstring = ""
-        s = "<div class='copyline'>%s©%s %s</div>\n" % (vstring, self.copyowner, strftime("%Y"))
-        return s
+        return "%s©%s %s" % (vstring, self.context.copyowner, self.schema.year)
+
+    def copyline_html(self):
+        return "<div class='copyline'>%s</div>\n" % self.copyline_text()
 
     def numbering_html(self):
-        s = ""
-        s += "<div class='number'>"+str(self.number)+"</div>\n"
-        s += "<div class='typenumber'>"+str(self.type_number)+"</div>\n"
-        return s
+        if self.number is None:
+            return ""
+        return ("<div class='number'>%s</div>\n"
+                "<div class='typenumber'>%s</div>\n") % (self.number, self.type_number)
 
     def html(self):
-        s = "<div class='%s card'>\n" % (slug_text(self.cardtype))
+        return (self.schema.template or DEFAULT_CARD_TEMPLATE)(self)
 
-        s += self.art_spacer_html()
+    def face(self):
+        """
+        The card's contents as plain text with their size classes, for
+        drawing the card as an image (see raster.py).
+        """
+        name = None
+        i = self.layout.get("Name")
+        if i is not None:
+            name_text = self.markup(self.values[i], "Name")
+            name = (html_to_text(name_text), self.field_size(i, "Name"))
+
+        fields = []
+        for field, i in self.layout.items():
+            if self.schema.column(field).special:
+                continue
+            field_text = self.markup(self.values[i], context=field)
+            fields.append((str(field), html_to_text(field_text), self.field_size(i, field)))
 
-        s += self.title_area_html()
-        s += self.cardtype_area_html()
+        text, flavor_text, fontsize = self.textbox_contents()
+        text = "" if text == "-" else html_to_text(text)
+        flavor_text = "" if flavor_text == "-" else html_to_text(flavor_text)
+        textbox = (text, flavor_text, fontsize) if text or flavor_text else None
 
-        s += "<div class='card_body_area'>\n"
-        s += self.fields_html()
-        s += self.textbox_html()
-        s += self.traits_html()
-        s += "</div>"#/.card_body_area
+        traits = []
+        if "Traits" in self.layout:
+            for trait in self.traits:
+                trait_text, fontsize = self.process(trait, context="Traits")
+                traits.append((html_to_text(trait_text), fontsize, trait_hsl(trait)))
+
+        return {
+            "cardtype": "" if self.cardtype == "-" else str(self.cardtype),
+            "name": name,
+            "fields": fields,
+            "text": textbox,
+            "traits": traits,
+            "number": self.number,
+            "copyline": self.copyline_text(),
+        }
 
-        if self.number is not None:
-            s += self.numbering_html()
+#What each slot in a card layout is filled with
+LAYOUT_SLOTS = {
+    "cardtype_slug": lambda card: card.schema.cardtype_slug,
+    "art_spacer": methodcaller("art_spacer_html"),
+    "title_area": methodcaller("title_area_html"),
+    "cardtype_area": methodcaller("cardtype_area_html"),
+    "fields": methodcaller("fields_html"),
+    "textbox": methodcaller("textbox_html"),
+    "traits": methodcaller("traits_html"),
+    "numbering": methodcaller("numbering_html"),
+    "copyline": methodcaller("copyline_html"),
+}
+#Slots for one field, like ${field:Cost}
+LAYOUT_FIELD_SLOTS = {
+    "field": lambda card, field: card.field_html(field),
+    "text": lambda card, field: card.field_text(field),
+}
 
-        s += self.copyline_html()
-        s += "</div>\n"
-        return s
+def compile_card_layout(text, name="layout"):
+    """Compile a card layout's text; raises LayoutError if it's malformed"""
+    return compile_layout(mark_card_root(text, name), LAYOUT_SLOTS,
+                          LAYOUT_FIELD_SLOTS, name)
+
+DEFAULT_CARD_TEMPLATE = compile_card_layout(DEFAULT_LAYOUT, "layout.html")
+
+#Compiled layout files by path, as (file state, text, template), so a
+# process building several decks only compiles each layout once
+_layout_files = {}
+
+def read_layout(path, name="layout"):
+    """Read and compile a layout file, reusing it until the file changes"""
+    state = file_state(path)
+    cached = _layout_files.get(path)
+    if cached and cached[0] == state:
+        return cached[1], cached[2]
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    template = compile_card_layout(text, name)
+    _layout_files[path] = (state, text, template)
+    return text, template
+
+def card_templates(layout_texts):
+    """Compile a dict of card types to layout texts"""
+    return {cardtype: compile_card_layout(text, cardtype)
+            for cardtype, text in layout_texts.items()}
+
+class ProfiledCard(Card):
+    """A Card that times each markup() call, for --profile"""
+    __slots__ = ()
+
+    def markup(self, text, context="*"):
+        return self.context.metrics.time_process(self, super().markup, text, context)
+
+#Run-wide settings for card rendering in a worker process, set by
+# init_render_worker() so they're sent to each worker once
+_worker = {}
+
+def init_render_worker(settings):
+    _worker.clear()
+    _worker["context"] = RenderContext(settings["copyowner"],
+            settings["size_thresholds"], settings["text_subs"],
+            settings["rich_fields"], process_cache=ProcessCache())
+    _worker["templates"] = card_templates(settings["layouts"])
+    _worker["schemas"] = {}
+
+def render_card_chunk(rows):
+    """
+    Render a list of (cardtype, keys, values, sizes, text_size, number,
+    type_number) rows in a worker process, returning their HTML in the
+    same order.
+    """
+    context = _worker["context"]
+    htmls = []
+    for cardtype, keys, values, sizes, text_size, number, type_number in rows:
+        schema = _worker["schemas"].get((cardtype, keys))
+        if schema is None:
+            templates = _worker["templates"]
+            schema = SheetSchema(cardtype, keys,
+                                 context.size_thresholds, context.rich_fields,
+                                 templates.get(cardtype, templates.get("*")))
+            _worker["schemas"][(cardtype, keys)] = schema
+        c = Card(schema=schema, row=values, context=context,
+                 sizes=sizes, text_size=text_size)
+        c.number = number
+        c.type_number = type_number
+        htmls.append(c.html())
+    return htmls
 
 class ProxyPrinter:
     def __init__(self, spreadsheet, copyowner=None, version=None, addcss=None,
                 defaultcss=True, text_subs={}, colorize=True, rich_fields=[],
-            addzipbutton=True, size_thresholds={}, base_url=""):
-        self.read_sheet(spreadsheet)
+            addzipbutton=True, size_thresholds={}, base_url="",
+            compact_copies=False, zip_scale=ZIP_SCALE,
+            zip_quality=DEFAULT_JPEG_QUALITY, layouts={},
+            process_cache_size=PROCESS_CACHE_SIZE,
+            cache_dir=None, cache_max_bytes=DEFAULT_CACHE_MAX_BYTES, jobs=1,
+            assets_dir=None, assets_url=None, metrics=None, progress=None):
+        # A Metrics object to record timings in, if profiling
+        self.metrics = metrics
+        # Called as progress(stage, done, total) as "sheets" are parsed and
+        # "cards" rendered; total is 0 if it isn't known yet
+        self.progress = progress
+        with self.phase("read_sheet"):
+            self.read_sheet(spreadsheet)
         self.copyowner = copyowner
         self.version = version
         self.addcss = addcss
@@ -298,26 +971,125 @@ class ProxyPrinter:
         self.addzipbutton = addzipbutton
         self.size_thresholds = size_thresholds
         self.base_url = base_url
+        self.compact_copies = compact_copies
+        self.zip_scale = zip_scale
+        self.zip_quality = zip_quality
+        # Card types mapped to layout files; "*" for all other types
+        self.layouts = layouts
+        self.jobs = jobs
+        # With assets_dir, CSS, scripts and the TTS JSON go in separate
+        # files there, linked from the page through assets_url
+        self.assets_dir = assets_dir
+        if assets_url is None and assets_dir:
+            assets_url = asset_url(assets_dir, os.curdir)
+        self.assets_url = assets_url
         self.counter = CardCounter()
+        self.process_cache = ProcessCache(process_cache_size)
+        if cache_dir:
+            self.fragment_cache = FragmentCache(cache_dir, cache_max_bytes)
+        else:
+            self.fragment_cache = None
 
-        self.parse_settings()
-        self.parse_sheet_cards()
+        with self.phase("parse_settings"):
+            pages = self.read_settings()
+        with self.phase("parse_sheet_cards"):
+            self.parse_sheet_cards(pages)
 
     def read_sheet(self, ods_file):
-        self.sheet = pyexcel.get_data(ods_file)
+        """
+        Load the spreadsheet from a filename or an already-parsed workbook.
+        """
+        if isinstance(ods_file, ParsedWorkbook):
+            self.spreadsheet = ods_file.path
+            self.sheet = ods_file.refresh(self.progress).sheets
+        else:
+            self.spreadsheet = ods_file
+            # .ods files are parsed as they're read, not loaded whole up front
+            self.sheet = read_workbook(ods_file, lazy=True)
 
-    def parse_settings(self):
+    def css_file(self):
+        """The additional CSS file, if it's a path relative to the spreadsheet"""
+        if self.addcss:
+            css_path = os.path.join(os.path.dirname(self.spreadsheet), self.addcss)
+            if os.path.isfile(css_path):
+                return css_path
+        return None
+
+    def source_files(self):
+        """
+        Local files the output depends on: the spreadsheet, the additional
+        CSS file if it's a path relative to the spreadsheet, and the layouts.
+        """
+        files = [self.spreadsheet]
+        css_path = self.css_file()
+        if css_path:
+            files.append(css_path)
+        for layout_file in self.layouts.values():
+            path = self.layout_path(layout_file)
+            if os.path.isfile(path):
+                files.append(path)
+        return files
+
+    def layout_path(self, layout_file):
+        """Layout files are relative to the spreadsheet's folder"""
+        return os.path.join(os.path.dirname(self.spreadsheet), layout_file)
+
+    def read_settings(self):
+        """
+        Read sheets up to the settings sheet, wherever it is, and apply the
+        settings. Returns the pages still to build cards from: the card
+        sheets before the settings, with their rows read into lists, then
+        the sheets after it, so a streamed workbook is only read once.
+        """
+        pages = iter(sheet_pages(self.sheet))
+        before = []
+        settings_sheet = None
+        for sheetname, sheetdata in pages:
+            if sheetname == SETTING_SHEET_LABEL:
+                settings_sheet = list(sheetdata)
+                break
+            # Cards can't be built until the settings are known
+            before.append((sheetname, list(sheetdata)))
+        self.parse_settings(settings_sheet)
+        return chain(before, pages)
+
+    def parse_settings(self, settings_sheet=None):
+        """Apply the settings sheet's rows (None if there isn't one)"""
+        self.read_settings_sheet(settings_sheet)
+        # Files without a settings sheet still need the defaults
+        if not self.size_thresholds:
+            self.size_thresholds = dict(DEFAULT_TEXT_SIZING_THRESHOLDS)
+        if not self.rich_fields:
+            self.rich_fields = DEFAULT_RICH_FIELDS
+        self.substituter = TextSubstituter(self.text_subs)
+        if self.metrics:
+            self.substituter = TimedSubstituter(self.substituter, self.metrics)
+        self.load_layouts()
+
+    def load_layouts(self):
+        """Read and compile each card type's layout file, once per run"""
+        self.layout_texts = {}
+        self.templates = {}
+        for cardtype, layout_file in self.layouts.items():
+            try:
+                text, template = read_layout(self.layout_path(layout_file), layout_file)
+            except (OSError, LayoutError) as e:
+                logger.warning("Layout for %s: %s; using the default" % (cardtype, e))
+                continue
+            self.layout_texts[cardtype] = text
+            self.templates[cardtype] = template
+
+    def read_settings_sheet(self, settings_sheet):
         self.skip_sheets = [SETTING_SHEET_LABEL]
-        if type(self.sheet) != OrderedDict:
+        if type(self.sheet) == list:
             logger.info("Single page sheet (%s); no settings pulled"%type(self.sheet))
             # Single page sheet; no custom settings defined
             return
-        elif SETTING_SHEET_LABEL not in self.sheet.keys():
+
+        if settings_sheet is None:
             logger.info("No settings sheet found")
             # No settings sheet; no custom settings defined
             return
-
-        settings_sheet = self.sheet[SETTING_SHEET_LABEL]
         if len(settings_sheet) < 2:
             logger.info("Less than 2 rows in settings sheet")
             return
@@ -344,7 +1116,7 @@ class ProxyPrinter:
 
         # Setting: Text Size Thresholds
         if not self.size_thresholds:
-            self.size_thresholds = DEFAULT_TEXT_SIZING_THRESHOLDS
+            self.size_thresholds = dict(DEFAULT_TEXT_SIZING_THRESHOLDS)
             try:
                 pos_textsizefield = setting_keys.index(SETTING_LABEL_TEXTSIZEFIELD)
                 pos_textsizemed = setting_keys.index(SETTING_LABEL_TEXTSIZETHRESHOLD1)
@@ -367,11 +1139,16 @@ class ProxyPrinter:
                         logger.debug("Text Thresholds: Skipping row %s"%row)
                         continue
 
-                    if len(row) > pos_textsizemed and row[pos_textsizemed]:
-                        threshold_med = row[pos_textsizemed]
+                    # Text-based formats like CSV give the numbers as strings
+                    try:
+                        if len(row) > pos_textsizemed and row[pos_textsizemed]:
+                            threshold_med = float(row[pos_textsizemed])
 
-                    if len(row) > pos_textsizesmall and row[pos_textsizesmall]:
-                        threshold_sm = row[pos_textsizesmall]
+                        if len(row) > pos_textsizesmall and row[pos_textsizesmall]:
+                            threshold_sm = float(row[pos_textsizesmall])
+                    except ValueError:
+                        logger.warning("Text Thresholds: Not a number in row %s"%row)
+                        continue
 
                     self.size_thresholds[textfieldname] = (threshold_med, threshold_sm)
 
@@ -415,6 +1192,27 @@ class ProxyPrinter:
                         text_subs[pattern] = repl
                 self.text_subs = text_subs
         
+        # Setting: Layouts (card type and layout file in each row)
+        try:
+            pos_layoutcardtype = setting_keys.index(SETTING_LABEL_LAYOUTCARDTYPE)
+            pos_layoutfile = setting_keys.index(SETTING_LABEL_LAYOUTFILE)
+            got_layout_settings = True
+        except ValueError:
+            logger.info("Failed to get layout settings")
+            got_layout_settings = False
+
+        if got_layout_settings:
+            layouts = {}
+            for row in settings_sheet[1:]:
+                if (len(row) > pos_layoutcardtype
+                        and row[pos_layoutcardtype]
+                        and len(row) > pos_layoutfile
+                        and row[pos_layoutfile]):
+                    layouts[str(row[pos_layoutcardtype])] = str(row[pos_layoutfile])
+            # Layouts given as arguments take precedence
+            layouts.update(self.layouts)
+            self.layouts = layouts
+
         if not self.base_url:
             try:
                 self.base_url = setting_simple_values[
@@ -425,78 +1223,418 @@ class ProxyPrinter:
                 logger.info("Failed to get Base URL from settings")
                 
 
-    def parse_sheet_cards(self):
+    def parse_sheet_cards(self, pages=None):
+        """Build the cards from pages, or all of the spreadsheet's sheets"""
         self.cards = []
-        # A single-sheet file comes back as a 2d array;
-        # a multi-sheet file comes back as an OrderedDict of sheet names to 2d arrays
-        if type(self.sheet) == OrderedDict:
-            pages = self.sheet.items()
-        else:
-            pages = {"-": self.sheet}.items()
-        for sheetname, sheetdata in pages:
+        context = self.render_context = RenderContext(self.copyowner,
+                self.size_thresholds, self.text_subs, self.rich_fields,
+                self.substituter, self.process_cache, self.metrics)
+        card_class = ProfiledCard if self.metrics else Card
+        all_pages = sheet_pages(self.sheet)
+        # Streamed workbooks don't know how many sheets they have up front
+        total = len(all_pages) if hasattr(all_pages, "__len__") else 0
+        if pages is None:
+            pages = all_pages
+        for n, (sheetname, sheetdata) in enumerate(pages, start=1):
+            self.report_progress("sheets", n, total)
             if sheetname == SETTING_SHEET_LABEL:
                 #This sheet is settings, not cards; skip
                 continue
             cardtype = sheetname
-            cardrows = twod_array_to_ordered_dict_array(sheetdata)
-            for row in cardrows:
-                if self.version:
-                    #Ignore cards not from this version
-                    if "Version" not in row or str(row["Version"]) != self.version:
-                        continue
-                c = Card(cardtype=sheetname, fields=row,
-                         copyowner=self.copyowner,
-                         size_thresholds=self.size_thresholds,
-                         text_subs=self.text_subs,
-                         rich_fields=self.rich_fields,
-                         counter=self.counter)
+            # Rows may be streamed from the file, so build cards as they come
+            rows = iter(sheetdata)
+            keys = next(rows, None)
+            if type(keys) != list:
+                logger.warning("Not a 2d array?")
+                continue
+            schema = SheetSchema(cardtype, keys,
+                                 self.size_thresholds, self.rich_fields,
+                                 self.template_for(cardtype))
+            rows = [tuple(map(intify, row[:len(keys)]))
+                    for row in self.wanted_rows(rows, schema)]
+            # Size all of a column's text at once
+            sizes = row_size_classes(rows, [schema.column(k).thresholds for k in keys])
+            text_sizes = self.textbox_sizes(rows, schema)
+            for values, row_sizes, text_size in zip(rows, sizes, text_sizes):
+                c = card_class(schema=schema, row=values, context=context,
+                               counter=self.counter, sizes=row_sizes,
+                               text_size=text_size)
                 self.cards.append(c)
 
-    def trait_colors_css(self):
+    def template_for(self, cardtype):
+        """The compiled layout for a card type, or None for the default"""
+        return self.templates.get(cardtype, self.templates.get("*"))
+
+    def wanted_rows(self, rows, schema):
+        """The rows of a sheet that should become cards"""
+        keys = schema.keys
+        for row in rows:
+            if not row: #skip empty rows
+                continue
+            if len(keys) != len(row):
+                logger.info("Mismatched number of fields in row: %s" % row)
+            if self.version:
+                #Ignore cards not from this version
+                i = schema.layout(min(len(row), len(keys))).get("Version")
+                if i is None or str(row[i]) != self.version:
+                    continue
+            yield row
+
+    @staticmethod
+    def textbox_sizes(rows, schema):
+        """Size class of each row's text box, from its combined text length"""
+        lengths = []
+        for values in rows:
+            text, flavor_text = Card.textbox_texts(values, schema.layout(len(values)))
+            lengths.append(len(text+flavor_text))
+        return size_classes(lengths, schema.column("Text").thresholds)
+
+    def trait_colors_css(self, cards=None):
         trait_keys = set()
-        for c in self.cards:
+        for c in self.cards if cards is None else cards:
             trait_keys.update(c.traits)
 
-        def int_from_string_hash(s, min_i, max_i, encoding="utf-8"):
-            m = hashlib.md5(bytes(s, encoding))
-            return (int(m.hexdigest(), 16) % (max_i-min_i)) + min_i
         s = ""
-        for t in trait_keys:
-            hue = int_from_string_hash(t,0,360)#randint(0,360)
-            sat = int_from_string_hash(t,40,100)#randint(40,100)
-            lit = 85
+        # Sorted so the same traits always give the same stylesheet
+        for t in sorted(trait_keys):
+            hue, sat, lit = trait_hsl(t)
             s += ".trait.%s {background-color: hsl(%d, %d%%, %d%%);}\n" % (slug_text(t), hue, sat, lit)
 
         return s
 
-    def render_all(self):
-        s = "<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\" />\n"
+    def head_html(self, title=None, trait_css=None, style=None):
+        head = ["<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\" />\n"]
+        if title:
+            head.append("<title>%s</title>\n" % escape_html(title))
         if self.defaultcss:
-            s += "<style type='text/css'>%s</style>" % DEFAULT_STYLE
+            if self.assets_dir:
+                head.append("<link rel='stylesheet' href='%s' />" %
+                            self.asset("proxyprinter", "css", DEFAULT_STYLE))
+            else:
+                head.append("<style type='text/css'>%s</style>" % DEFAULT_STYLE)
         #randomly colorize traits
         if self.colorize:
-            s += "<style type='text/css'>%s</style>" % self.trait_colors_css()
+            if trait_css is None:
+                with self.phase("trait_colors_css"):
+                    trait_css = self.trait_colors_css()
+            if self.assets_dir:
+                head.append("<link rel='stylesheet' href='%s' />" %
+                            self.asset("traits", "css", trait_css))
+            else:
+                head.append("<style type='text/css'>%s</style>" % trait_css)
         if self.addcss:
-            s += "<link rel='stylesheet' href='%s' />" % self.addcss
-        s += "</head><body>"
-
-        for c in self.cards:
-            s_copies = c.fields.get("Copies", 1)
-            try:
-                copies = int(s_copies)
-            except ValueError:
-                copies = 1
-            if copies < 0:
-                copies = 1
-            s += c.html()*copies
+            head.append("<link rel='stylesheet' href='%s' />" % self.addcss)
+        if style:
+            head.append("<style type='text/css'>%s</style>" % style)
+        head.append("</head><body>")
+        return "".join(head)
 
+    def card_markup(self, card_id, card, card_html):
+        """
+        A rendered card with all its copies. Cards are numbered as in
+        tts(), so copies share a number.
+        """
+        card_html = tag_card_html(card_html, card_id)
+        copies = card.copies()
+        if self.compact_copies and copies > 1:
+            # Print the card once and have the browser clone the rest
+            return card_html + ("<template class='card_copies' data-copies='%d'>%s</template>\n" %
+                                (copies-1, card_html))
+        return card_html*copies
+
+    def templated(self, card):
+        return self.compact_copies and card.copies() > 1
+
+    def footer_html(self, templated):
+        footer = []
+        if templated:
+            footer.append(COPIES_CODE)
         if self.addzipbutton:
-            s += ZIP_CODE
-            s += '<div style="display:none;" id="tts_json">'+escape_html(self.tts())+'</div>'
-        s += "</body></html>"
-        return s
+            with self.phase("tts"):
+                tts_json = self.tts()
+            zip_settings = {"scale": self.zip_scale,
+                    "quality": self.zip_quality/100, "workers": ZIP_WORKERS}
+            if self.assets_dir:
+                zip_settings["tts_json"] = self.asset("tts", "json", tts_json)
+            footer.append(ZIP_SETTINGS_CODE % json.dumps(zip_settings))
+            if self.assets_dir:
+                footer.append(ZIP_LIBRARIES)
+                footer.append("<script src='%s'></script>\n" % self.asset("zipcode", "js", ZIP_SCRIPT))
+                footer.append(ZIP_BUTTON)
+            else:
+                footer.append(ZIP_CODE)
+                footer.append('<div style="display:none;" id="tts_json">'+escape_html(tts_json)+'</div>')
+        footer.append("</body></html>")
+        return "".join(footer)
+
+    def start_render(self):
+        if self.fragment_cache:
+            self.fingerprint = settings_fingerprint(self.text_subs,
+                    self.rich_fields, self.size_thresholds, self.copyowner,
+                    self.layout_texts)
+
+    def finish_render(self):
+        if self.fragment_cache:
+            self.fragment_cache.evict()
+
+    def render_iter(self):
+        """
+        Generate the output HTML in pieces: the document head, then each
+        card's markup, then the footer. Joining the pieces gives the same
+        document as render_all().
+        """
+        yield self.head_html()
+        self.start_render()
+
+        templated = False
+        for card_id, (c, card_html) in enumerate(zip(self.cards, self.iter_cards_html()), start=1):
+            yield self.card_markup(card_id, c, card_html)
+            templated = templated or self.templated(c)
+            if card_id % PROGRESS_INTERVAL == 0:
+                self.report_progress("cards", card_id, len(self.cards))
+        self.report_progress("cards", len(self.cards), len(self.cards))
+
+        yield self.footer_html(templated)
+        self.finish_render()
+
+    def page_ranges(self, per_page=DEFAULT_PER_PAGE, by_sheet=False):
+        """
+        Split self.cards into pages: runs of per_page cards, or one page per
+        card type with by_sheet. Returns a list of (title, start, stop).
+        """
+        pages = []
+        if by_sheet:
+            start = 0
+            for i in range(1, len(self.cards)+1):
+                if i == len(self.cards) or self.cards[i].cardtype != self.cards[start].cardtype:
+                    pages.append((self.cards[start].cardtype, start, i))
+                    start = i
+        else:
+            per_page = max(1, per_page)
+            for start in range(0, len(self.cards), per_page):
+                stop = min(start+per_page, len(self.cards))
+                pages.append(("Cards %d-%d" % (start+1, stop), start, stop))
+        return pages
+
+    def render_pages(self, directory, per_page=DEFAULT_PER_PAGE, by_sheet=False,
+                     compress=False):
+        """
+        Write the cards to a series of HTML pages in directory, with an
+        index.html linking to them. Each page is a complete document that
+        can be printed by itself, and cards keep their numbers from the
+        whole deck. Set assets_dir too so the pages share one copy of the
+        CSS and TTS JSON. Returns the paths of the pages, index first.
+        """
+        os.makedirs(directory, exist_ok=True)
+        pages = self.page_ranges(per_page, by_sheet)
+        trait_css = None
+        if self.colorize:
+            with self.phase("trait_colors_css"):
+                trait_css = self.trait_colors_css()
+        ext = ".html.gz" if compress else ".html"
+        self.start_render()
+
+        rendered = zip(self.cards, self.iter_cards_html())
+        paths = []
+        index = []
+        footers = {}
+        for n, (title, start, stop) in enumerate(pages, start=1):
+            fname = "page-%03d%s" % (n, ext)
+            index.append((fname, title, stop-start))
+            path = os.path.join(directory, fname)
+            with open_output(path, compress=compress) as f:
+                f.write(self.head_html(title, trait_css, PAGE_STYLE))
+                templated = False
+                for card_id in range(start+1, stop+1):
+                    c, card_html = next(rendered)
+                    f.write(self.card_markup(card_id, c, card_html))
+                    templated = templated or self.templated(c)
+                if templated not in footers:
+                    footers[templated] = self.footer_html(templated)
+                f.write(footers[templated])
+            paths.append(path)
+        self.finish_render()
+
+        title = os.path.splitext(os.path.basename(self.spreadsheet.rstrip(os.sep)))[0]
+        index_path = os.path.join(directory, "index"+ext)
+        with open_output(index_path, compress=compress) as f:
+            f.write("<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\" />\n")
+            f.write("<title>%s</title>\n</head><body>\n" % escape_html(title))
+            f.write("<h1>%s</h1>\n<ol class='pages'>\n" % escape_html(title))
+            for fname, page_title, count in index:
+                f.write("<li><a href='%s'>%s</a> (%d cards)</li>\n" %
+                        (escape_html(fname), escape_html(page_title), count))
+            f.write("</ol>\n</body></html>\n")
+        return [index_path] + paths
+
+    def asset(self, name, extension, content):
+        """Write a content-hashed file to assets_dir and return its URL"""
+        fname = write_asset(self.assets_dir, name, extension, content)
+        return escape_html(self.assets_url + fname)
+
+    def iter_cards_html(self):
+        """Render self.cards in order, across self.jobs processes if > 1"""
+        if self.jobs > 1 and len(self.cards) > 1:
+            rendered = self.parallel_cards_html()
+            if self.metrics:
+                # Cards are timed as a whole, since they're rendered elsewhere
+                rendered = self.metrics.timed_iter("render_cards", rendered)
+            yield from rendered
+        elif self.metrics:
+            for c in self.cards:
+                yield self.metrics.card_html(c, self.card_html)
+        else:
+            for c in self.cards:
+                yield self.card_html(c)
+
+    def report_progress(self, stage, done, total):
+        if self.progress:
+            self.progress(stage, done, total)
+
+    def phase(self, name):
+        """Context manager timing a phase of the build, if profiling"""
+        if self.metrics is None:
+            return NO_PHASE
+        return self.metrics.phase(name)
+
+    def record_counters(self):
+        """Copy cache statistics and such into the metrics, if profiling"""
+        if self.metrics is None:
+            return
+        self.metrics.count("cards", len(self.cards))
+        self.metrics.count("jobs", self.jobs)
+        self.metrics.count("process_cache", self.process_cache.stats())
+        if self.fragment_cache:
+            self.metrics.count("fragment_cache", self.fragment_cache.stats())
+
+    def parallel_cards_html(self):
+        # Cards already know their numbers, so they can be rendered in any
+        # process; only cards missing from the fragment cache are sent out.
+        cached = {}
+        keys = {}
+        if self.fragment_cache:
+            for i, c in enumerate(self.cards):
+                keys[i] = self.fragment_cache.card_key(c, self.fingerprint)
+                html = self.fragment_cache.get(keys[i])
+                if html is not None:
+                    cached[i] = html
+        todo = [(c.cardtype, c.schema.keys, c.values, c.sizes, c.text_size,
+                 c.number, c.type_number)
+                for i, c in enumerate(self.cards) if i not in cached]
+        chunksize = max(1, min(RENDER_CHUNK_SIZE, len(todo)//(self.jobs*4)))
+        chunks = [todo[i:i+chunksize] for i in range(0, len(todo), chunksize)]
+
+        settings = {
+            "text_subs": self.text_subs,
+            "rich_fields": self.rich_fields,
+            "size_thresholds": self.size_thresholds,
+            "copyowner": self.copyowner,
+            "layouts": self.layout_texts,
+        }
+        with ProcessPoolExecutor(max_workers=self.jobs,
+                                 initializer=init_render_worker,
+                                 initargs=(settings,)) as executor:
+            rendered = chain.from_iterable(executor.map(render_card_chunk, chunks))
+            for i in range(len(self.cards)):
+                if i in cached:
+                    yield cached[i]
+                    continue
+                html = next(rendered)
+                if self.fragment_cache:
+                    self.fragment_cache.put(keys[i], html)
+                yield html
+
+    def card_html(self, card):
+        """Render one card, reusing the fragment cache if there is one"""
+        if not self.fragment_cache:
+            return card.html()
+        key = self.fragment_cache.card_key(card, self.fingerprint)
+        html = self.fragment_cache.get(key)
+        if html is None:
+            html = card.html()
+            self.fragment_cache.put(key, html)
+        return html
+
+    def render_all(self):
+        return "".join(self.render_iter())
+
+    def card_preview_html(self, cardtype, index):
+        """
+        A page showing one card, from row index (counting from 0 after
+        the field names) of the cardtype sheet, rendered with the current
+        settings. Only that card is built, so it's quick enough to redo
+        whenever a setting changes.
+        """
+        # Look up just this sheet, which a lazily read .ods parses on its own
+        if type(self.sheet) == list:
+            if cardtype != "-":
+                raise KeyError(cardtype)
+            rows = self.sheet
+        else:
+            rows = self.sheet[cardtype]
+        keys = rows[0]
+        context = RenderContext(self.copyowner, self.size_thresholds,
+                                self.text_subs, self.rich_fields)
+        schema = SheetSchema(cardtype, keys, self.size_thresholds,
+                             self.rich_fields, self.template_for(cardtype))
+        card = Card(schema=schema, row=[intify(v) for v in rows[index+1]],
+                    context=context)
+        return "".join([self.head_html(trait_css=self.trait_colors_css([card])),
+                        card.html(), "</body></html>"])
+
+    def render_file(self, path, compress=False):
+        """Render to the file at path, replacing it only once it's complete"""
+        write_output(path, self.render_to, compress)
+
+    def render_to(self, fileobj, buffer_size=OUTPUT_BUFFER_SIZE):
+        """
+        Write the output HTML to an open text file as it's rendered, holding
+        at most about buffer_size characters in memory between writes.
+        """
+        buf = []
+        buffered = 0
+        for chunk in self.render_iter():
+            buf.append(chunk)
+            buffered += len(chunk)
+            if buffered >= buffer_size:
+                fileobj.write("".join(buf))
+                buf = []
+                buffered = 0
+        if buf:
+            fileobj.write("".join(buf))
+        fileobj.flush()
+
+    def render_images(self, directory, dpi=DEFAULT_DPI,
+                      quality=DEFAULT_JPEG_QUALITY, image_format="jpg"):
+        """
+        Draw each card as an image file in directory, numbered from 1 in the
+        same order as the cards in tts(). Requires Pillow.
+        """
+        faces = [c.face() for c in self.cards]
+        return save_faces(faces, directory, dpi=dpi, quality=quality,
+                          image_format=image_format, processes=self.jobs)
 
-    def tts(self): #TODO: base_url
+    def render_tts_atlas(self, directory, dpi=DEFAULT_DPI,
+                         quality=DEFAULT_JPEG_QUALITY, name="deck"):
+        """
+        Draw the cards into Tabletop Simulator deck images in directory,
+        along with a card back and name.json, the matching tts(atlas=True)
+        object. Requires Pillow. Returns the paths of the deck images.
+        """
+        faces = [c.face() for c in self.cards]
+        paths = save_atlases(faces, directory, dpi=dpi, quality=quality,
+                             processes=self.jobs, back_label=self.copyowner or "")
+        with open(os.path.join(directory, name+".json"), "w", encoding="utf-8") as f:
+            f.write(self.tts(atlas=True))
+        return paths
+
+    def tts(self, atlas=False): #TODO: base_url
+        """
+        Tabletop Simulator saved object for the deck. By default each card
+        has its own image, as from render_images(); with atlas, cards are
+        read from the deck images of render_tts_atlas() and extra Copies
+        of a card reuse its image.
+        """
         DEFAULT_TRANSFORM = {
             "posX": 0,
             "posY": 0,
@@ -513,23 +1651,48 @@ class ProxyPrinter:
         deck_ids = []
         custom_deck = {}
 
-        c_id = 0
-        for card in self.cards:
-            c_id += 1
-            contained_objs.append({
-                "CardID": c_id*100,
-                "Name": "Card",
-                "Nickname": card.fields.get("Name", ""),
-                "Transform": DEFAULT_TRANSFORM
-            })
-            deck_ids.append(c_id*100)
-            custom_deck[str(c_id)] = {
-                "FaceURL": self.base_url+str(c_id)+".jpg",
-                "BackURL": self.base_url+"back.jpg",
-                "NumHeight": 1,
-                "NumWidth": 1,
-                "BackIsHidden": True
-            }
+        if atlas:
+            # Cards packed into deck images by save_atlases(); each copy of
+            # a card points to the same spot in the same image
+            for i, card in enumerate(self.cards):
+                deck, index = divmod(i, ATLAS_SIZE)
+                deck += 1
+                card_id = deck*100 + index
+                for copy in range(card.copies()):
+                    contained_objs.append({
+                        "CardID": card_id,
+                        "Name": "Card",
+                        "Nickname": card.fields.get("Name", ""),
+                        "Transform": DEFAULT_TRANSFORM
+                    })
+                    deck_ids.append(card_id)
+                if str(deck) not in custom_deck:
+                    columns, rows = atlas_grid(min(ATLAS_SIZE, len(self.cards)-i))
+                    custom_deck[str(deck)] = {
+                        "FaceURL": self.base_url+"deck%d.jpg" % deck,
+                        "BackURL": self.base_url+"back.jpg",
+                        "NumHeight": rows,
+                        "NumWidth": columns,
+                        "BackIsHidden": True
+                    }
+        else:
+            c_id = 0
+            for card in self.cards:
+                c_id += 1
+                contained_objs.append({
+                    "CardID": c_id*100,
+                    "Name": "Card",
+                    "Nickname": card.fields.get("Name", ""),
+                    "Transform": DEFAULT_TRANSFORM
+                })
+                deck_ids.append(c_id*100)
+                custom_deck[str(c_id)] = {
+                    "FaceURL": self.base_url+str(c_id)+".jpg",
+                    "BackURL": self.base_url+"back.jpg",
+                    "NumHeight": 1,
+                    "NumWidth": 1,
+                    "BackIsHidden": True
+                }
 
         j = {
             "ObjectStates": [{
@@ -547,7 +1710,7 @@ class SheetSettings(ProxyPrinter):
     Simplified version of the ProxyPrinter class just for loading settings from
     the spreadsheet.
     """
-    def __init__(self, spreadsheet):
+    def __init__(self, spreadsheet, progress=None):
         self.spreadsheet = spreadsheet
         self.copyowner = None
         self.version = None
@@ -559,16 +1722,24 @@ class SheetSettings(ProxyPrinter):
         self.addzipbutton = True
         self.size_thresholds = {}
         self.base_url = ""
+        self.compact_copies = False
+        self.zip_scale = ZIP_SCALE
+        self.zip_quality = DEFAULT_JPEG_QUALITY
+        self.layouts = {}
+        self.assets_dir = None
+        self.metrics = None
+        self.progress = progress
         
-        self.read_sheet(spreadsheet)
-        self.parse_settings()
+        self.workbook = ParsedWorkbook(spreadsheet, progress)
+        self.read_sheet(self.workbook)
+        self.read_settings()
     
     def __iter__(self):
         """
         By making this iterable we can unpack the settings with * and use them
         as args to a full ProxyPrinter.
         """
-        yield self.spreadsheet
+        yield self.workbook
         yield self.copyowner
         yield self.version
         yield self.addcss
@@ -578,54 +1749,381 @@ class SheetSettings(ProxyPrinter):
         yield self.rich_fields
         yield self.addzipbutton
         yield self.size_thresholds
+        yield self.base_url
+        yield self.compact_copies
+        yield self.zip_scale
+        yield self.zip_quality
+        yield self.layouts
     
     def all_fields(self):
         """
         Return a list of all field names (first row items) used in any tab 
         except the ProxyPrinterSettings sheet.
         """
-        fieldnames = set()
-        if type(self.sheet) == OrderedDict:
-            pages = self.sheet.items()
-        else:
-            pages = {"-": self.sheet}.items()
-        for sheetname, sheetdata in pages:
-            if sheetname == SETTING_SHEET_LABEL:
-                #This sheet is settings; skip
+        return self.workbook.refresh().field_names
+
+    def card_rows(self):
+        """
+        Card sheet names mapped to a list of (index, label) for each of
+        their cards, for picking one to preview.
+        """
+        cards = OrderedDict()
+        for sheetname, sheetdata in sheet_pages(self.sheet):
+            if sheetname == SETTING_SHEET_LABEL or not sheetdata:
                 continue
-            if len(sheetdata):
-                # Add (union) first row (field names) to the set of unique names
-                fieldnames.update(sheetdata[0])
-        return list(fieldnames)
+            keys = sheetdata[0]
+            name_pos = keys.index("Name") if "Name" in keys else None
+            labels = []
+            for i, row in enumerate(sheetdata[1:]):
+                if not row:
+                    continue
+                if name_pos is not None and name_pos < len(row) and row[name_pos] != "":
+                    labels.append((i, str(row[name_pos])))
+                else:
+                    labels.append((i, "Row %d" % (i+2)))
+            cards[sheetname] = labels
+        return cards
 
         
-def main():
-    parser = argparse.ArgumentParser(
-        description="Generate card images in HTML from spreadsheet.")
-    parser.add_argument("spreadsheet", type=str,
-                        help=".ods spreadsheet to source card data")
+def add_render_arguments(parser):
+    """Arguments for how cards are rendered, shared by every command"""
     parser.add_argument("--copyright","-c", type=str, default="",
                         help="Copyright owner to show in footer")
     parser.add_argument("--css", type=str,
                         help="Name of additional css file")
     parser.add_argument("--no_default_css", action="store_true",
                         help="Don't include the default CSS")
+    parser.add_argument("--layout", type=str, metavar="FILE",
+                        help="Card layout template to use for every card type "+
+                             "without its own LayoutFile in the settings sheet")
     parser.add_argument("--no_trait_colors", action="store_true",
                         help="Don't procedurally color-code Traits")
     parser.add_argument("--version", "-v", type=str,
                         help="Print only cards whose Version matches this")
     parser.add_argument("--no_zip_button", "-z", action="store_true",
                         help="Don't add a button to make a zip file of images.")
+    parser.add_argument("--compact_copies", action="store_true",
+                        help="Write each card once and let the browser add "+
+                             "extra Copies when the page loads")
+    parser.add_argument("--cache_dir", "--cache-dir", type=str,
+                        help="Reuse rendered cards stored in this folder "+
+                             "from earlier runs")
+    parser.add_argument("--cache_max_mb", type=int,
+                        default=DEFAULT_CACHE_MAX_BYTES//(1024*1024),
+                        help="Remove least recently used cards from the "+
+                             "cache folder when it grows past this size")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="Render cards in this many processes at once")
+    parser.add_argument("--jpeg_quality", type=int, default=DEFAULT_JPEG_QUALITY,
+                        help="JPEG quality (1-95) for --images, --tts_atlas "+
+                             "and the Make image ZIP button")
+    parser.add_argument("--zip_scale", "--zip-scale", type=float, default=ZIP_SCALE,
+                        help="Make image ZIP button: how many times larger "+
+                             "than on screen to capture each card")
+
+def render_options(cli_args):
+    """ProxyPrinter keyword arguments from add_render_arguments() arguments"""
+    pp_args = dict(copyowner=cli_args.copyright,
+            version=cli_args.version, defaultcss=not cli_args.no_default_css,
+            addcss=cli_args.css, colorize=not cli_args.no_trait_colors,
+            addzipbutton=not cli_args.no_zip_button,
+            compact_copies=cli_args.compact_copies,
+            zip_scale=cli_args.zip_scale, zip_quality=cli_args.jpeg_quality,
+            cache_dir=cli_args.cache_dir,
+            cache_max_bytes=cli_args.cache_max_mb*1024*1024,
+            jobs=cli_args.jobs)
+    if cli_args.layout:
+        # Relative to where it was given, not to the spreadsheet
+        pp_args["layouts"] = {"*": os.path.abspath(cli_args.layout)}
+    return pp_args
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] in SUBCOMMANDS:
+        return SUBCOMMANDS[argv[0]](argv[1:])
 
-    cli_args = parser.parse_args()
-
-    defaultcss = not cli_args.no_default_css
-    colorize = not cli_args.no_trait_colors
-    addzipbutton = not cli_args.no_zip_button
-    pp = ProxyPrinter(cli_args.spreadsheet, copyowner=cli_args.copyright,
-            version=cli_args.version, defaultcss=defaultcss, addcss=cli_args.css,
-            colorize=colorize, addzipbutton=addzipbutton)
-    print( pp.render_all() )
+    parser = argparse.ArgumentParser(
+        description="Generate card images in HTML from spreadsheet.",
+        epilog="Also: proxyprinter build --help, proxyprinter serve --help")
+    parser.add_argument("spreadsheet", type=str,
+                        help="Spreadsheet to source card data: .ods, .csv, "+
+                             ".tsv, .jsonl, or a folder of .csv/.tsv/.jsonl "+
+                             "files (one per card type)")
+    add_render_arguments(parser)
+    parser.add_argument("--images", type=str, metavar="DIR",
+                        help="Draw each card as an image in this folder "+
+                             "(requires Pillow); writes HTML only with --output")
+    parser.add_argument("--image_format", choices=["jpg", "png"], default="jpg",
+                        help="File type for --images")
+    parser.add_argument("--dpi", type=int, default=DEFAULT_DPI,
+                        help="Resolution for --images and --tts_atlas")
+    parser.add_argument("--tts_atlas", "--tts-atlas", type=str, metavar="DIR",
+                        help="Pack cards into Tabletop Simulator deck images "+
+                             "of up to %d cards in this folder, " % ATLAS_SIZE +
+                             "with a matching deck file (requires Pillow); "+
+                             "writes HTML only with --output")
+    parser.add_argument("--assets_dir", "--assets-dir", type=str, metavar="DIR",
+                        help="Write the CSS, scripts and Tabletop Simulator "+
+                             "JSON to content-hashed files in this folder "+
+                             "and link to them instead of including them")
+    parser.add_argument("--pages_dir", "--pages-dir", type=str, metavar="DIR",
+                        help="Split the cards into pages in this folder, "+
+                             "with an index page, instead of writing one HTML file")
+    parser.add_argument("--per_page", "--per-page", type=int, default=DEFAULT_PER_PAGE,
+                        help="Cards per page for --pages_dir")
+    parser.add_argument("--page_by_sheet", "--page-by-sheet", action="store_true",
+                        help="Make one page per sheet (card type) for --pages_dir")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print how long each part of the build took, "+
+                             "and the slowest cards and fields, to stderr")
+    parser.add_argument("--metrics_json", "--metrics-json", type=str, metavar="FILE",
+                        help="Write build timings and statistics to this file as JSON")
+    parser.add_argument("--profile_top", type=int, default=DEFAULT_TOP,
+                        help="How many of the slowest cards and fields to report")
+    parser.add_argument("--output", "-o", type=str,
+                        help="Write the HTML to this file instead of stdout")
+    parser.add_argument("--gzip", action="store_true",
+                        help="Gzip the output file (implied if --output ends in .gz)")
+    parser.add_argument("--watch", action="store_true",
+                        help="Serve the output locally and rebuild it whenever "+
+                             "the spreadsheet or its CSS file changes")
+    parser.add_argument("--port", type=int, default=8000,
+                        help="Port for --watch to serve on")
+
+    cli_args = parser.parse_args(argv)
+    if cli_args.pages_dir and (cli_args.output or cli_args.watch):
+        parser.error("--pages_dir can't be used with --output or --watch")
+    if cli_args.watch and (cli_args.profile or cli_args.metrics_json):
+        parser.error("--profile and --metrics_json can't be used with --watch")
+
+    pp_args = render_options(cli_args)
+    if cli_args.pages_dir and not cli_args.assets_dir:
+        # Share one copy of the CSS and TTS JSON between the pages
+        cli_args.assets_dir = os.path.join(cli_args.pages_dir, "assets")
+    if cli_args.assets_dir:
+        # Links are relative to wherever the page will be opened from
+        if cli_args.pages_dir:
+            page_dir = cli_args.pages_dir
+        elif cli_args.output:
+            page_dir = os.path.dirname(os.path.abspath(cli_args.output))
+        elif cli_args.watch:
+            page_dir = os.path.dirname(os.path.abspath(cli_args.spreadsheet))
+        else:
+            page_dir = os.curdir
+        pp_args["assets_dir"] = cli_args.assets_dir
+        pp_args["assets_url"] = asset_url(cli_args.assets_dir, page_dir)
+
+    if cli_args.watch:
+        watch_main(cli_args, pp_args)
+        return
+
+    metrics = None
+    if cli_args.profile or cli_args.metrics_json:
+        metrics = Metrics(top=cli_args.profile_top)
+    try:
+        pp = ProxyPrinter(cli_args.spreadsheet, metrics=metrics, **pp_args)
+        try:
+            write_main(cli_args, pp)
+        finally:
+            pp.record_counters()
+    finally:
+        if metrics:
+            report_metrics(cli_args, metrics)
+
+def report_metrics(cli_args, metrics):
+    if cli_args.profile:
+        print(metrics.format_report(), file=sys.stderr)
+    if cli_args.metrics_json:
+        with open(cli_args.metrics_json, "w", encoding="utf-8") as f:
+            json.dump(metrics.report(), f, indent=2)
+
+def write_main(cli_args, pp):
+    if cli_args.images:
+        with pp.phase("render_images"):
+            paths = pp.render_images(cli_args.images, dpi=cli_args.dpi,
+                                     quality=cli_args.jpeg_quality,
+                                     image_format=cli_args.image_format)
+        logger.info("Wrote %d images to %s" % (len(paths), cli_args.images))
+    if cli_args.tts_atlas:
+        name = os.path.splitext(os.path.basename(cli_args.spreadsheet.rstrip(os.sep)))[0]
+        with pp.phase("render_tts_atlas"):
+            paths = pp.render_tts_atlas(cli_args.tts_atlas, dpi=cli_args.dpi,
+                                        quality=cli_args.jpeg_quality, name=name)
+        logger.info("Wrote %d deck images to %s" % (len(paths), cli_args.tts_atlas))
+    if cli_args.pages_dir:
+        with pp.phase("write_output"):
+            paths = pp.render_pages(cli_args.pages_dir, per_page=cli_args.per_page,
+                                    by_sheet=cli_args.page_by_sheet,
+                                    compress=cli_args.gzip)
+        logger.info("Wrote %d pages and %s" % (len(paths)-1, paths[0]))
+        return
+    if (cli_args.images or cli_args.tts_atlas) and not cli_args.output:
+        return
+
+    with pp.phase("write_output"):
+        if cli_args.output:
+            pp.render_file(cli_args.output, compress=cli_args.gzip)
+        elif cli_args.gzip:
+            with gzip.open(sys.stdout.buffer, "wt", encoding="utf-8") as f:
+                pp.render_to(f)
+        else:
+            pp.render_to(sys.stdout)
+            print()
+    stats = pp.process_cache.stats()
+    logger.info("Process cache: %d hits, %d misses, %d entries" %
+                (stats["hits"], stats["misses"], stats["size"]))
+    if pp.fragment_cache:
+        stats = pp.fragment_cache.stats()
+        logger.info("Fragment cache: %d hits, %d misses" %
+                    (stats["hits"], stats["misses"]))
+
+def watch_main(cli_args, pp_args):
+    # Reuse unchanged cards between rebuilds even without --cache_dir
+    tmp_cache = None
+    if not pp_args["cache_dir"]:
+        tmp_cache = tempfile.mkdtemp(prefix="proxyprinter-")
+        pp_args["cache_dir"] = tmp_cache
+
+    def build():
+        pp = ProxyPrinter(cli_args.spreadsheet, **pp_args)
+        html = pp.render_all()
+        if cli_args.output:
+            write_output(cli_args.output, lambda f: f.write(html),
+                         compress=cli_args.gzip)
+        css_path = pp.css_file()
+        return html, pp.source_files(), [css_path] if css_path else [], len(pp.cards)
+
+    if cli_args.output:
+        directory = os.path.dirname(os.path.abspath(cli_args.output))
+    else:
+        directory = os.path.dirname(os.path.abspath(cli_args.spreadsheet))
+    try:
+        watch(build, sources=[cli_args.spreadsheet], port=cli_args.port,
+              directory=directory)
+    finally:
+        if tmp_cache:
+            shutil.rmtree(tmp_cache, ignore_errors=True)
+
+def serve_main(argv):
+    parser = argparse.ArgumentParser(prog="proxyprinter serve",
+        description="Serve decks, cards, trait CSS and Tabletop Simulator "+
+                    "JSON over HTTP, keeping spreadsheets loaded between requests.")
+    parser.add_argument("--root", type=str, default=os.curdir,
+                        help="Folder to serve spreadsheets from")
+    parser.add_argument("--host", type=str, default="localhost",
+                        help="Address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_SERVE_PORT,
+                        help="Port to listen on")
+    parser.add_argument("--workers", type=int, default=DEFAULT_SERVE_WORKERS,
+                        help="Requests to handle at once")
+    add_render_arguments(parser)
+    cli_args = parser.parse_args(argv)
+    pp_args = render_options(cli_args)
+
+    def load(path):
+        return ProxyPrinter(ParsedWorkbook(path), **pp_args)
+
+    serve(load, root=cli_args.root, host=cli_args.host, port=cli_args.port,
+          workers=cli_args.workers)
+
+#Options for the whole build run, not for one deck
+BATCH_ONLY_OPTIONS = {"spreadsheets", "manifest", "workers"}
+
+def build_deck(job):
+    """
+    Build one deck of a batch, in a worker process. Returns a dict of
+    results for format_summary(), with the error if the build failed.
+    """
+    spreadsheet, output, pp_args, compress = job
+    result = {"spreadsheet": spreadsheet, "output": output}
+    start = time.perf_counter()
+    try:
+        pp = ProxyPrinter(spreadsheet, **pp_args)
+        pp.render_file(output, compress=compress)
+    except Exception as e:
+        traceback.print_exc()
+        result["error"] = str(e) or type(e).__name__
+        return result
+    result["cards"] = len(pp.cards)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+def build_main(argv):
+    parser = argparse.ArgumentParser(prog="proxyprinter build",
+        description="Build several spreadsheets at once, each to its own "+
+                    "HTML file, and summarize how long each took.")
+    parser.add_argument("spreadsheets", type=str, nargs="*",
+                        help="Spreadsheets to build")
+    parser.add_argument("--manifest", type=str, metavar="FILE",
+                        help="TOML file listing decks to build and their options")
+    parser.add_argument("--out_dir", "--out-dir", type=str, default=os.curdir,
+                        metavar="DIR", help="Folder for decks without their own output")
+    parser.add_argument("--gzip", action="store_true",
+                        help="Gzip the output files")
+    parser.add_argument("--workers", type=int,
+                        help="Decks to build at once (default: one per CPU)")
+    add_render_arguments(parser)
+    cli_args = parser.parse_args(argv)
+    if not cli_args.spreadsheets and not cli_args.manifest:
+        parser.error("give spreadsheets to build or a --manifest")
+
+    # Options for each deck: the defaults, then the manifest's, then any
+    # given on the command line
+    defaults = {k: parser.get_default(k) for k in vars(cli_args)}
+    # Parse again over placeholders to find the options that were given,
+    # including any given with their default value
+    unset = object()
+    given_args = parser.parse_args(argv, argparse.Namespace(**dict.fromkeys(defaults, unset)))
+    given = {k: v for k, v in vars(given_args).items() if v is not unset}
+    manifest_defaults = {}
+    decks = [{"spreadsheet": path} for path in cli_args.spreadsheets]
+    if cli_args.manifest:
+        try:
+            manifest_defaults, manifest_decks = read_manifest(cli_args.manifest)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        decks.extend(manifest_decks)
+
+    jobs = []
+    for deck in decks:
+        allowed = set(defaults) - BATCH_ONLY_OPTIONS | {"spreadsheet", "output"}
+        unknown = (set(manifest_defaults) | set(deck)) - allowed
+        if unknown:
+            parser.error("unknown options in manifest: %s" % ", ".join(sorted(unknown)))
+        options = dict(defaults, **manifest_defaults)
+        options.update(deck)
+        options.update(given)
+        deck_args = argparse.Namespace(**options)
+        output = options.get("output") or deck_output(options["spreadsheet"],
+                                                      deck_args.out_dir, deck_args.gzip)
+        jobs.append((options["spreadsheet"], output, render_options(deck_args),
+                     deck_args.gzip))
+    outputs = [output for spreadsheet, output, pp_args, compress in jobs]
+    if len(set(map(os.path.abspath, outputs))) != len(outputs):
+        parser.error("two decks would be written to the same file; "+
+                     "give them each an output in the manifest")
+
+    for output in outputs:
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    workers = max(1, min(cli_args.workers or os.cpu_count() or 1, len(jobs)))
+    start = time.perf_counter()
+    if workers > 1:
+        # Each process keeps the default CSS and compiled layouts loaded
+        # for all the decks it builds
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(build_deck, jobs))
+    else:
+        results = [build_deck(job) for job in jobs]
+    print(format_summary(results, time.perf_counter()-start, workers))
+    if any(r.get("error") for r in results):
+        sys.exit(1)
+
+#Commands other than building one spreadsheet, by their first argument
+SUBCOMMANDS = {
+    "build": build_main,
+    "serve": serve_main,
+}
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Draw card faces straight to image files with Pillow, following the layout
+of the default stylesheet, so card images can be made on a machine without
+a browser. Cards are described by the plain "face" dicts from Card.face().
+save_faces() writes one image per card; save_atlases() packs them into
+Tabletop Simulator deck images.
+
+Pillow is optional; install it to use this module (pip install Pillow).
+"""
+
+import colorsys
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = None
+
+DEFAULT_DPI = 300
+DEFAULT_JPEG_QUALITY = 90
+
+#Largest grid of cards Tabletop Simulator reads from one deck image
+ATLAS_COLUMNS = 10
+ATLAS_ROWS = 7
+ATLAS_SIZE = ATLAS_COLUMNS*ATLAS_ROWS
+
+#Card size in inches, including the border (see proxyprinter.css)
+CARD_WIDTH = 2.36
+CARD_HEIGHT = 3.36
+BORDER = 0.08
+TITLE_HEIGHT = 0.29
+TITLE_RULE = 0.02
+BODY_TOP = 0.3
+BODY_LEFT = 0.2
+BODY_BOTTOM = 0.14
+BOX_MARGIN = 0.05
+BOX_PADDING = 0.05
+BOX_BORDER = 0.01
+TRAIT_BORDER = 0.02
+TRAIT_PADDING = 0.06
+
+NAME_SIZES = {"bigtext": 0.2, "mediumtext": 0.18, "smalltext": 0.14}
+#Names too wide for the title shrink in steps down to this size, then wrap
+NAME_MIN_SIZE = 0.1
+NAME_SIZE_STEP = 0.01
+TEXT_SIZES = {"bigtext": 0.18, "mediumtext": 0.14, "smalltext": 0.10}
+TRAIT_SIZE = 0.12
+CARDTYPE_SIZE = 0.16
+FOOTER_SIZE = 0.1
+
+#Font files to try for each style, in order; Pillow searches the system
+# font folders for bare filenames
+FONT_FILES = {
+    "serif": ["pala.ttf", "DejaVuSerif.ttf", "LiberationSerif-Regular.ttf"],
+    "bold": ["palab.ttf", "DejaVuSerif-Bold.ttf", "LiberationSerif-Bold.ttf"],
+    "italic": ["palai.ttf", "DejaVuSerif-Italic.ttf", "LiberationSerif-Italic.ttf"],
+    "sans": ["DejaVuSans.ttf", "LiberationSans-Regular.ttf", "Arial.ttf"],
+    "trait": ["impact.ttf", "DejaVuSans-Bold.ttf", "LiberationSans-Bold.ttf"],
+}
+
+BLACK = (0, 0, 0)
+WHITE = (255, 255, 255)
+
+
+def require_pillow():
+    if Image is None:
+        raise RuntimeError("Drawing card images requires Pillow: pip install Pillow")
+
+def hsl_to_rgb(hue, sat, lit):
+    r, g, b = colorsys.hls_to_rgb(hue/360, lit/100, sat/100)
+    return round(r*255), round(g*255), round(b*255)
+
+def atlas_grid(count):
+    """Columns and rows of the deck image holding count cards"""
+    columns = min(ATLAS_COLUMNS, count)
+    return columns, -(-count//columns)
+
+
+class FaceDrawer:
+    """Draws face dicts at a given resolution, caching loaded fonts"""
+    def __init__(self, dpi=DEFAULT_DPI):
+        require_pillow()
+        self.dpi = dpi
+        self.fonts = {}
+
+    def px(self, inches):
+        return max(1, round(inches*self.dpi))
+
+    def font(self, style, inches):
+        size = self.px(inches)
+        key = (style, size)
+        if key not in self.fonts:
+            font = None
+            for fname in FONT_FILES[style]:
+                try:
+                    font = ImageFont.truetype(fname, size)
+                    break
+                except OSError:
+                    continue
+            if font is None:
+                try:
+                    font = ImageFont.load_default(size)
+                except TypeError:
+                    font = ImageFont.load_default()
+            self.fonts[key] = font
+        return self.fonts[key]
+
+    @staticmethod
+    def wrap(text, font, width, indent=0):
+        """Break text into lines that fit width; the first line starts at indent"""
+        lines = []
+        for paragraph in text.split("\n"):
+            line = ""
+            for word in paragraph.split(" "):
+                candidate = word if not line else line+" "+word
+                if line and font.getlength(candidate)+indent > width:
+                    lines.append(line)
+                    line = word
+                    indent = 0
+                else:
+                    line = candidate
+            lines.append(line)
+            indent = 0
+        return lines
+
+    @staticmethod
+    def line_height(font):
+        ascent, descent = font.getmetrics()
+        return round((ascent+descent)*1.15)
+
+    def draw_lines(self, draw, x, y, lines, font, indent=0):
+        lh = self.line_height(font)
+        for line in lines:
+            draw.text((x+indent, y), line, font=font, fill=BLACK)
+            y += lh
+            indent = 0
+        return y
+
+    def draw(self, face):
+        width, height = self.px(CARD_WIDTH), self.px(CARD_HEIGHT)
+        img = Image.new("RGB", (width, height), WHITE)
+        draw = ImageDraw.Draw(img)
+        border = self.px(BORDER)
+
+        # Card body, drawn separately so overflow gets clipped like the CSS
+        body_w = width-border-(border+self.px(BODY_LEFT))
+        body_h = height-border-self.px(BODY_BOTTOM)-(border+self.px(BODY_TOP))
+        if body_w > 0 and body_h > 0:
+            body = Image.new("RGB", (body_w, body_h), WHITE)
+            self.draw_body(ImageDraw.Draw(body), body_w, face)
+            img.paste(body, (border+self.px(BODY_LEFT), border+self.px(BODY_TOP)))
+
+        # Title
+        if face["name"]:
+            name, size = face["name"]
+            title_w = width-2*border-self.px(0.1)
+            title_h = self.px(TITLE_HEIGHT)
+            font = self.name_font(name, NAME_SIZES[size], title_w)
+            lines = self.wrap(name, font, title_w)
+            y = border + (title_h - self.line_height(font)*len(lines))//2
+            for line in lines:
+                x = (width - font.getlength(line))//2
+                draw.text((x, y), line, font=font, fill=BLACK)
+                y += self.line_height(font)
+            rule_y = border+title_h
+            draw.rectangle((border, rule_y, width-border, rule_y+self.px(TITLE_RULE)-1), fill=BLACK)
+
+        # Card type, reading upwards along the left edge
+        if face["cardtype"]:
+            font = self.font("serif", CARDTYPE_SIZE)
+            label_w = round(font.getlength(face["cardtype"]))+1
+            label = Image.new("RGB", (max(1, label_w), self.px(BODY_LEFT)), WHITE)
+            ImageDraw.Draw(label).text((0, 0), face["cardtype"], font=font, fill=BLACK)
+            label = label.rotate(90, expand=True)
+            img.paste(label, (border, height-border-self.px(BODY_BOTTOM)-label.height))
+
+        # Footer
+        font = self.font("sans", FOOTER_SIZE)
+        footer_y = height-border-self.px(0.008)-self.line_height(font)
+        if face["number"] is not None:
+            draw.text((border+self.px(0.01), footer_y), "#%s" % face["number"],
+                      font=self.font("serif", FOOTER_SIZE), fill=BLACK)
+        copy_w = font.getlength(face["copyline"])
+        draw.text((width-border-self.px(0.01)-copy_w, footer_y), face["copyline"],
+                  font=font, fill=BLACK)
+
+        draw.rounded_rectangle((0, 0, width-1, height-1), radius=self.px(BORDER),
+                               outline=BLACK, width=border)
+        return img
+
+    def name_font(self, name, inches, width):
+        """The largest name font up to inches that fits name in width"""
+        font = self.font("bold", inches)
+        while font.getlength(name) > width and inches > NAME_MIN_SIZE:
+            inches = max(NAME_MIN_SIZE, inches-NAME_SIZE_STEP)
+            font = self.font("bold", inches)
+        return font
+
+    def draw_body(self, draw, body_w, face):
+        margin, pad, line = self.px(BOX_MARGIN), self.px(BOX_PADDING), self.px(BOX_BORDER)
+        box_w = body_w - margin
+        inner_w = box_w - 2*(pad+line)
+        y = 0
+
+        for fieldname, text, size in face["fields"]:
+            y += margin
+            label_font = self.font("bold", TEXT_SIZES[size])
+            font = self.font("serif", TEXT_SIZES[size])
+            label = fieldname+": "
+            indent = label_font.getlength(label)
+            lines = self.wrap(text, font, inner_w, indent)
+            box_h = 2*(pad+line) + self.line_height(font)*len(lines)
+            draw.rectangle((0, y, box_w-1, y+box_h-1), outline=BLACK, width=line)
+            draw.text((line+pad, y+line+pad), label, font=label_font, fill=BLACK)
+            self.draw_lines(draw, line+pad, y+line+pad, lines, font, indent)
+            y += box_h
+
+        if face["text"]:
+            text, flavor_text, size = face["text"]
+            y += margin+pad
+            font = self.font("serif", TEXT_SIZES[size])
+            y = self.draw_lines(draw, pad, y, self.wrap(text or " ", font, inner_w), font)
+            if flavor_text:
+                draw.rectangle((pad, y, box_w-pad, y+line-1), fill=BLACK)
+                font = self.font("italic", TEXT_SIZES[size])
+                y = self.draw_lines(draw, pad, y+line+pad, self.wrap(flavor_text, font, inner_w), font)
+            y += pad
+
+        if face["traits"]:
+            y += margin+pad
+            x = pad
+            tb, tp = self.px(TRAIT_BORDER), self.px(TRAIT_PADDING)
+            font = self.font("trait", TRAIT_SIZE)
+            th = self.line_height(font)+2*tb
+            for trait, size, hsl in face["traits"]:
+                tw = round(font.getlength(trait))+2*(tp+tb)
+                if x > pad and x+tw > box_w:
+                    x = pad
+                    y += th+tb
+                draw.rectangle((x, y, x+tw-1, y+th-1), fill=hsl_to_rgb(*hsl),
+                               outline=BLACK, width=tb)
+                draw.text((x+tb+tp, y+tb), trait, font=font, fill=BLACK)
+                x += tw+self.px(0.04)
+
+    def draw_back(self, label=""):
+        """A plain card back, with label centered on it"""
+        width, height = self.px(CARD_WIDTH), self.px(CARD_HEIGHT)
+        img = Image.new("RGB", (width, height), WHITE)
+        draw = ImageDraw.Draw(img)
+        border = self.px(BORDER)
+        inset = border+self.px(BOX_MARGIN)
+        draw.rounded_rectangle((0, 0, width-1, height-1), radius=self.px(BORDER),
+                               outline=BLACK, width=border)
+        draw.rectangle((inset, inset, width-inset-1, height-inset-1),
+                       outline=BLACK, width=self.px(TRAIT_BORDER))
+        if label:
+            font = self.font("bold", NAME_SIZES["mediumtext"])
+            lines = self.wrap(label, font, width-2*inset-2*self.px(BOX_PADDING))
+            y = (height - self.line_height(font)*len(lines))//2
+            for line in lines:
+                draw.text(((width - font.getlength(line))//2, y), line,
+                          font=font, fill=BLACK)
+                y += self.line_height(font)
+        return img
+
+    def draw_atlas(self, faces):
+        """Draw faces left to right, top to bottom in one deck image"""
+        columns, rows = atlas_grid(len(faces))
+        width, height = self.px(CARD_WIDTH), self.px(CARD_HEIGHT)
+        img = Image.new("RGB", (width*columns, height*rows), WHITE)
+        for i, face in enumerate(faces):
+            row, column = divmod(i, columns)
+            img.paste(self.draw(face), (column*width, row*height))
+        return img
+
+    def save(self, face, path, quality=DEFAULT_JPEG_QUALITY):
+        return self.write(self.draw(face), path, quality)
+
+    def write(self, img, path, quality=DEFAULT_JPEG_QUALITY):
+        dpi = (self.dpi, self.dpi)
+        if path.lower().endswith(".png"):
+            img.save(path, dpi=dpi)
+        else:
+            img.save(path, quality=quality, dpi=dpi)
+        return path
+
+
+#Drawing settings in a worker process, set once by init_image_worker()
+_worker = {}
+
+def init_image_worker(dpi, quality):
+    _worker["drawer"] = FaceDrawer(dpi)
+    _worker["quality"] = quality
+
+def save_face_chunk(jobs):
+    return [_worker["drawer"].save(face, path, _worker["quality"]) for face, path in jobs]
+
+def save_atlas(job):
+    faces, path = job
+    drawer = _worker["drawer"]
+    return drawer.write(drawer.draw_atlas(faces), path, _worker["quality"])
+
+
+def save_faces(faces, directory, dpi=DEFAULT_DPI, quality=DEFAULT_JPEG_QUALITY,
+               image_format="jpg", processes=1, first_number=1):
+    """
+    Draw each face to directory/N.jpg (or .png), numbering from first_number
+    in order, using a pool of processes if processes > 1. Returns the paths.
+    """
+    require_pillow()
+    os.makedirs(directory, exist_ok=True)
+    jobs = [(face, os.path.join(directory, "%d.%s" % (i, image_format)))
+            for i, face in enumerate(faces, start=first_number)]
+    if processes <= 1 or len(jobs) <= 1:
+        init_image_worker(dpi, quality)
+        return save_face_chunk(jobs)
+
+    chunksize = max(1, min(32, len(jobs)//(processes*4)))
+    chunks = [jobs[i:i+chunksize] for i in range(0, len(jobs), chunksize)]
+    paths = []
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_image_worker,
+                             initargs=(dpi, quality)) as executor:
+        for chunk_paths in executor.map(save_face_chunk, chunks):
+            paths.extend(chunk_paths)
+    return paths
+
+
+def save_atlases(faces, directory, dpi=DEFAULT_DPI, quality=DEFAULT_JPEG_QUALITY,
+                 processes=1, back_label=""):
+    """
+    Pack faces into deck images of up to ATLAS_COLUMNS x ATLAS_ROWS cards,
+    written to directory/deck1.jpg, deck2.jpg and so on, plus a shared
+    directory/back.jpg. Returns the paths of the deck images.
+    """
+    require_pillow()
+    os.makedirs(directory, exist_ok=True)
+    jobs = [(faces[i:i+ATLAS_SIZE],
+             os.path.join(directory, "deck%d.jpg" % (i//ATLAS_SIZE+1)))
+            for i in range(0, len(faces), ATLAS_SIZE)]
+
+    init_image_worker(dpi, quality)
+    back = _worker["drawer"].draw_back(back_label)
+    _worker["drawer"].write(back, os.path.join(directory, "back.jpg"), quality)
+
+    if processes <= 1 or len(jobs) <= 1:
+        return [save_atlas(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_image_worker,
+                             initargs=(dpi, quality)) as executor:
+        return list(executor.map(save_atlas, jobs))
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Spreadsheet readers, chosen by file extension. Each reader returns the
+structure ProxyPrinter works from: sheet names (card types) mapped to lists
+of rows, with the first row of each sheet holding the field names.
+
+A folder can stand in for a workbook: each supported file in it becomes
+one sheet, named after the file. Name a file "ProxyPrinter Settings.csv"
+(or .tsv/.jsonl) to use it as the settings sheet.
+"""
+
+import csv
+import json
+import os
+from collections import OrderedDict
+
+from .odsreader import OdsWorkbook
+
+#In JSON lines files, an object's card type if it isn't the filename
+JSONL_SHEET_KEY = "_sheet"
+
+READERS = OrderedDict()
+
+
+def register_reader(extension, reader):
+    """
+    Use reader(path, lazy) to load files ending in extension. It should
+    return a mapping of sheet names to rows. With lazy, it may return a
+    mapping that parses sheets only as they're read.
+    """
+    READERS[extension.lower()] = reader
+
+def file_extension(path):
+    return os.path.splitext(path)[1].lower()
+
+def read_workbook(path, lazy=False):
+    if os.path.isdir(path):
+        return read_directory(path, lazy)
+    reader = READERS.get(file_extension(path))
+    if reader is None:
+        raise ValueError("Unsupported spreadsheet format: %s (use one of: %s)" %
+                         (path, ", ".join(READERS.keys())))
+    return reader(path, lazy)
+
+def sheet_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+def trim_row(row):
+    """Drop trailing empty cells, like the .ods reader does"""
+    end = len(row)
+    while end and row[end-1] == "":
+        end -= 1
+    return row[:end]
+
+
+def read_ods(path, lazy=False):
+    workbook = OdsWorkbook(path)
+    return workbook if lazy else workbook.to_dict()
+
+def read_delimited(path, delimiter):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return [trim_row(row) for row in csv.reader(f, delimiter=delimiter)]
+
+def read_csv(path, lazy=False):
+    return OrderedDict([(sheet_name(path), read_delimited(path, ","))])
+
+def read_tsv(path, lazy=False):
+    return OrderedDict([(sheet_name(path), read_delimited(path, "\t"))])
+
+def read_jsonl(path, lazy=False):
+    """
+    One card per line: either a JSON object of field names to values, or a
+    JSON array of values following a first line that's an array of field
+    names. Objects can set JSONL_SHEET_KEY to pick their card type.
+    """
+    default_sheet = sheet_name(path)
+    keys = OrderedDict()
+    objects = OrderedDict()
+    arrays = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if type(item) == list:
+                arrays.append(item)
+                continue
+            sheet = str(item.pop(JSONL_SHEET_KEY, default_sheet))
+            keys.setdefault(sheet, OrderedDict()).update((k, None) for k in item)
+            objects.setdefault(sheet, []).append(item)
+
+    sheets = OrderedDict()
+    if arrays:
+        sheets[default_sheet] = [trim_row(row) for row in arrays]
+    for sheet, items in objects.items():
+        fieldnames = list(keys[sheet])
+        rows = sheets.setdefault(sheet, [fieldnames])
+        for item in items:
+            rows.append(trim_row([item.get(k, "") for k in fieldnames]))
+    return sheets
+
+def read_directory(path, lazy=False):
+    sheets = OrderedDict()
+    for fname in sorted(os.listdir(path)):
+        fpath = os.path.join(path, fname)
+        ext = file_extension(fname)
+        if ext not in READERS or ext == ".ods" or not os.path.isfile(fpath):
+            continue
+        sheets.update(READERS[ext](fpath, lazy))
+    return sheets
+
+
+register_reader(".ods", read_ods)
+register_reader(".csv", read_csv)
+register_reader(".tsv", read_tsv)
+register_reader(".tab", read_tsv)
+register_reader(".jsonl", read_jsonl)
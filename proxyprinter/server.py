@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+`proxyprinter serve`: a local HTTP service for tools that would otherwise
+run the command line many times. Spreadsheets stay parsed, with their
+settings compiled, between requests, and are only loaded again when one
+of their files changes. Responses carry an ETag, so a client that sends
+it back in If-None-Match gets a 304 without anything being rendered.
+
+Every endpoint takes the spreadsheet as ?path=, relative to the root
+folder the server was started in:
+
+    /deck        the whole deck's HTML
+    /card        one card's HTML, from &sheet=NAME&row=N (N is the row
+                 number in the spreadsheet, so the first card is row 2)
+    /traits.css  the trait colors stylesheet
+    /tts.json    the Tabletop Simulator deck JSON
+"""
+
+import hashlib
+import logging
+import os
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+from .watch import file_state
+
+DEFAULT_SERVE_PORT = 8001
+#Requests handled at once; more wait for a free worker
+DEFAULT_SERVE_WORKERS = 4
+
+logger = logging.getLogger(__name__)
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class LoadedDeck:
+    """
+    A spreadsheet as loaded by load(path), along with the state of its
+    source files when it was loaded and the responses rendered from it.
+    Requests for the same deck take turns through lock.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.pp = None
+        self.states = None
+        self.responses = {}
+
+    def current_states(self):
+        return tuple((path, file_state(path)) for path in self.pp.source_files())
+
+    def refresh(self, load):
+        """Load the spreadsheet, again if any of its files have changed"""
+        if self.pp is not None and self.current_states() == self.states:
+            return
+        self.pp = load(self.path)
+        self.states = self.current_states()
+        self.responses = {}
+
+    def etag(self, key):
+        s = repr((self.states, key))
+        return '"%s"' % hashlib.sha256(s.encode("utf-8")).hexdigest()[:32]
+
+
+class DeckStore:
+    """Decks loaded so far, by path"""
+    def __init__(self, load):
+        self.load = load
+        self.decks = {}
+        self.lock = threading.Lock()
+
+    def respond(self, path, key, render, if_none_match=()):
+        """
+        The ETag and body for a response, rendering it with render(pp)
+        unless it's already been rendered. The body is None if the client
+        already has this version (its ETag is in if_none_match).
+        """
+        with self.lock:
+            deck = self.decks.get(path)
+            if deck is None:
+                deck = self.decks[path] = LoadedDeck(path)
+        with deck.lock:
+            deck.refresh(self.load)
+            etag = deck.etag(key)
+            if etag in if_none_match or "*" in if_none_match:
+                return etag, None
+            body = deck.responses.get(key)
+            if body is None:
+                body = deck.responses[key] = render(deck.pp).encode("utf-8")
+            return etag, body
+
+
+def card_row(query):
+    sheet = query.get("sheet")
+    try:
+        index = int(query.get("row", "")) - 2
+    except ValueError:
+        raise RequestError(400, "row must be a number")
+    if not sheet or index < 0:
+        raise RequestError(400, "/card needs sheet and a row of 2 or more")
+    return sheet, index
+
+ENDPOINTS = {
+    "/deck": ("text/html; charset=utf-8",
+              lambda query: ("deck",),
+              lambda pp, key: pp.render_all()),
+    "/card": ("text/html; charset=utf-8",
+              lambda query: ("card",) + card_row(query),
+              lambda pp, key: pp.card_preview_html(key[1], key[2])),
+    "/traits.css": ("text/css; charset=utf-8",
+                    lambda query: ("traits",),
+                    lambda pp, key: pp.trait_colors_css()),
+    "/tts.json": ("application/json",
+                  lambda query: ("tts",),
+                  lambda pp, key: pp.tts()),
+}
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            endpoint = ENDPOINTS.get(url.path)
+            if endpoint is None:
+                raise RequestError(404, "No such endpoint: %s" % url.path)
+            content_type, make_key, render = endpoint
+            path = self.server.spreadsheet_path(query.get("path"))
+            key = make_key(query)
+            try:
+                etag, body = self.server.store.respond(path, key,
+                        lambda pp: render(pp, key), self.if_none_match())
+            except (KeyError, IndexError) as e:
+                raise RequestError(404, "No such card: %s" % e)
+        except RequestError as e:
+            self.send_text(e.status, str(e))
+            return
+        except Exception as e:
+            traceback.print_exc()
+            self.send_text(500, "Build failed: %s" % e)
+            return
+
+        if body is None:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        # Clients may keep responses, but should check back with the ETag
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def if_none_match(self):
+        header = self.headers.get("If-None-Match", "")
+        return [tag.strip().replace("W/", "", 1) for tag in header.split(",") if tag.strip()]
+
+    def send_text(self, status, message):
+        body = (message+"\n").encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s" % (self.address_string(), format % args))
+
+
+class RenderServer(HTTPServer):
+    """An HTTPServer that handles requests on a fixed pool of threads"""
+    def __init__(self, address, store, root, workers=DEFAULT_SERVE_WORKERS):
+        super().__init__(address, RenderHandler)
+        self.store = store
+        self.root = os.path.realpath(root)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def spreadsheet_path(self, path):
+        """Resolve a requested spreadsheet path, which has to be in root"""
+        if not path:
+            raise RequestError(400, "Missing path")
+        full_path = os.path.realpath(os.path.join(self.root, path))
+        if os.path.commonpath([self.root, full_path]) != self.root:
+            raise RequestError(403, "Not in the served folder: %s" % path)
+        if not os.path.exists(full_path):
+            raise RequestError(404, "No such spreadsheet: %s" % path)
+        return full_path
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+def serve(load, root=".", host="localhost", port=DEFAULT_SERVE_PORT,
+          workers=DEFAULT_SERVE_WORKERS):
+    """
+    Serve decks loaded with load(path), which returns a ProxyPrinter, for
+    spreadsheets in the root folder until interrupted.
+    """
+    server = RenderServer((host, port), DeckStore(load), root, workers)
+    print("Serving %s at http://%s:%d/ (Ctrl+C to stop)" %
+          (server.root, host, server.server_address[1]), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Text size classes for a whole sheet at once. Sorting text lengths into
+size classes is the same work for every value in a column, so it's done
+a column at a time instead of once per field per card.
+
+NumPy is used to classify long columns if it's installed; otherwise
+classes come from bisect, with the same results. It's only imported once
+a column is long enough to need it, so short decks start up without it.
+"""
+
+from bisect import bisect_left
+
+#Text size classes, from shortest text to longest
+SIZE_CLASSES = ("bigtext", "mediumtext", "smalltext")
+
+#Shortest column worth handing to NumPy
+NUMPY_MIN_ROWS = 512
+
+#The numpy module once load_numpy() has imported it; False if it's missing
+_numpy = None
+
+
+def load_numpy():
+    """The numpy module, or None if it isn't installed"""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy or None
+
+def size_classes(lengths, thresholds):
+    """
+    The size class for each text length: bigtext up to the first
+    threshold, smalltext past the second and mediumtext in between.
+    """
+    medium, small = thresholds
+    bounds = [min(medium, small), small]
+    numpy = load_numpy() if len(lengths) >= NUMPY_MIN_ROWS else None
+    if numpy is not None:
+        found = numpy.searchsorted(numpy.asarray(bounds, dtype=float),
+                                   numpy.asarray(lengths), side="left")
+        return [SIZE_CLASSES[i] for i in found.tolist()]
+    return [SIZE_CLASSES[bisect_left(bounds, n)] for n in lengths]
+
+def row_size_classes(rows, thresholds):
+    """
+    The size class of every value in rows, as a tuple per row, given each
+    column's (medium, small) thresholds. Rows can be shorter than
+    thresholds, but not longer.
+    """
+    if not thresholds:
+        return [() for row in rows]
+    columns = []
+    for i, column_thresholds in enumerate(thresholds):
+        lengths = [len(str(row[i])) if i < len(row) else 0 for row in rows]
+        columns.append(size_classes(lengths, column_thresholds))
+    return [sizes[:len(row)] for row, sizes in zip(rows, zip(*columns))]
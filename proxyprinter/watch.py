@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Watch mode: rebuild when the spreadsheet or its layouts change, or reload
+when its CSS changes, and serve the result from a local web server that
+reloads the open page after each build.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+import webbrowser
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+RELOAD_PATH = "/__reload"
+RELOAD_CODE = """<script type="application/javascript">
+new EventSource("%s").onmessage = () => window.location.reload()
+</script>
+""" % RELOAD_PATH
+
+#Seconds between checks for changed files
+POLL_INTERVAL = 0.5
+#Seconds between keepalive messages to connected pages
+KEEPALIVE_INTERVAL = 15
+
+logger = logging.getLogger(__name__)
+
+
+def file_state(path):
+    if os.path.isdir(path):
+        return tuple(sorted((name, file_state(os.path.join(path, name)))
+                            for name in os.listdir(path)))
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+def add_reload_script(html):
+    head, sep, tail = html.rpartition("</body>")
+    if not sep:
+        return html + RELOAD_CODE
+    return head + RELOAD_CODE + sep + tail
+
+
+class LiveReloadServer(ThreadingHTTPServer):
+    """
+    Serves the latest build at / and other files from directory. Pages
+    listen for server-sent events at RELOAD_PATH and reload on each publish.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, directory):
+        self.directory = directory
+        self.page = b""
+        self.generation = 0
+        self.changed = threading.Condition()
+        super().__init__(address, LiveReloadHandler)
+
+    def publish(self, html):
+        with self.changed:
+            self.page = add_reload_script(html).encode("utf-8")
+            self.generation += 1
+            self.changed.notify_all()
+
+    def reload(self):
+        with self.changed:
+            self.generation += 1
+            self.changed.notify_all()
+
+
+class LiveReloadHandler(SimpleHTTPRequestHandler):
+    def __init__(self, request, client_address, server):
+        super().__init__(request, client_address, server,
+                         directory=server.directory)
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path in ("/", "/index.html"):
+            self.send_page()
+        elif path == RELOAD_PATH:
+            self.send_events()
+        else:
+            super().do_GET()
+
+    def send_page(self):
+        page = self.server.page
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(page)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(page)
+
+    def send_events(self):
+        # Note the generation before replying, so a build published as soon
+        # as the page is connected still reloads it
+        changed = self.server.changed
+        with changed:
+            seen = self.server.generation
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        while True:
+            with changed:
+                changed.wait_for(lambda: self.server.generation != seen,
+                                 timeout=KEEPALIVE_INTERVAL)
+                generation = self.server.generation
+            try:
+                if generation != seen:
+                    seen = generation
+                    self.wfile.write(b"data: reload\n\n")
+                else:
+                    self.wfile.write(b": keepalive\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                return
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s" % (self.address_string(), format % args))
+
+
+def watch(build, sources=(), port=8000, directory=".", open_browser=True):
+    """
+    Serve the output of build() on localhost and rebuild it whenever its
+    source files change.
+
+    build is called with no arguments and returns (html, source_files,
+    reload_files, card_count). A change to any of source_files triggers a
+    rebuild, except that a change to one of reload_files (such as CSS that
+    the page links to) only reloads the page. Until a build succeeds, the
+    files in sources are watched instead.
+    """
+    server = LiveReloadServer(("localhost", port), directory)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = "http://localhost:%d/" % server.server_address[1]
+
+    def rebuild():
+        start = time.perf_counter()
+        try:
+            html, sources, reload_only, card_count = build()
+        except Exception:
+            traceback.print_exc()
+            print("Build failed; still serving the previous build",
+                  file=sys.stderr)
+            return None
+        server.publish(html)
+        print("Built %d cards in %.2fs" %
+              (card_count, time.perf_counter()-start), file=sys.stderr)
+        return sources, reload_only
+
+    def watched_states(paths, before):
+        # Files are compared with their state from before the build, so
+        # changes saved while it ran aren't missed
+        return {path: before[path] if path in before else file_state(path)
+                for path in paths}
+
+    before = {path: file_state(path) for path in sources}
+    sources, reload_only = rebuild() or (list(sources), [])
+    states = watched_states(sources, before)
+    print("Serving at %s (Ctrl+C to stop)" % url, file=sys.stderr)
+    if open_browser:
+        webbrowser.open(url)
+
+    try:
+        while True:
+            time.sleep(POLL_INTERVAL)
+            changed = [path for path in states
+                       if file_state(path) != states[path]]
+            if not changed:
+                continue
+            # Wait for the writer to finish saving before reading
+            while True:
+                before = {path: file_state(path) for path in states}
+                time.sleep(POLL_INTERVAL)
+                if before == {path: file_state(path) for path in states}:
+                    break
+            if any(path not in reload_only for path in changed):
+                sources, reload_only = rebuild() or (sources, reload_only)
+            else:
+                print("%s changed; reloading" % ", ".join(changed),
+                      file=sys.stderr)
+                server.reload()
+            states = watched_states(sources, before)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
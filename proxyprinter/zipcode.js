@@ -0,0 +1,76 @@
+let zip_job = null
+
+function unique_cards() {
+  // Copies of a card share its data-card number, which is also its number
+  // in the Tabletop Simulator JSON, so only the first copy gets captured
+  const seen = new Map()
+  for (const card of document.querySelectorAll(".card[data-card]")) {
+    if (!seen.has(card.dataset.card)) {
+      seen.set(card.dataset.card, card)
+    }
+  }
+  return [...seen.entries()]
+}
+
+async function capture(card, settings) {
+  const canvas = await html2canvas(card, {
+    scale: settings.scale,
+    // workaround for https://github.com/niklasvh/html2canvas/issues/1878
+    scrollX: -window.scrollX,
+    scrollY: -window.scrollY
+  })
+  return await new Promise(resolve => canvas.toBlob(resolve, "image/jpeg", settings.quality))
+}
+
+async function makezip() {
+  const zbutton = document.querySelector(".zipmaker")
+  if (zip_job) {
+    zip_job.cancelled = true
+    zbutton.disabled = "disabled"
+    return
+  }
+  const oldtext = zbutton.textContent
+  const settings = Object.assign({scale: 4, quality: 0.92, workers: 3},
+                                 window.ZIP_SETTINGS || {})
+  const job = zip_job = {cancelled: false}
+
+  const zip = new JSZip()
+  const fname = window.location.pathname.split("/").pop().replace(".html","")
+  const cards = unique_cards()
+  let next = 0
+  let done = 0
+  async function worker() {
+    while (next < cards.length && !job.cancelled) {
+      const [id, card] = cards[next++]
+      const blob = await capture(card, settings)
+      zip.file(`${id}.jpg`, blob)
+      done++
+      if (!job.cancelled) {
+        zbutton.textContent = `Cancel (${done}/${cards.length})`
+      }
+    }
+  }
+  try {
+    zbutton.textContent = `Cancel (0/${cards.length})`
+    // The deck JSON is either in the page or, with --assets_dir, its own file
+    const tts_json = settings.tts_json ?
+      await (await fetch(settings.tts_json)).text() :
+      document.querySelector("#tts_json").textContent
+    zip.file(`${fname}.json`, tts_json)
+
+    const workers = []
+    for (let i = 0; i < Math.max(1, settings.workers); i++) {
+      workers.push(worker())
+    }
+    await Promise.all(workers)
+    if (!job.cancelled) {
+      zbutton.textContent = `${oldtext} (zipping)`
+      const fullzip = await zip.generateAsync({type:"blob"})
+      saveAs(fullzip, fname+".zip")
+    }
+  } finally {
+    zip_job = null
+    zbutton.textContent = oldtext
+    zbutton.disabled = ""
+  }
+}
@@ -40,11 +40,12 @@ setup(
             'proxyprintergui = proxyprinter.gui:main',
         ]
     },
-    install_requires=[
-        'pyexcel-ods3',
-    ],
+    install_requires=[],
+    extras_require={
+        'images': ['Pillow'],
+        'fast': ['numpy'],
+    },
     package_data={
-        '': ["proxyprinter.css"],
-        '': ["zipcode.html"],
+        '': ["proxyprinter.css", "zipcode.js", "layout.html"],
     }
 )
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from proxyprinter.proxyprinter import build_main
+
+MANIFEST = """
+[defaults]
+out_dir = "manifest-out"
+copyright = "Manifest Co"
+
+[[deck]]
+spreadsheet = "deck"
+"""
+
+
+class TestBuildMain(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.dir, "deck"))
+        with open(os.path.join(self.dir, "deck", "Spell.csv"), "w") as f:
+            f.write("Name,Text\nBolt,Zap it.\n")
+        self.manifest = os.path.join(self.dir, "decks.toml")
+        with open(self.manifest, "w") as f:
+            f.write(MANIFEST)
+        self.cwd = os.getcwd()
+        os.chdir(self.dir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+    def build(self, *args):
+        with contextlib.redirect_stdout(io.StringIO()):
+            build_main(["--manifest", self.manifest, "--workers", "1"] + list(args))
+
+    def read(self, path):
+        with open(os.path.join(self.dir, path), encoding="utf-8") as f:
+            return f.read()
+
+    def test_manifest_options(self):
+        self.build()
+        self.assertIn("Manifest Co", self.read(os.path.join("manifest-out", "deck.html")))
+
+    def test_command_line_overrides_manifest_with_defaults(self):
+        self.build("--out-dir", ".", "-c", "")
+        self.assertNotIn("Manifest Co", self.read("deck.html"))
+        self.assertFalse(os.path.exists(os.path.join(self.dir, "manifest-out")))
+
+
+if __name__ == "__main__":
+    unittest.main()
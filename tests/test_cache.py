@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from proxyprinter.cache import FragmentCache, settings_fingerprint
+from proxyprinter.proxyprinter import ProxyPrinter
+
+SPELLS = "Name,Text\nBolt,Zap it.\nHeal,Mend it.\nWard,Block it.\n"
+
+
+class CacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.dir, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+class TestFragmentCache(CacheTestCase):
+    def test_hits_and_misses(self):
+        cache = FragmentCache(self.cache_dir)
+        self.assertIsNone(cache.get("ab12"))
+        cache.put("ab12", "<div>card</div>")
+        self.assertEqual(cache.get("ab12"), "<div>card</div>")
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1})
+        # Another build finds what this one stored
+        self.assertEqual(FragmentCache(self.cache_dir).get("ab12"), "<div>card</div>")
+
+    def test_evicts_least_recently_used(self):
+        cache = FragmentCache(self.cache_dir, max_bytes=250)
+        for i, key in enumerate(["aa01", "bb02", "cc03"]):
+            cache.put(key, "x"*100)
+            os.utime(cache.path(key), (1000+i, 1000+i))
+        # Reading a fragment counts as using it
+        cache.get("aa01")
+        self.assertEqual(cache.evict(), 1)
+        self.assertIsNone(cache.get("bb02"))
+        self.assertIsNotNone(cache.get("aa01"))
+        self.assertIsNotNone(cache.get("cc03"))
+        self.assertEqual(cache.evict(), 0)
+
+    def test_fingerprint(self):
+        fingerprint = settings_fingerprint({"Zap": "<b>Zap</b>"}, [], {}, "Me")
+        self.assertEqual(fingerprint,
+                         settings_fingerprint({"Zap": "<b>Zap</b>"}, [], {}, "Me"))
+        for changed in [({"Zap": "<i>Zap</i>"}, [], {}, "Me"),
+                        ({"Zap": "<b>Zap</b>"}, ["Text"], {}, "Me"),
+                        ({"Zap": "<b>Zap</b>"}, [], {"Text": (10, 20)}, "Me"),
+                        ({"Zap": "<b>Zap</b>"}, [], {}, "You")]:
+            self.assertNotEqual(settings_fingerprint(*changed), fingerprint, changed)
+
+
+class TestIncrementalBuild(CacheTestCase):
+    def build(self, spells, **options):
+        path = os.path.join(self.dir, "Spell.csv")
+        with open(path, "w") as f:
+            f.write(spells)
+        pp = ProxyPrinter(path, cache_dir=self.cache_dir, **options)
+        html = pp.render_all()
+        self.assertEqual(html, ProxyPrinter(path, **options).render_all())
+        return pp.fragment_cache.stats()
+
+    def test_only_changed_cards_rendered(self):
+        self.assertEqual(self.build(SPELLS), {"hits": 0, "misses": 3})
+        self.assertEqual(self.build(SPELLS), {"hits": 3, "misses": 0})
+        self.assertEqual(self.build(SPELLS.replace("Mend", "Fix")),
+                         {"hits": 2, "misses": 1})
+
+    def test_settings_change_renders_everything(self):
+        self.build(SPELLS)
+        self.assertEqual(self.build(SPELLS, copyowner="Somebody"),
+                         {"hits": 0, "misses": 3})
+
+    def test_eviction_after_build(self):
+        self.build(SPELLS, cache_max_bytes=0)
+        self.assertEqual([files for _, _, files in os.walk(self.cache_dir) if files], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+
+from proxyprinter.proxyprinter import ProxyPrinter, ParsedWorkbook
+
+EXAMPLE_ODS = os.path.join(os.path.dirname(__file__), os.pardir, "example-cards.ods")
+
+
+class TestCardPreview(unittest.TestCase):
+    def test_lazy_ods(self):
+        html = ProxyPrinter(EXAMPLE_ODS).card_preview_html("Painting", 0)
+        self.assertIn("</body></html>", html)
+        self.assertEqual(html, ProxyPrinter(ParsedWorkbook(EXAMPLE_ODS))
+                                   .card_preview_html("Painting", 0))
+
+    def test_missing_card(self):
+        pp = ProxyPrinter(EXAMPLE_ODS)
+        self.assertRaises(KeyError, pp.card_preview_html, "No Such Sheet", 0)
+        self.assertRaises(IndexError, pp.card_preview_html, "Painting", 10000)
+
+
+class Stop(Exception):
+    pass
+
+
+class TestParsedWorkbook(unittest.TestCase):
+    def test_progress_between_sheets(self):
+        reports = []
+        workbook = ParsedWorkbook(EXAMPLE_ODS, lambda *args: reports.append(args))
+        self.assertEqual(reports, [("sheets", n, 0)
+                                   for n in range(1, len(workbook.sheets)+1)])
+
+    def test_progress_can_stop_loading(self):
+        def stop_at_second(stage, done, total):
+            if done == 2:
+                raise Stop()
+        self.assertRaises(Stop, ParsedWorkbook, EXAMPLE_ODS, stop_at_second)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from proxyprinter.layouts import LayoutError, compile_layout
+from proxyprinter.proxyprinter import (ProxyPrinter, DEFAULT_LAYOUT,
+                                       SETTING_SHEET_LABEL, compile_card_layout)
+
+
+class LayoutTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.spreadsheet = os.path.join(self.dir, "Spell.csv")
+        with open(self.spreadsheet, "w") as f:
+            f.write("Name,Text,Copies\nBolt,Zap it.,2\nHeal,Mend it.,1\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def render(self, layout, **options):
+        with open(os.path.join(self.dir, "layout.html"), "w") as f:
+            f.write(layout)
+        pp = ProxyPrinter(self.spreadsheet, layouts={"*": "layout.html"},
+                          **options)
+        return pp.render_all()
+
+
+class TestCardNumbers(LayoutTestCase):
+    def test_any_quotes_and_attributes(self):
+        for root in ["<div class='${cardtype_slug} card'>",
+                     '<div class="card ${cardtype_slug}">',
+                     '<section id="c" class = "big card" title=\'x\'>']:
+            html = self.render(root + "${title_area}</div>")
+            self.assertEqual(html.count("data-card='1'"), 2, root)
+            self.assertEqual(html.count("data-card='2'"), 1, root)
+            self.assertNotIn("data-card=''", html)
+
+    def test_inner_card_element(self):
+        html = self.render("<article><p class='cardname'>${title_area}</p>"
+                           "<div class='card'>${textbox}</div></article>")
+        self.assertIn("<div class='card' data-card='2'>", html)
+
+    def test_no_card_root(self):
+        with self.assertRaises(LayoutError):
+            compile_card_layout("<div class='cards'>${title_area}</div>")
+
+    def test_no_card_root_falls_back_to_default(self):
+        with self.assertLogs("proxyprinter.proxyprinter", "WARNING"):
+            html = self.render("<div class='cardlike'>${title_area}</div>")
+        self.assertIn("spell card' data-card='1'", html)
+
+
+class TestCompileLayout(unittest.TestCase):
+    def test_slots(self):
+        render = compile_layout("<p>$name costs $$${text:Cost}</p>",
+                                {"name": lambda card: card["Name"]},
+                                {"text": lambda card, field: card[field]})
+        self.assertEqual(render({"Name": "Bolt", "Cost": "3"}), "<p>Bolt costs $3</p>")
+
+    def test_errors(self):
+        with self.assertRaisesRegex(LayoutError, "Unknown slot in spell.html: nothing"):
+            compile_card_layout("<div class='card'>${nothing}</div>", "spell.html")
+        with self.assertRaisesRegex(LayoutError, "Unknown slot"):
+            compile_card_layout("<div class='card'>${other:Cost}</div>")
+        with self.assertRaisesRegex(LayoutError, "line 2"):
+            compile_card_layout("<div class='card'>\n$ </div>")
+
+
+class TestDeckLayouts(LayoutTestCase):
+    def setUp(self):
+        super().setUp()
+        # A folder deck, so it can have a settings sheet
+        self.spreadsheet = os.path.join(self.dir, "deck")
+        os.mkdir(self.spreadsheet)
+        shutil.move(os.path.join(self.dir, "Spell.csv"), self.spreadsheet)
+        with open(os.path.join(self.spreadsheet, "Creature.csv"), "w") as f:
+            f.write("Name,Power\nRat,1\n")
+
+    def write(self, name, text):
+        # Layout files are found next to the spreadsheet, here the folder
+        with open(os.path.join(self.dir, name), "w") as f:
+            f.write(text)
+
+    def settings(self, *rows):
+        with open(os.path.join(self.spreadsheet, SETTING_SHEET_LABEL + ".csv"), "w") as f:
+            f.write("LayoutCardType,LayoutFile\n" +
+                    "".join("%s,%s\n" % row for row in rows))
+
+    def test_layouts_by_card_type(self):
+        self.write("spell.html", "<div class='card'>Spell: ${title_area}</div>")
+        self.write("other.html", "<div class='card'>Other: ${title_area}</div>")
+        self.settings(("Spell", "spell.html"), ("*", "other.html"))
+        html = ProxyPrinter(self.spreadsheet).render_all()
+        self.assertEqual(html.count("Spell: "), 3)
+        self.assertEqual(html.count("Other: "), 1)
+        cards = html.split(" data-card=")[1:]
+        self.assertEqual(["Rat" in card for card in cards if "Other: " in card], [True])
+
+    def test_argument_overrides_settings(self):
+        self.write("spell.html", "<div class='card'>Spell: ${title_area}</div>")
+        self.write("all.html", "<div class='card'>All: ${title_area}</div>")
+        self.settings(("Spell", "spell.html"), ("*", "spell.html"))
+        html = ProxyPrinter(self.spreadsheet,
+                            layouts={"*": os.path.join(self.dir, "all.html")}).render_all()
+        self.assertEqual(html.count("Spell: "), 3)
+        self.assertEqual(html.count("All: "), 1)
+
+    def test_default_layout_file(self):
+        html = ProxyPrinter(self.spreadsheet).render_all()
+        self.write("default.html", DEFAULT_LAYOUT)
+        self.settings(("*", "default.html"))
+        self.assertEqual(ProxyPrinter(self.spreadsheet).render_all(), html)
+
+    def test_missing_layout_falls_back_to_default(self):
+        html = ProxyPrinter(self.spreadsheet).render_all()
+        self.settings(("Spell", "missing.html"))
+        with self.assertLogs("proxyprinter.proxyprinter", "WARNING"):
+            self.assertEqual(ProxyPrinter(self.spreadsheet).render_all(), html)
+
+    def test_changed_layout_reread(self):
+        self.settings(("*", "layout.html"))
+        self.write("layout.html", "<div class='card'>First ${title_area}</div>")
+        self.assertIn("First", ProxyPrinter(self.spreadsheet).render_all())
+        self.write("layout.html", "<div class='card'>Second version ${title_area}</div>")
+        self.assertIn("Second version", ProxyPrinter(self.spreadsheet).render_all())
+
+    def test_layouts_with_jobs(self):
+        self.write("spell.html", "<div class='card'>Spell: ${title_area}${copyline}</div>")
+        self.settings(("Spell", "spell.html"))
+        html = ProxyPrinter(self.spreadsheet).render_all()
+        self.assertEqual(ProxyPrinter(self.spreadsheet, jobs=2).render_all(), html)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from proxyprinter.odsreader import OdsWorkbook, read_sheet
+from proxyprinter.proxyprinter import ProxyPrinter, SETTING_SHEET_LABEL
+
+try:
+    import pyexcel_ods3
+except ImportError:
+    pyexcel_ods3 = None
+
+CONTENT_START = """<?xml version="1.0" encoding="UTF-8"?>
+<office:document-content xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" xmlns:table="urn:oasis:names:tc:opendocument:xmlns:table:1.0" xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0" office:version="1.2"><office:body><office:spreadsheet>
+"""
+CONTENT_END = "</office:spreadsheet></office:body></office:document-content>\n"
+
+
+def value_cell(value_type, attrs):
+    return ('<table:table-cell office:value-type="%s" %s><text:p>x</text:p>'
+            '</table:table-cell>' % (value_type, attrs))
+
+def string_cell(text, attrs=""):
+    return ('<table:table-cell office:value-type="string"%s><text:p>%s</text:p>'
+            '</table:table-cell>' % (attrs, text))
+
+def table(name, *rows):
+    return ('<table:table table:name="%s">' % name +
+            "".join("<table:table-row%s>%s</table:table-row>" % row
+                    if type(row) == tuple else
+                    "<table:table-row>%s</table:table-row>" % row for row in rows) +
+            "</table:table>")
+
+
+VALUE_TYPES = "".join([
+    value_cell("float", 'office:value="3"'),
+    value_cell("float", 'office:value="3.5"'),
+    value_cell("percentage", 'office:value="0.25"'),
+    value_cell("currency", 'office:value="4" office:currency="USD"'),
+    value_cell("currency", 'office:value="4.5" office:currency="EUR"'),
+    value_cell("date", 'office:date-value="2020-01-31T13:45:10"'),
+    value_cell("time", 'office:time-value="PT13H45M10S"'),
+    value_cell("time", 'office:time-value="PT36H05M00S"'),
+    value_cell("time", 'office:time-value="PT01H02M03.5S"'),
+])
+
+
+class OdsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_ods(self, *tables, name="test.ods"):
+        path = os.path.join(self.dir, name)
+        with zipfile.ZipFile(path, "w") as z:
+            z.writestr("mimetype", "application/vnd.oasis.opendocument.spreadsheet")
+            z.writestr("content.xml", CONTENT_START + "".join(tables) + CONTENT_END)
+        return path
+
+
+class TestOdsReader(OdsTestCase):
+    def read(self, *rows):
+        return read_sheet(self.write_ods(table("Sheet", *rows)), "Sheet")
+
+    def test_values(self):
+        rows = self.read(string_cell("Name") +
+                         '<table:table-cell office:value-type="float" office:value="3">'
+                         '<text:p>3</text:p></table:table-cell>'
+                         '<table:table-cell office:value-type="boolean" office:boolean-value="true"/>'
+                         '<table:table-cell office:value-type="date" office:date-value="2020-01-31"/>')
+        self.assertEqual(rows, [["Name", 3.0, True, datetime.date(2020, 1, 31)]])
+
+    def test_value_types(self):
+        rows = self.read(VALUE_TYPES)
+        self.assertEqual(rows, [[3, 3.5, 0.25, "4 USD", "4.5 EUR",
+                                 datetime.datetime(2020, 1, 31, 13, 45, 10),
+                                 datetime.time(13, 45, 10),
+                                 datetime.timedelta(hours=36, minutes=5),
+                                 datetime.time(1, 2, 3, 500000)]])
+        self.assertIs(type(rows[0][0]), int)
+
+    @unittest.skipIf(pyexcel_ods3 is None, "pyexcel-ods3 is not installed")
+    def test_same_as_pyexcel(self):
+        # Fractional seconds are left out, since pyexcel drops those times
+        path = self.write_ods(table("Sheet", string_cell("Name"),
+                                    VALUE_TYPES.rsplit("<table:table-cell", 1)[0],
+                                    string_cell('a<text:s text:c="2"/>b') +
+                                    string_cell("one</text:p><text:p>two")))
+        expected = pyexcel_ods3.get_data(path)["Sheet"]
+        rows = read_sheet(path, "Sheet")
+        self.assertEqual(rows, expected)
+        self.assertEqual([[type(v) for v in row] for row in rows],
+                         [[type(v) for v in row] for row in expected])
+
+    def test_repeated_columns(self):
+        rows = self.read(string_cell("a", ' table:number-columns-repeated="3"') +
+                         '<table:table-cell table:number-columns-repeated="2"/>' +
+                         string_cell("b"))
+        self.assertEqual(rows, [["a", "a", "a", "", "", "b"]])
+
+    def test_repeated_rows(self):
+        rows = self.read(string_cell("header"),
+                         (' table:number-rows-repeated="2"', string_cell("x")),
+                         (' table:number-rows-repeated="3"', "<table:table-cell/>"),
+                         string_cell("y"))
+        self.assertEqual(rows, [["header"], ["x"], ["x"], [], [], [], ["y"]])
+
+    def test_special_spaces(self):
+        rows = self.read(string_cell('a<text:s/>b<text:s text:c="3"/>c'
+                                     '<text:tab/>d<text:line-break/>e'))
+        self.assertEqual(rows, [["a b   c\td\ne"]])
+
+    def test_spans(self):
+        rows = self.read(string_cell('plain <text:span>styled<text:s/>text</text:span> after'))
+        self.assertEqual(rows, [["plain styled text after"]])
+
+    def test_multiple_paragraphs(self):
+        rows = self.read('<table:table-cell office:value-type="string">'
+                         '<text:p>first</text:p><text:p/><text:p>third</text:p>'
+                         '</table:table-cell>')
+        self.assertEqual(rows, [["first\n\nthird"]])
+
+    def test_covered_cells(self):
+        rows = self.read(string_cell("merged", ' table:number-columns-spanned="2"') +
+                         "<table:covered-table-cell/>" + string_cell("after"))
+        self.assertEqual(rows, [["merged", "", "after"]])
+
+    def test_trailing_empty_cells_and_rows(self):
+        rows = self.read(string_cell("a") +
+                         '<table:table-cell table:number-columns-repeated="1000"/>',
+                         (' table:number-rows-repeated="1048575"',
+                          '<table:table-cell table:number-columns-repeated="1024"/>'))
+        self.assertEqual(rows, [["a"]])
+
+    def test_sheets(self):
+        path = self.write_ods(table("One", string_cell("1")),
+                              table("Two", string_cell("2")))
+        workbook = OdsWorkbook(path)
+        self.assertEqual(workbook.keys(), ["One", "Two"])
+        self.assertEqual(workbook.get("Two"), [["2"]])
+        self.assertIsNone(workbook.get("Three"))
+        self.assertEqual(dict(workbook.to_dict()), {"One": [["1"]], "Two": [["2"]]})
+
+    def test_lookups_reuse_earlier_reads(self):
+        path = self.write_ods(table("One", string_cell("1")),
+                              table("Two", string_cell("2")))
+        workbook = OdsWorkbook(path)
+        self.assertIn("Two", workbook)
+        self.assertNotIn("Three", workbook)
+        # Everything asked for so far is known without the file
+        os.remove(path)
+        self.assertEqual(workbook["Two"], [["2"]])
+        self.assertNotIn("Three", workbook)
+        self.assertIsNone(workbook.get("Three"))
+        self.assertEqual(workbook.keys(), ["One", "Two"])
+
+
+class TestSettingsSheetPosition(OdsTestCase):
+    def test_settings_sheet_anywhere(self):
+        settings = table(SETTING_SHEET_LABEL,
+                         string_cell("Copyright") + string_cell("ProcessPatterns") +
+                         string_cell("ProcessReplacements"),
+                         string_cell("Somebody") + string_cell("Zap") +
+                         string_cell("&lt;b&gt;Zap&lt;/b&gt;"))
+        spells = table("Spell", string_cell("Name") + string_cell("Text"),
+                       string_cell("Bolt") + string_cell("Zap it."))
+        creatures = table("Creature", string_cell("Name") + string_cell("Text"),
+                          string_cell("Rat") + string_cell("Zap back."))
+        first = ProxyPrinter(self.write_ods(settings, spells, creatures, name="first.ods"))
+        middle = ProxyPrinter(self.write_ods(spells, settings, creatures, name="middle.ods"))
+        last = ProxyPrinter(self.write_ods(spells, creatures, settings, name="last.ods"))
+
+        html = first.render_all()
+        self.assertIn("Somebody", html)
+        self.assertIn("<b>Zap</b>", html)
+        self.assertEqual([c.fields["Name"] for c in first.cards], ["Bolt", "Rat"])
+        self.assertEqual(middle.render_all(), html)
+        self.assertEqual(last.render_all(), html)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from proxyprinter import raster
+
+
+@unittest.skipIf(raster.Image is None, "Pillow is not installed")
+class TestNameFont(unittest.TestCase):
+    def setUp(self):
+        self.drawer = raster.FaceDrawer(dpi=300)
+        self.width = self.drawer.px(raster.CARD_WIDTH - 2*raster.BORDER - 0.1)
+
+    def test_short_name_keeps_size(self):
+        size = raster.NAME_SIZES["bigtext"]
+        font = self.drawer.name_font("Short", size, self.width)
+        self.assertIs(font, self.drawer.font("bold", size))
+
+    def test_long_name_keeps_every_word(self):
+        for name in ["The first step to doing anything.",
+                     "The first step to doing anything is believing you can do it"]:
+            font = self.drawer.name_font(name, raster.NAME_SIZES["bigtext"], self.width)
+            lines = self.drawer.wrap(name, font, self.width)
+            self.assertEqual(" ".join(lines), name)
+            self.assertLessEqual(self.drawer.line_height(font)*len(lines),
+                                 self.drawer.px(raster.TITLE_HEIGHT))
+
+
+if __name__ == "__main__":
+    unittest.main()
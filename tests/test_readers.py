@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from xml.sax.saxutils import escape
+
+from proxyprinter.proxyprinter import ProxyPrinter, SETTING_SHEET_LABEL
+from proxyprinter.readers import read_workbook
+
+#In name order, as a folder's files are read
+SHEETS = [
+    ("Creature", [["Name", "Power", "Traits"],
+                  ["Rat", "1", "Small, Vermin"]]),
+    (SETTING_SHEET_LABEL, [["Copyright", "ProcessPatterns", "ProcessReplacements"],
+                           ["Somebody", "Zap", "<b>Zap</b>"]]),
+    ("Spell", [["Name", "Text", "Cost"],
+               ["Bolt", "Zap it, then \"rest\".", "3"],
+               ["Heal", "", "2"],
+               ["Ward"]]),
+]
+
+CONTENT_START = """<?xml version="1.0" encoding="UTF-8"?>
+<office:document-content xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" xmlns:table="urn:oasis:names:tc:opendocument:xmlns:table:1.0" xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0" office:version="1.2"><office:body><office:spreadsheet>
+"""
+CONTENT_END = "</office:spreadsheet></office:body></office:document-content>\n"
+
+
+def ods_cell(value):
+    if value.isdigit():
+        return ('<table:table-cell office:value-type="float" office:value="%s">'
+                '<text:p>%s</text:p></table:table-cell>' % (value, value))
+    if not value:
+        return "<table:table-cell/>"
+    return ('<table:table-cell office:value-type="string"><text:p>%s</text:p>'
+            '</table:table-cell>' % escape(value))
+
+def ods_table(name, rows):
+    return ('<table:table table:name="%s">' % escape(name) +
+            "".join("<table:table-row>%s</table:table-row>" % "".join(map(ods_cell, row))
+                    for row in rows) +
+            "</table:table>")
+
+
+class TestReaders(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def path(self, *names):
+        return os.path.join(self.dir, *names)
+
+    def write_ods(self):
+        path = self.path("deck.ods")
+        with zipfile.ZipFile(path, "w") as z:
+            z.writestr("mimetype", "application/vnd.oasis.opendocument.spreadsheet")
+            z.writestr("content.xml", CONTENT_START +
+                       "".join(ods_table(name, rows) for name, rows in SHEETS) +
+                       CONTENT_END)
+        return path
+
+    def write_delimited(self, path, rows, delimiter):
+        lines = []
+        for row in rows:
+            cells = ['"%s"' % v.replace('"', '""') if delimiter in v or '"' in v else v
+                     for v in row]
+            lines.append(delimiter.join(cells))
+        # Spreadsheet programs often start CSV files with a byte order mark
+        with open(path, "w", encoding="utf-8-sig", newline="") as f:
+            f.write("\r\n".join(lines) + "\r\n")
+
+    def write_folder(self):
+        folder = self.path("deck")
+        os.mkdir(folder)
+        extensions = {"Spell": ".csv", "Creature": ".tsv", SETTING_SHEET_LABEL: ".csv"}
+        for name, rows in SHEETS:
+            # Pad rows to the header, as a spreadsheet program saves them
+            rows = [row + [""]*(len(rows[0])-len(row)) for row in rows]
+            ext = extensions[name]
+            self.write_delimited(os.path.join(folder, name+ext), rows,
+                                 "," if ext == ".csv" else "\t")
+        return folder
+
+    def write_jsonl(self):
+        path = self.path("deck.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for name, rows in SHEETS:
+                for row in rows[1:]:
+                    item = {"_sheet": name}
+                    item.update(zip(rows[0], row))
+                    f.write(json.dumps(item) + "\n")
+        return path
+
+    def as_text(self, workbook):
+        return [(name, [[str(v) for v in row] for row in rows])
+                for name, rows in workbook.items()]
+
+    def test_same_rows(self):
+        expected = self.as_text(read_workbook(self.write_ods()))
+        self.assertEqual(expected, SHEETS)
+        self.assertEqual(self.as_text(read_workbook(self.write_folder())), expected)
+        self.assertEqual(self.as_text(read_workbook(self.write_jsonl())), expected)
+
+    def test_same_output(self):
+        html = ProxyPrinter(self.write_ods()).render_all()
+        self.assertIn("Somebody", html)
+        self.assertIn("<b>Zap</b>", html)
+        for path in [self.write_folder(), self.write_jsonl()]:
+            self.assertEqual(ProxyPrinter(path).render_all(), html, path)
+
+    def test_jsonl_arrays(self):
+        path = self.path("Spell.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write('["Name", "Text"]\n\n["Bolt", "Zap it.", ""]\n')
+        self.assertEqual(dict(read_workbook(path)),
+                         {"Spell": [["Name", "Text"], ["Bolt", "Zap it."]]})
+
+    def test_unsupported_format(self):
+        path = self.path("deck.xlsx")
+        open(path, "w").close()
+        self.assertRaises(ValueError, read_workbook, path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import contextlib
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from proxyprinter.proxyprinter import ProxyPrinter, main
+
+EXAMPLE_ODS = os.path.join(os.path.dirname(__file__), os.pardir, "example-cards.ods")
+
+
+class Stop(Exception):
+    pass
+
+
+class TestStreaming(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pp = ProxyPrinter(EXAMPLE_ODS)
+        cls.html = cls.pp.render_all()
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_render_iter_pieces(self):
+        pieces = list(self.pp.render_iter())
+        self.assertEqual("".join(pieces), self.html)
+        # The head, then a piece per card, then the footer
+        self.assertEqual(len(pieces), len(self.pp.cards)+2)
+        self.assertTrue(pieces[0].endswith("<body>"))
+        self.assertTrue(pieces[-1].endswith("</body></html>"))
+        self.assertIn("data-card='1'", pieces[1])
+
+    def test_render_to_small_buffer(self):
+        for buffer_size in [1, 1000, 10**9]:
+            f = io.StringIO()
+            self.pp.render_to(f, buffer_size=buffer_size)
+            self.assertEqual(f.getvalue(), self.html, buffer_size)
+
+    def test_render_file_gzip(self):
+        path = os.path.join(self.dir, "deck.html")
+        self.pp.render_file(path, compress=True)
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            self.assertEqual(f.read(), self.html)
+        self.assertEqual(os.listdir(self.dir), ["deck.html"])
+
+    def test_failed_render_keeps_old_file(self):
+        path = os.path.join(self.dir, "deck.html")
+        with open(path, "w") as f:
+            f.write("old")
+        def fail(stage, done, total):
+            if stage == "cards":
+                raise Stop()
+        pp = ProxyPrinter(EXAMPLE_ODS, progress=fail)
+        self.assertRaises(Stop, pp.render_file, path)
+        with open(path) as f:
+            self.assertEqual(f.read(), "old")
+        self.assertEqual(os.listdir(self.dir), ["deck.html"])
+
+    def test_output_option(self):
+        for name in ["deck.html", "deck.html.gz"]:
+            path = os.path.join(self.dir, name)
+            main([EXAMPLE_ODS, "--output", path])
+            opener = gzip.open if name.endswith(".gz") else open
+            with opener(path, "rt", encoding="utf-8") as f:
+                self.assertEqual(f.read(), self.html)
+
+    def test_stdout(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            main([EXAMPLE_ODS])
+        self.assertEqual(out.getvalue(), self.html+"\n")
+
+
+class TestJobs(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_same_as_serial(self):
+        html = ProxyPrinter(EXAMPLE_ODS).render_all()
+        for jobs in [2, 3]:
+            self.assertEqual(ProxyPrinter(EXAMPLE_ODS, jobs=jobs).render_all(),
+                             html, jobs)
+
+    def test_with_fragment_cache(self):
+        html = ProxyPrinter(EXAMPLE_ODS).render_all()
+        cache_dir = os.path.join(self.dir, "cache")
+        # Fill the cache with some of the cards, then render the rest elsewhere
+        pp = ProxyPrinter(EXAMPLE_ODS, cache_dir=cache_dir)
+        pp.start_render()
+        for c in pp.cards[::2]:
+            pp.card_html(c)
+        pp = ProxyPrinter(EXAMPLE_ODS, cache_dir=cache_dir, jobs=2)
+        self.assertEqual(pp.render_all(), html)
+        stats = pp.fragment_cache.stats()
+        self.assertEqual(stats["hits"], len(pp.cards[::2]))
+        self.assertEqual(stats["misses"], len(pp.cards[1::2]))
+        self.assertEqual(ProxyPrinter(EXAMPLE_ODS, cache_dir=cache_dir,
+                                      jobs=2).render_all(), html)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import http.client
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from urllib.parse import urlencode
+
+from proxyprinter.proxyprinter import ProxyPrinter, ParsedWorkbook
+from proxyprinter.server import DeckStore, RenderServer
+
+
+class TestRenderServer(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.dir, "root")
+        os.mkdir(self.root)
+        self.spreadsheet = os.path.join(self.root, "Spell.csv")
+        self.write("Name,Text\nBolt,Zap it.\n")
+        with open(os.path.join(self.dir, "Secret.csv"), "w") as f:
+            f.write("Name,Text\nSecret,Keep out.\n")
+
+        self.loads = []
+        def load(path):
+            self.loads.append(path)
+            return ProxyPrinter(ParsedWorkbook(path))
+        self.server = RenderServer(("localhost", 0), DeckStore(load), self.root,
+                                   workers=2)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        shutil.rmtree(self.dir)
+
+    def write(self, text):
+        with open(self.spreadsheet, "w") as f:
+            f.write(text)
+
+    def get(self, endpoint, headers={}, **query):
+        conn = http.client.HTTPConnection("localhost", self.server.server_address[1])
+        try:
+            conn.request("GET", endpoint + "?" + urlencode(query), headers=headers)
+            response = conn.getresponse()
+            return response.status, response.getheader("ETag"), response.read().decode("utf-8")
+        finally:
+            conn.close()
+
+    def test_paths_outside_root(self):
+        os.symlink(os.path.join(self.dir, "Secret.csv"),
+                   os.path.join(self.root, "Link.csv"))
+        for path in ["../Secret.csv", os.path.join(self.dir, "Secret.csv"),
+                     "sub/../../Secret.csv", "Link.csv"]:
+            status, etag, body = self.get("/deck", path=path)
+            self.assertEqual(status, 403, path)
+            self.assertNotIn("Keep out", body)
+        self.assertEqual(self.loads, [])
+
+    def test_bad_requests(self):
+        self.assertEqual(self.get("/deck")[0], 400)
+        self.assertEqual(self.get("/deck", path="Missing.csv")[0], 404)
+        self.assertEqual(self.get("/nothing", path="Spell.csv")[0], 404)
+        self.assertEqual(self.get("/card", path="Spell.csv", sheet="Spell", row="x")[0], 400)
+        self.assertEqual(self.get("/card", path="Spell.csv", sheet="Spell", row="1")[0], 400)
+        self.assertEqual(self.get("/card", path="Spell.csv", sheet="Spell", row="3")[0], 404)
+        self.assertEqual(self.get("/card", path="Spell.csv", sheet="Other", row="2")[0], 404)
+
+    def test_deck_and_card(self):
+        status, etag, body = self.get("/deck", path="Spell.csv")
+        self.assertEqual(status, 200)
+        self.assertEqual(body, ProxyPrinter(self.spreadsheet).render_all())
+        status, etag, body = self.get("/card", path="Spell.csv", sheet="Spell", row="2")
+        self.assertEqual(status, 200)
+        self.assertIn("Zap it.", body)
+        self.assertEqual(self.loads, [self.spreadsheet])
+
+    def test_etags(self):
+        status, etag, body = self.get("/deck", path="Spell.csv")
+        self.assertEqual(self.get("/deck", {"If-None-Match": etag}, path="Spell.csv"),
+                         (304, etag, ""))
+        self.assertNotEqual(self.get("/tts.json", path="Spell.csv")[1], etag)
+
+        self.write("Name,Text\nBolt,Zap it twice.\n")
+        status, new_etag, body = self.get("/deck", {"If-None-Match": etag}, path="Spell.csv")
+        self.assertEqual(status, 200)
+        self.assertNotEqual(new_etag, etag)
+        self.assertIn("Zap it twice.", body)
+        self.assertEqual(len(self.loads), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
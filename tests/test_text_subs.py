@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import re
+import unittest
+
+from proxyprinter.proxyprinter import TextSubstituter
+
+
+def sequential(text_subs, text):
+    for pattern, repl in text_subs.items():
+        text = re.sub(pattern, repl, text)
+    return text
+
+
+class TestTextSubstituter(unittest.TestCase):
+    def assertSameAsSequential(self, text_subs, *texts):
+        subst = TextSubstituter(text_subs)
+        for text in texts:
+            self.assertEqual(subst.sub(text), sequential(text_subs, text), text)
+        return subst
+
+    def test_chained_on_replacement(self):
+        subs = {r"\bATK\b": "Attack", r"Attack (\d+)": r"<b>Attack \1</b>"}
+        subst = self.assertSameAsSequential(subs, "ATK 3", "Attack 2, ATK 1")
+        self.assertEqual(subst.sub("ATK 3"), "<b>Attack 3</b>")
+
+    def test_chained_on_group_reference(self):
+        subs = {r"Draw (\d)": r"Draw \1 card", r"(\d) cards?": r"\1 <i>cards</i>"}
+        self.assertSameAsSequential(subs, "Draw 2", "Draw 1 card", "Discard 3 cards")
+
+    def test_chained_on_surrounding_text(self):
+        subs = {"cat": "dog", r"\w+s": "[pets]"}
+        self.assertSameAsSequential(subs, "cats", "a cat and dogs", "catcats")
+
+    def test_chained_on_lookarounds(self):
+        self.assertSameAsSequential({"Hero": "Villain", r"(?<=Villain) wins": " loses"},
+                                    "Hero wins", "Villain wins")
+        self.assertSameAsSequential({"Hero": "Villain", r"The (?=Villain)": "A "},
+                                    "The Hero", "The Villain")
+
+    def test_chained_on_word_boundary(self):
+        subs = {"x": " ", r"\bdog\b": "cat"}
+        self.assertSameAsSequential(subs, "dogx", "xdogx", "dog")
+
+    def test_chained_on_emptied_text(self):
+        subs = {"-": "", r"\bfirst\b": "1st"}
+        self.assertSameAsSequential(subs, "fir-st", "first-")
+
+    def test_overlapping_literals(self):
+        self.assertSameAsSequential({"ab": "X", "bc": "Y"}, "abc", "bcab")
+        self.assertSameAsSequential({"bc": "Y", "abcd": "Z"}, "abcd")
+
+    def test_independent_keywords_combined(self):
+        subs = {r"\bAttack\b": "<span class='keyword'>Attack</span>",
+                r"\bDefend\b": "<span class='keyword'>Defend</span>",
+                r"\{T\}": "<img alt='Tap' />"}
+        subst = self.assertSameAsSequential(subs, "Attack, then Defend. {T}: Attacks.")
+        self.assertEqual(len(subst.passes), 1)
+
+    def test_keyword_matching_earlier_replacement(self):
+        subs = {r"\bAttack\b": "<span class='keyword'>Attack</span>",
+                r"\bspan\b": "SPAN"}
+        subst = self.assertSameAsSequential(subs, "Attack the span")
+        self.assertEqual(len(subst.passes), 2)
+
+    def test_capturing_patterns_combined(self):
+        subs = {r"&lt;([0-9]+) W&gt;": r"<span class='mana W'>\1</span>",
+                r"&lt;([0-9]+) U&gt;": r"<span class='mana U'>\1</span>",
+                r"\bFlying\b": "<span class='keyword'>Flying</span>"}
+        subst = self.assertSameAsSequential(
+            subs, "&lt;2 W&gt;&lt;10 U&gt;: Flying", "&lt;W&gt; &lt;3 U&gt;")
+        self.assertEqual(len(subst.passes), 1)
+
+    def test_capturing_pattern_matching_earlier_replacement(self):
+        subs = {r"&lt;([0-9]+) W&gt;": r"<span class='mana'>\1</span>",
+                r"<span class='(\w+)'>": r"<span class='big \1'>"}
+        subst = self.assertSameAsSequential(subs, "&lt;2 W&gt;")
+        self.assertEqual(len(subst.passes), 2)
+
+    def test_repeats_and_alternation(self):
+        subst = self.assertSameAsSequential({r"(a|b)+c": r"<\1>", r"[0-9]{2,}": "#"},
+                                            "abc12", "ba3c", "c<a>99")
+        self.assertEqual(len(subst.passes), 1)
+        # The second pattern can match "c" from the first replacement
+        subst = self.assertSameAsSequential({r"(a|b)+": r"\1c", r"c\d": "D"},
+                                            "ab1", "c1", "bb2")
+        self.assertEqual(len(subst.passes), 2)
+
+    def test_clashing_group_names(self):
+        subs = {r"(?P<n>[0-9]+) W": r"\g<n>w", r"(?P<n>[0-9]+) U": r"\g<n>u"}
+        subst = self.assertSameAsSequential(subs, "1 W 2 U")
+        self.assertEqual(len(subst.passes), 2)
+        subs = {r"(?P<_sub1>a)": "x", "b": "y"}
+        self.assertSameAsSequential(subs, "ab")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import contextlib
+import http.client
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from proxyprinter import watch
+from proxyprinter.watch import (LiveReloadServer, RELOAD_CODE, RELOAD_PATH,
+                                add_reload_script, file_state)
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+class WatchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, text):
+        path = os.path.join(self.dir, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+
+class TestFileState(WatchTestCase):
+    def test_changes(self):
+        path = self.write("deck.csv", "Name\n")
+        state = file_state(path)
+        self.assertEqual(file_state(path), state)
+        self.write("deck.csv", "Name\nBolt\n")
+        self.assertNotEqual(file_state(path), state)
+        os.remove(path)
+        self.assertIsNone(file_state(path))
+
+    def test_folder(self):
+        state = file_state(self.dir)
+        path = self.write("Spell.csv", "Name\n")
+        self.assertNotEqual(file_state(self.dir), state)
+        state = file_state(self.dir)
+        self.write("Spell.csv", "Name\nBolt\n")
+        self.assertNotEqual(file_state(self.dir), state)
+
+
+class TestReloadScript(unittest.TestCase):
+    def test_before_body_end(self):
+        self.assertEqual(add_reload_script("<body>x</body></html>"),
+                         "<body>x" + RELOAD_CODE + "</body></html>")
+        self.assertEqual(add_reload_script("x"), "x" + RELOAD_CODE)
+
+
+class TestLiveReloadServer(WatchTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = LiveReloadServer(("localhost", 0), self.dir)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        super().tearDown()
+
+    def connect(self):
+        return http.client.HTTPConnection("localhost", self.server.server_address[1],
+                                          timeout=10)
+
+    def get(self, path):
+        conn = self.connect()
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            return response.status, response.read().decode("utf-8")
+        finally:
+            conn.close()
+
+    def test_page_and_files(self):
+        self.server.publish("<html><body>Bolt</body></html>")
+        self.assertEqual(self.get("/"),
+                         (200, "<html><body>Bolt" + RELOAD_CODE + "</body></html>"))
+        self.write("custom.css", ".card {}")
+        self.assertEqual(self.get("/custom.css"), (200, ".card {}"))
+
+    def test_reload_events(self):
+        conn = self.connect()
+        try:
+            conn.request("GET", RELOAD_PATH)
+            response = conn.getresponse()
+            self.assertEqual(response.getheader("Content-Type"), "text/event-stream")
+            self.server.reload()
+            self.assertEqual(response.readline(), b"data: reload\n")
+            self.server.publish("<html><body>Heal</body></html>")
+            response.readline()
+            self.assertEqual(response.readline(), b"data: reload\n")
+        finally:
+            conn.close()
+
+
+class TestWatch(WatchTestCase):
+    def setUp(self):
+        super().setUp()
+        self.poll_interval = watch.POLL_INTERVAL
+        watch.POLL_INTERVAL = 0.01
+        self.spreadsheet = self.write("deck.csv", "Name\nBolt\n")
+        self.css = self.write("deck.css", ".card {}")
+        self.builds = []
+
+    def tearDown(self):
+        watch.POLL_INTERVAL = self.poll_interval
+        super().tearDown()
+
+    def build(self):
+        """Stand-in build; stops watching on its last build"""
+        self.builds.append(None)
+        if len(self.builds) == self.last_build:
+            raise KeyboardInterrupt()
+        if len(self.builds) == self.failed_build:
+            raise ValueError("bad spreadsheet")
+        return ("<html><body>%d</body></html>" % len(self.builds),
+                [self.spreadsheet, self.css], [self.css], 1)
+
+    def start(self, last_build, failed_build=None):
+        self.last_build = last_build
+        self.failed_build = failed_build
+        stderr = io.StringIO()
+        def run():
+            with contextlib.redirect_stderr(stderr):
+                watch.watch(self.build, sources=[self.spreadsheet], port=0,
+                            directory=self.dir, open_browser=False)
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        wait_until(lambda: self.builds)
+        return thread, stderr
+
+    def test_rebuilds_on_change(self):
+        thread, stderr = self.start(last_build=3)
+        self.write("deck.csv", "Name\nBolt\nHeal\n")
+        wait_until(lambda: len(self.builds) == 2)
+        self.write("deck.csv", "Name\nBolt\nHeal\nWard\n")
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(self.builds), 3)
+
+    def test_css_change_only_reloads(self):
+        thread, stderr = self.start(last_build=2)
+        self.write("deck.css", ".card {color: red;}")
+        wait_until(lambda: "reloading" in stderr.getvalue())
+        self.assertEqual(len(self.builds), 1)
+        self.write("deck.csv", "Name\nBolt\nHeal\n")
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+
+    def test_failed_build_watches_sources(self):
+        thread, stderr = self.start(last_build=2, failed_build=1)
+        self.assertIn("bad spreadsheet", stderr.getvalue())
+        self.write("deck.csv", "Name\nBolt\nHeal\n")
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(len(self.builds), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()